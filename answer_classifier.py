@@ -0,0 +1,217 @@
+import re
+import math
+from collections import Counter
+
+# Single words / phrases that on their own answer a yes-no question. Words which also start ordinary details
+# ("fine dining", "it is Krakow", "next friday", "right by the station") are only listed inside longer phrases
+YES_PHRASES = {
+    'yes', 'yeah', 'yea', 'yep', 'yup', 'sure', 'ok', 'okay', 'correct', 'exactly', 'absolutely',
+    'definitely', 'certainly', 'indeed', 'perfect', 'affirmative', 'alright',
+    'of course', 'sounds good', 'sounds great', 'sounds fine', 'that is right', 'that is correct',
+    'that is fine', 'that is great', 'you are right', 'it is correct', 'go ahead', 'book it',
+    'please do', 'why not', 'no problem', 'all right', 'let us do it', 'i do', 'that is it', 'not bad',
+}
+NO_PHRASES = {
+    'no', 'nope', 'nah', 'nay', 'wrong', 'incorrect', 'negative', 'never',
+    'not really', 'no thanks', 'no thank you', 'something else', 'different one', 'another one', 'not at all',
+    'i do not', 'it is not', 'that is wrong', 'not quite', 'not right', 'skip',
+}
+NEGATIONS = {'not', 'never', 'hardly'}
+# Uncertain replies, neither yes nor no ("I don't know" must not count as the NO phrase "i do not")
+HEDGES = {
+    'not sure', 'do not know', 'maybe', 'perhaps', 'possibly', 'probably', 'i guess', 'no idea', 'unsure',
+    'not certain', 'might', 'depends', 'i suppose', 'who knows', 'hard to say',
+}
+
+# Words which don't change the meaning of a short answer
+FILLERS = {
+    'a', 'the', 'it', 'is', 'that', 'this', 'thats', 'i', 'me', 'my', 'please', 'thanks', 'thank', 'you',
+    'so', 'well', 'oh', 'uh', 'um', 'hmm', 'one', 'very', 'much', 'totally', 'sir', 'and', 'sounds',
+}
+
+# Seed examples for the optional nearest-neighbour tier
+SEED_EXAMPLES = [
+    ("yes please", True), ("yeah that's it", True), ("sure thing", True), ("sounds great", True),
+    ("that works for me", True), ("let's go with that", True), ("you got it", True), ("yes you are right", True),
+    ("that one is good", True), ("i'd like that", True), ("i agree", True), ("go for it", True),
+    ("no thanks", False), ("that's not it", False), ("not this one", False), ("i don't think so", False),
+    ("that's wrong", False), ("show me another", False), ("no you misheard", False), ("i'd rather not", False),
+    ("not what i said", False), ("i disagree", False), ("nope not that", False), ("give me something else", False),
+]
+
+CONTRACTIONS = [
+    (r"n't\b", ' not'), (r"'s\b", ' is'), (r"'re\b", ' are'), (r"'m\b", ' am'), (r"'d\b", ' would'),
+    (r"'ll\b", ' will'),
+]
+
+
+def tokenize(text):
+    """
+    Lowercase, expand contractions and split into words
+    :param text: User reply
+    :return: List of words
+    """
+    text = text.lower().replace('’', "'")
+    text = re.sub(r"\blet's\b", 'let us', text)
+    text = re.sub(r"\bwon't\b", 'will not', text)
+    text = re.sub(r"\bcan't\b", 'can not', text)
+    for pattern, replacement in CONTRACTIONS:
+        text = re.sub(pattern, replacement, text)
+    return re.findall(r"[a-z]+", text)
+
+
+def _char_ngrams(text, n=3):
+    text = f' {" ".join(tokenize(text))} '
+    return Counter(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+class AnswerClassifier:
+    def __init__(self, threshold=0.85, examples=SEED_EXAMPLES, embed=None, k=3):
+        """
+        Local yes/no classifier run before the LLM.
+        Tier 1: phrase lexicon with negation rules.
+        Tier 2 (optional): nearest neighbours over labelled examples, on character trigrams
+        or on vectors from an external embedding function.
+        :param threshold: Min confidence for an answer to be trusted without the LLM
+        :param examples: Labelled (text, is_yes) examples for the nearest-neighbour tier, None disables the tier
+        :param embed: Optional function text -> vector (list of floats), replaces character trigrams
+        :param k: Number of neighbours voting
+        """
+        self.threshold = threshold
+        self.embed = embed
+        self.k = k
+
+        self.examples = []
+        for text, label in examples or []:
+            vector = self._vectorize(text)
+            self.examples.append((vector, self._norm(vector), label))
+
+        self.max_phrase_len = max(len(p.split()) for p in YES_PHRASES | NO_PHRASES)
+
+    def _vectorize(self, text):
+        if self.embed is not None:
+            return dict(enumerate(self.embed(text)))
+        return _char_ngrams(text)
+
+    @staticmethod
+    def _norm(vector):
+        return math.sqrt(sum(v * v for v in vector.values())) or 1.0
+
+    def _match_phrases(self, words):
+        """Greedy longest-match of lexicon phrases. Returns list of (polarity, start, end)"""
+        matches = []
+        i = 0
+        while i < len(words):
+            for length in range(min(self.max_phrase_len, len(words) - i), 0, -1):
+                phrase = ' '.join(words[i:i + length])
+                if phrase in YES_PHRASES:
+                    matches.append((True, i, i + length))
+                    break
+                if phrase in NO_PHRASES:
+                    matches.append((False, i, i + length))
+                    break
+            else:
+                i += 1
+                continue
+            i = matches[-1][2]
+        return matches
+
+    @staticmethod
+    def _is_hedge(words):
+        joined = f' {" ".join(words)} '
+        return any(f' {hedge} ' in joined for hedge in HEDGES)
+
+    def classify_rules(self, text):
+        """
+        Lexicon and negation rules
+        :param text: User reply
+        :return: (answer, confidence), answer is None if rules can't decide (or the reply is a hedge)
+        """
+        words = tokenize(text)
+        if not words:
+            return None, 0.0
+
+        if self._is_hedge(words):
+            return None, 0.0
+
+        matches = self._match_phrases(words)
+        if not matches:
+            return None, 0.0
+
+        votes = []
+        for polarity, start, end in matches:
+            # "not correct", "is not right", "absolutely not" -> the negation flips a positive phrase
+            window = words[max(0, start - 2):start]
+            if words[end:] == ['not']:
+                window.append('not')
+            if polarity and any(w in NEGATIONS for w in window):
+                polarity = False
+            votes.append(polarity)
+
+        if len(set(votes)) > 1:
+            # "no, that's right" - mixed signals, leave it to the LLM
+            return None, 0.5
+
+        # Words of the matched phrases, plus fillers and negations outside of them
+        matched = {idx for _, start, end in matches for idx in range(start, end)}
+        covered = len(matched) + sum(1 for idx, w in enumerate(words)
+                                     if idx not in matched and (w in FILLERS or w in NEGATIONS))
+        coverage = min(1.0, covered / len(words))
+
+        confidence = 0.7 + 0.3 * coverage
+        # Short replies starting with the answer ("yes, Krakow") are reliable, longer ones
+        # ("yes but make it six people") only as far as the lexicon covers them
+        if matches[0][1] == 0 and len(words) <= 3:
+            confidence = max(confidence, 0.9)
+
+        return votes[0], round(confidence, 3)
+
+    def classify_neighbours(self, text):
+        """
+        k nearest neighbours by cosine similarity
+        :param text: User reply
+        :return: (answer, confidence)
+        """
+        if not self.examples:
+            return None, 0.0
+
+        vector = self._vectorize(text)
+        norm = self._norm(vector)
+
+        similarities = []
+        for example, example_norm, label in self.examples:
+            dot = sum(value * example.get(key, 0) for key, value in vector.items())
+            similarities.append((dot / (norm * example_norm), label))
+
+        top = sorted(similarities, reverse=True)[:self.k]
+        yes_score = sum(s for s, label in top if label)
+        no_score = sum(s for s, label in top if not label)
+        total = yes_score + no_score
+
+        if total == 0:
+            return None, 0.0
+
+        answer = yes_score > no_score
+        # agreement between neighbours scaled by how close the best neighbour is
+        confidence = max(yes_score, no_score) / total * top[0][0]
+        return answer, round(confidence, 3)
+
+    def classify(self, text):
+        """
+        Run the local tiers
+        :param text: User reply
+        :return: (answer, confidence) - answer True (yes), False (no) or None (unknown)
+        """
+        if self._is_hedge(tokenize(text)):
+            # Uncertain - the neighbours would still pick the closer side
+            return None, 0.0
+
+        answer, confidence = self.classify_rules(text)
+        if answer is not None and confidence >= self.threshold:
+            return answer, confidence
+
+        nn_answer, nn_confidence = self.classify_neighbours(text)
+        if nn_answer is not None and nn_confidence > confidence:
+            return nn_answer, nn_confidence
+
+        return answer, confidence
@@ -1,29 +1,158 @@
 import os
+import time
 import random
 import json
-from openai import OpenAI
+import threading
+from pydantic import ValidationError
+
+import tracing
+
+from answer_classifier import AnswerClassifier
+from slot_extractor import SlotExtractor
+from nlu_schema import TurnAnalysis, ExtractedInfo, AnswerType, turn_analysis_format
+from llm_cache import memoized
+from prompt_budget import PromptBudget, truncate_tokens
 
 # https://platform.openai.com/docs/api-reference/chat/create
 API_KEY = os.environ.get('OPENAI_KEY')
 
+# Bump when the prompt template changes, memoized responses of older versions are not reused
+API_QUERY_TEMPLATE_VERSION = 1
+SUGGESTION_TEMPLATE_VERSION = 2
+PICK_SUMMARY_TEMPLATE_VERSION = 1
+
 class Assistant:
-    def __init__(self, intents, intent_categories, model="gpt-4o-mini"):
-        self.client = OpenAI(api_key=API_KEY)
+    def __init__(self, intents, intent_categories, model="gpt-4o-mini", local_answer_threshold=0.85,
+                 local_slots=True, api_key=API_KEY, base_url=None, llm_cache=None,
+                 memoize=('api_query', 'restaurant_suggestion', 'pick_summaries'), suggestion_budget=1500):
+        # OpenAI clients are created on first use (see client, async_client), importing openai takes a while
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None
+        self._async_client = None
         self.model = model
         self.intents = intents
         self.intent_categories = intent_categories
 
         self.last_question_type = None
 
-    def recognize_answer_type(self, query, max_retries=3):
+        # Local yes/no tier in front of the LLM, threshold None sends every answer to the API
+        self.answer_classifier = None
+        if local_answer_threshold is not None:
+            self.answer_classifier = AnswerClassifier(threshold=local_answer_threshold)
+        self.answer_type_stats = {'local': 0, 'llm': 0}
+        # The counters below are shared by every session, updated from the event loop and the executor threads
+        self._stats_lock = threading.Lock()
+
+        # Rule based slot filling tried before recognize_intent calls the LLM
+        self.slot_extractor = SlotExtractor() if local_slots else None
+        self.intent_stats = {'local_turns': 0, 'llm_turns': 0, 'latency_saved': 0.0}  # all sessions
+        self.llm_intent_latency = None  # running average of LLM intent calls, for the saved latency estimate
+
+        # Optional LLMCache for the methods named in memoize (pure functions of their inputs)
+        self.llm_cache = llm_cache
+        self.memoize = set(memoize)
+
+        # Tokens of the restaurant list in the suggestion prompt, reviews are ranked and cut to fit
+        self.prompt_budget = PromptBudget(max_tokens=suggestion_budget, model=model)
+        self.token_usage = {}  # label -> {'calls', 'prompt_tokens', 'completion_tokens'}
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+
+            self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self._client
+
+    @property
+    def async_client(self):
         """
-        Recognize if what user said is confirmation (Yes) or (No)
-        :param query: User input
-        :param max_retries: Maximum number of retries of chat completion
-        :return: Bool
+        Used by the a* methods of the asyncio dialog engine, they don't touch last_question_type,
+        so one Assistant can serve many concurrent sessions
         """
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+
+            self._async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self._async_client
+
+    def warm_up(self):
+        """Import openai and create both clients ahead of the first call"""
+        return self.client, self.async_client
+
+    def _record_usage(self, label, usage):
+        """Log and sum up the tokens of a labelled call, the tokens of every call go to its trace span"""
+        if usage is None:
+            return
+        tracing.annotate(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+        if label is None:
+            return
+
+        with self._stats_lock:
+            totals = self.token_usage.setdefault(label, {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0})
+            totals['calls'] += 1
+            totals['prompt_tokens'] += usage.prompt_tokens
+            totals['completion_tokens'] += usage.completion_tokens
+        print(f'SYSTEM: {label} call used {usage.prompt_tokens} prompt + {usage.completion_tokens} completion tokens')
+
+    def _complete(self, prompt, response_format='json_object', label=None) -> str:
+        """
+        :param prompt: User message
+        :param response_format: 'json_object', 'text' or a full response_format dictionary (json_schema)
+        :param label: Log the token usage of the call under this name (see token_usage)
+        """
+        if isinstance(response_format, str):
+            response_format = {"type": response_format}
+
+        with tracing.span('llm.completion', label=label):
+            # Raw response: the number of HTTP retries made by the client goes to the trace
+            raw = self.client.chat.completions.with_raw_response.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                response_format=response_format
+            )
+            response = raw.parse()
+            tracing.annotate(retries=raw.retries_taken)
+            self._record_usage(label, response.usage)
+        return response.choices[0].message.content
+
+    async def _acomplete(self, prompt, response_format='json_object', label=None) -> str:
+        if isinstance(response_format, str):
+            response_format = {"type": response_format}
+
+        with tracing.span('llm.completion', label=label):
+            raw = await self.async_client.chat.completions.with_raw_response.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                response_format=response_format
+            )
+            response = raw.parse()
+            tracing.annotate(retries=raw.retries_taken)
+            self._record_usage(label, response.usage)
+        return response.choices[0].message.content
+
+    def _local_answer_type(self, query):
+        """Answer of the local yes/no tier, None if it is not confident enough"""
         assert query is not None
-        prompt = f"""
+
+        if self.answer_classifier is not None:
+            answer, confidence = self.answer_classifier.classify(query)
+            if answer is not None and confidence >= self.answer_classifier.threshold:
+                self._count_answer_type('local')
+                return answer
+
+        self._count_answer_type('llm')
+        return None
+
+    def _count_answer_type(self, tier):
+        with self._stats_lock:
+            self.answer_type_stats[tier] += 1
+        tracing.annotate(tier=tier)
+
+    @staticmethod
+    def _answer_type_prompt(query):
+        return f"""
             Your task is to recognize if the sentence means "YES" or "NO".
             For example:
             "yes, sure", "yeah", "its correct" - it is "YES"
@@ -36,96 +165,249 @@ class Assistant:
             JSON response: 
         """
 
+    @tracing.traced('nlu.recognize_answer_type')
+    def recognize_answer_type(self, query, max_retries=3):
+        """
+        Recognize if what user said is confirmation (Yes) or (No)
+        :param query: User input
+        :param max_retries: Maximum number of retries of chat completion
+        :return: Bool
+        """
+        answer = self._local_answer_type(query)
+        if answer is not None:
+            return answer
+
+        prompt = self._answer_type_prompt(query)
+
         for attempt in range(max_retries):
+            tracing.annotate(attempts=attempt + 1)
             try:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{"role": "user", "content": prompt}],
-                    response_format={"type": "json_object"}
-                )
+                return AnswerType.model_validate_json(self._complete(prompt)).response
 
-                result = json.loads(response.choices[0].message.content)
-                return result['response']
-
-            except (KeyError, json.JSONDecodeError) as e:
+            except ValidationError as e:
                 print(f'SYSTEM: Attempt {attempt + 1}/{max_retries} failed: {str(e)}')
                 if attempt == max_retries - 1:
                     print('SYSTEM: All retry attempts failed')
                     return None
 
+    @tracing.traced('nlu.recognize_answer_type')
+    async def arecognize_answer_type(self, query, max_retries=3):
+        """Async version of recognize_answer_type"""
+        answer = self._local_answer_type(query)
+        if answer is not None:
+            return answer
 
-    def recognize_intent(self, query: str, last_question_type=None):
-        """
-        Method to recognize the intent from user's input
-        :param query: Transcript from audio
-        :param last_question_type: what was asked last
-        :return: Recognized intent + Extracted extra info
-        """
-        assert query is not None, 'Empty query provided'
-        assert len(self.intent_categories) > 0, 'Intents list empty'
+        prompt = self._answer_type_prompt(query)
 
-        # Store the last question type for context
-        if last_question_type:
-            self.last_question_type = last_question_type
+        for attempt in range(max_retries):
+            tracing.annotate(attempts=attempt + 1)
+            try:
+                return AnswerType.model_validate_json(await self._acomplete(prompt)).response
+
+            except ValidationError as e:
+                print(f'SYSTEM: Attempt {attempt + 1}/{max_retries} failed: {str(e)}')
+                if attempt == max_retries - 1:
+                    print('SYSTEM: All retry attempts failed')
+                    return None
 
+    @staticmethod
+    def _context_instruction(last_question_type):
         # context-aware prompt
         context_instruction = ""
-        if self.last_question_type == "get_dietary_preferences":
+        if last_question_type == "get_dietary_preferences":
             context_instruction = """
                     The last question asked to the user was about dietary preferences.
                     If the user responds with just "No", "None", "Nope", "Not really", or any simple negative response, 
                     interpret this as having NO dietary preferences and set "dietary_preferences" to "NO_PREFERENCE".
                     """
-        elif self.last_question_type == "get_cuisine_preferences":
+        elif last_question_type == "get_cuisine_preferences":
             context_instruction = """
                     The last question asked to the user was about cuisine preferences.
                     If the user responds with just "No", "None", "Nope", "Not really", "Anything", or any simple negative response,
                     interpret this as having NO cuisine preferences and set "culinary_preferences" to "NO_PREFERENCE".
                     """
-        
-        prompt = f"""
-            You are an intent recognition system for a restaurant booking voice assistant.
-            Based on the user's input, identify the most appropriate intent category from the following options:
-            {', '.join(self.intent_categories)}
+        return context_instruction
+
+    @tracing.traced('nlu.recognize_intent')
+    def recognize_intent(self, query: str, last_question_type=None):
+        """
+        Method to recognize the intent from user's input, validated against the TurnAnalysis schema like analyze_turn
+        :param query: Transcript from audio
+        :param last_question_type: what was asked last
+        :return: Recognized intent + Extracted extra info + confidence, 'fallback' if no valid response came back
+        """
+        # Store the last question type for context
+        if last_question_type:
+            self.last_question_type = last_question_type
+
+        return self.analyze_turn(query, self.last_question_type).intent_result()
+
+    @tracing.traced('nlu.recognize_intent')
+    async def arecognize_intent(self, query: str, last_question_type=None):
+        """
+        Async version of recognize_intent, the context comes only from last_question_type (kept per session)
+        :param query: Transcript from audio
+        :param last_question_type: what was asked last in this session
+        :return: Recognized intent + Extracted extra info + confidence
+        """
+        return (await self.aanalyze_turn(query, last_question_type)).intent_result()
+
+    def _local_turn(self, query, last_question_type, expect_answer, start, metrics):
+        """Turn analysis by the slot extractor (and the yes/no classifier), None if the LLM is needed"""
+        assert query is not None, 'Empty query provided'
+
+        if self.slot_extractor is None:
+            return None
 
+        resolved = self.slot_extractor.resolve(query, last_question_type)
+        if resolved is None or resolved[0] not in self.intent_categories:
+            return None
+
+        answer = None
+        if expect_answer:
+            answer = self._local_answer_type(query)
+            if answer is None:
+                # The intent alone is not enough - one LLM call gives both
+                return None
+
+        self._record_turn('local', time.perf_counter() - start, metrics)
+        intent, extracted_info, confidence = resolved
+        return TurnAnalysis(intent=intent, confidence=confidence, answer=answer,
+                            extracted_info=ExtractedInfo(**extracted_info))
+
+    def _turn_prompt(self, query, last_question_type, expect_answer):
+        # The intent categories and the field types come with the JSON schema
+        context_instruction = self._context_instruction(last_question_type)
+
+        answer_instruction = ""
+        if expect_answer:
+            answer_instruction = "The user was just asked to confirm a detail, the input is most likely a yes or no."
+
+        return f"""
+            You are the language understanding system of a restaurant booking voice assistant.
             {context_instruction}
-             
+            {answer_instruction}
             User input: "{query}"
 
-            Respond with a JSON object containing:
-            1. "intent": the most appropriate intent category
-            2. "confidence": your confidence score (0-1)
-            3. "extracted_info": a dictionary with any relevant information extracted from the input, with keys including:
-               - "name": user's first name 
-               - "dietary_preferences": dietary preferences/restrictions if mentioned or None. 
-               If the user explicitly states they have no preferences or restrictions (e.g., "no dietary restrictions", 
-               "I eat everything", "no preferences", etc.), set this to "NO_PREFERENCE". 
-               If not mentioned, set to empty string.
-               - "culinary_preferences": cuisine preference if mentioned or None. 
-               If the user explicitly states they have no cuisine preference (e.g., "any cuisine", "I like all food", 
-               "no preference", etc.), set this to "NO_PREFERENCE". 
-               If not mentioned, set to empty string.
-               - "party_size": number of guests if mentioned - always a positive number
-               - "booking_date_time": booking time/date if mentioned
-               - "booking_location": preferred area of the restaurant
-               
-               Include empty string values for fields not mentioned in the input.
-               
-            The answer must have confidence over 0.9. 
-            Otherwise, return recognized intent as "fallback"  
-               
-            JSON Response:
+            Fill every field of the JSON schema:
+            - "intent": the most appropriate intent category, "fallback" if your confidence is below 0.9
+            - "confidence": your confidence score (0-1)
+            - "extracted_info": details mentioned in the input, empty string or null when not mentioned.
+               "name" is the first name, "booking_location" the preferred area, "party_size" the number of guests.
+               Set "dietary_preferences" / "culinary_preferences" to "NO_PREFERENCE" if the user explicitly has none
+            - "answer": true if the input means "YES" ("yes, sure", "yeah", "its correct"),
+               false if it means "NO" ("no", "wrong", "no sorry"), null if it is neither
             """
 
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}
-        )
+    def _parse_turn(self, content):
+        return TurnAnalysis.model_validate_json(content, context={'intents': self.intent_categories})
+
+    @staticmethod
+    def _fallback_turn():
+        print('SYSTEM: All retry attempts failed')
+        return TurnAnalysis(intent='fallback', confidence=0.0, answer=None, extracted_info=ExtractedInfo.empty())
+
+    @tracing.traced('nlu.analyze_turn')
+    def analyze_turn(self, query, last_question_type=None, expect_answer=False, max_retries=3,
+                     metrics=None) -> TurnAnalysis:
+        """
+        Intent, extracted details and yes/no answer of one reply, from one strictly validated structured response
+        (instead of recognize_intent + recognize_answer_type on the same input)
+        :param query: User input
+        :param last_question_type: what was asked last
+        :param expect_answer: The user was asked to confirm a detail, the yes/no answer will be used
+        :param max_retries: Attempts when the response does not match the schema
+        :param metrics: Optional list the turn's {tier, latency, saved} is appended to (ex. the session's own)
+        :return: TurnAnalysis, intent 'fallback' if no attempt gave a valid response
+        """
+        start = time.perf_counter()
+
+        analysis = self._local_turn(query, last_question_type, expect_answer, start, metrics)
+        if analysis is not None:
+            return analysis
+
+        prompt = self._turn_prompt(query, last_question_type, expect_answer)
+        response_format = turn_analysis_format(self.intent_categories)
+
+        for attempt in range(max_retries):
+            tracing.annotate(attempts=attempt + 1)
+            try:
+                analysis = self._parse_turn(self._complete(prompt, response_format))
+                self._record_turn('llm', time.perf_counter() - start, metrics)
+                return analysis
+            except ValidationError as e:
+                print(f'SYSTEM: Attempt {attempt + 1}/{max_retries} failed: {str(e)}')
+
+        return self._fallback_turn()
+
+    @tracing.traced('nlu.analyze_turn')
+    async def aanalyze_turn(self, query, last_question_type=None, expect_answer=False, max_retries=3,
+                            metrics=None) -> TurnAnalysis:
+        """Async version of analyze_turn"""
+        start = time.perf_counter()
+
+        analysis = self._local_turn(query, last_question_type, expect_answer, start, metrics)
+        if analysis is not None:
+            return analysis
+
+        prompt = self._turn_prompt(query, last_question_type, expect_answer)
+        response_format = turn_analysis_format(self.intent_categories)
+
+        for attempt in range(max_retries):
+            tracing.annotate(attempts=attempt + 1)
+            try:
+                analysis = self._parse_turn(await self._acomplete(prompt, response_format))
+                self._record_turn('llm', time.perf_counter() - start, metrics)
+                return analysis
+            except ValidationError as e:
+                print(f'SYSTEM: Attempt {attempt + 1}/{max_retries} failed: {str(e)}')
+
+        return self._fallback_turn()
+
+    def _record_turn(self, tier, latency, metrics=None):
+        """
+        Count which tier recognized the intent, and the latency saved compared to an average LLM call
+        :param tier: 'local' or 'llm'
+        :param latency: Time spent in seconds
+        :param metrics: Optional list of the caller's turns, gets this turn appended
+        """
+        tracing.annotate(tier=tier)
+        with self._stats_lock:
+            if tier == 'llm':
+                if self.llm_intent_latency is None:
+                    self.llm_intent_latency = latency
+                else:
+                    self.llm_intent_latency = 0.8 * self.llm_intent_latency + 0.2 * latency
 
-        response_clean = json.loads(response.choices[0].message.content)
+            saved = 0.0
+            if tier == 'local' and self.llm_intent_latency is not None:
+                saved = max(0.0, self.llm_intent_latency - latency)
+
+            # Running counters: the Assistant is shared by every session of the process
+            self.intent_stats[f'{tier}_turns'] += 1
+            self.intent_stats['latency_saved'] += saved
+        if metrics is not None:
+            metrics.append({'tier': tier, 'latency': latency, 'saved': saved})
+
+    def intent_metrics_summary(self, metrics=None) -> dict:
+        """
+        Number of turns answered by each tier and total latency saved by the local one
+        :param metrics: Turns collected through the metrics argument of analyze_turn, default: all sessions
+        """
+        if metrics is None:
+            with self._stats_lock:
+                return dict(self.intent_stats)
+        return {
+            'local_turns': sum(1 for m in metrics if m['tier'] == 'local'),
+            'llm_turns': sum(1 for m in metrics if m['tier'] == 'llm'),
+            'latency_saved': sum(m['saved'] for m in metrics),
+        }
 
-        return response_clean['intent'], response_clean['extracted_info'], response_clean['confidence']
+    def stats(self) -> dict:
+        """Snapshot of the process-wide counters: intent tiers, yes/no tiers and token usage per label"""
+        with self._stats_lock:
+            return {'intent_tiers': dict(self.intent_stats), 'answer_tiers': dict(self.answer_type_stats),
+                    'token_usage': {label: dict(totals) for label, totals in self.token_usage.items()}}
 
     def generate_response(self, intent):
         """
@@ -141,8 +423,9 @@ class Assistant:
         pool_of_responses = self.intents[intent]['responses']
         return pool_of_responses[random.randint(0, 2)]
 
-    def generate_api_query(self, user_details):
-        prompt = f'''Your task is to preapre an API query based on user details.
+    @staticmethod
+    def _api_query_prompt(user_details):
+        return f'''Your task is to preapre an API query based on user details.
         User your language skills to extract data from a Python dictionary and prepare a robust Google search query.
         For example, based on user details:
             Vegan restaurant in the city Center Warsaw,
@@ -155,19 +438,26 @@ class Assistant:
         Return a simple string.
         Response:
         '''
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "text"}
-        )
-        # print(response.choices[0].message.content)
-        return response.choices[0].message.content
 
-    def generate_restaurant_suggestion(self, restaurants_list:list, user_preferences:list):
+    @tracing.traced('nlu.generate_api_query')
+    @memoized('api_query', API_QUERY_TEMPLATE_VERSION)
+    def generate_api_query(self, user_details):
+        return self._complete(self._api_query_prompt(user_details), response_format='text', label='api_query')
+
+    @tracing.traced('nlu.generate_api_query')
+    @memoized('api_query', API_QUERY_TEMPLATE_VERSION)
+    async def agenerate_api_query(self, user_details):
+        return await self._acomplete(self._api_query_prompt(user_details), response_format='text', label='api_query')
+
+    def _suggestion_prompt(self, restaurants_list, user_preferences):
         assert restaurants_list, 'Empty restaurants_list provided'
         assert user_preferences, 'Empty user_preferences provided'
 
-        prompt = f"""   
+        # Up to 5 full reviews per place, cut down to the budget with the reviews matching the preferences first
+        restaurants_list, stats = self.prompt_budget.fit_restaurants(restaurants_list, user_preferences)
+        print(f'SYSTEM: suggestion prompt restaurant list {stats}')
+
+        return f"""   
         You are a helpful culinary advisor. Your goal is to select the best option based on the user input from the restaurant lists.
         You will choose top three picks from a list based on:
         - How close the recent review match the user input.
@@ -191,13 +481,9 @@ class Assistant:
         JSON Response:
         """
 
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}
-        )
-
-        result = json.loads(response.choices[0].message.content)
+    @staticmethod
+    def _parse_suggestions(content):
+        result = json.loads(content)
         print('RESTAURANT SUGGESTIONS', result)
 
         if result:
@@ -207,4 +493,64 @@ class Assistant:
                 return result[0]
         else:
             print("SYSTEM: Couldn't find any restaurant")
-            return None
\ No newline at end of file
+            return None
+
+    @tracing.traced('nlu.generate_restaurant_suggestion')
+    @memoized('restaurant_suggestion', SUGGESTION_TEMPLATE_VERSION)
+    def generate_restaurant_suggestion(self, restaurants_list:list, user_preferences:list):
+        prompt = self._suggestion_prompt(restaurants_list, user_preferences)
+        return self._parse_suggestions(self._complete(prompt, label='restaurant_suggestion'))
+
+    @tracing.traced('nlu.generate_restaurant_suggestion')
+    @memoized('restaurant_suggestion', SUGGESTION_TEMPLATE_VERSION)
+    async def agenerate_restaurant_suggestion(self, restaurants_list:list, user_preferences:list):
+        prompt = self._suggestion_prompt(restaurants_list, user_preferences)
+        return self._parse_suggestions(await self._acomplete(prompt, label='restaurant_suggestion'))
+
+    def _pick_summary_prompt(self, picks, user_preferences):
+        assert picks, 'Empty picks provided'
+
+        budget = self.prompt_budget
+        restaurants = '\n'.join(
+            f"{idx + 1}. {pick['restaurant_name']}, rating {pick['rating']}, "
+            f"reviews mention: {', '.join(pick['matched_keywords']) or 'nothing specific'}. "
+            f"{truncate_tokens(pick['summary'], budget.max_review_tokens, budget.model)}"
+            for idx, pick in enumerate(picks))
+
+        return f"""You are a helpful culinary advisor. These restaurants were already selected for the user.
+        For every restaurant write one short sentence telling the user why it fits their preferences, based only on the given reviews.
+
+        User preferences: {user_preferences}
+        Restaurants:
+        {restaurants}
+
+        Respond with a JSON object {{"summaries": [...]}}, one sentence per restaurant in the same order.
+        """
+
+    @staticmethod
+    def _parse_pick_summaries(content, count):
+        summaries = json.loads(content).get('summaries')
+        if not isinstance(summaries, list) or len(summaries) != count:
+            print(f'SYSTEM: Unexpected pick summaries: {summaries}')
+            return None
+        return summaries
+
+    @tracing.traced('nlu.generate_pick_summaries')
+    @memoized('pick_summaries', PICK_SUMMARY_TEMPLATE_VERSION)
+    def generate_pick_summaries(self, picks:list, user_preferences:list):
+        """
+        One sentence per locally ranked restaurant (RestaurantRanker.top_picks), the ranking stays as it is
+        :return: List of summaries in the order of picks, None if the response doesn't match
+        """
+        prompt = self._pick_summary_prompt(picks, user_preferences)
+        return self._parse_pick_summaries(self._complete(prompt, label='pick_summaries'), len(picks))
+
+    @tracing.traced('nlu.generate_pick_summaries')
+    @memoized('pick_summaries', PICK_SUMMARY_TEMPLATE_VERSION)
+    async def agenerate_pick_summaries(self, picks:list, user_preferences:list):
+        prompt = self._pick_summary_prompt(picks, user_preferences)
+        return self._parse_pick_summaries(await self._acomplete(prompt, label='pick_summaries'), len(picks))
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
@@ -0,0 +1,107 @@
+import time
+import wave
+import queue
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+class MicrophoneSource:
+    def __init__(self, sample_rate=SAMPLE_RATE, block_size=1600):
+        """
+        Live microphone input, yields float32 mono blocks
+        https://python-sounddevice.readthedocs.io/en/0.5.1/api/streams.html#sounddevice.InputStream
+        :param sample_rate: Sample rate, default 16 kHz (Whisper input)
+        :param block_size: Number of frames per block, default 1600 => 0.1s audio
+        """
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.blocks = queue.Queue()
+        self.stream = None
+
+    def _callback(self, indata, frames, time, status):
+        self.blocks.put(indata[:, 0].copy())
+
+    def __enter__(self):
+        # Imported here, so replaying WAV files works on machines without PortAudio
+        import sounddevice as sd
+
+        self.stream = sd.InputStream(
+            channels=1,
+            dtype='float32',
+            samplerate=self.sample_rate,
+            blocksize=self.block_size,
+            callback=self._callback,
+        )
+        self.stream.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stream.stop()
+        self.stream.close()
+
+    def __iter__(self):
+        while True:
+            yield self.blocks.get()
+
+
+class WavFileSource:
+    def __init__(self, path, sample_rate=SAMPLE_RATE, block_size=1600, realtime=False, trailing_silence=1.0):
+        """
+        Replays a WAV file block by block, a drop-in replacement of MicrophoneSource for tests and benchmarks
+        :param path: Path to a 16-bit PCM WAV file
+        :param sample_rate: Output sample rate, the file is resampled if needed
+        :param block_size: Number of frames per block
+        :param realtime: Sleep between blocks like a live microphone would
+        :param trailing_silence: Seconds of silence appended, so end-of-speech can be detected
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.realtime = realtime
+        self.audio = np.concatenate([
+            read_wav(path, sample_rate),
+            np.zeros(int(trailing_silence * sample_rate), dtype=np.float32)
+        ])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def __iter__(self):
+        block_duration = self.block_size / self.sample_rate
+        start = time.monotonic()
+
+        for idx, offset in enumerate(range(0, len(self.audio), self.block_size)):
+            if self.realtime:
+                delay = start + (idx + 1) * block_duration - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            yield self.audio[offset:offset + self.block_size]
+
+
+def read_wav(path, sample_rate=SAMPLE_RATE) -> np.ndarray:
+    """
+    Read a 16-bit PCM WAV file as float32 mono in [-1, 1]
+    :param path: File path
+    :param sample_rate: Target sample rate
+    :return: Audio samples
+    """
+    with wave.open(path, 'rb') as wav:
+        assert wav.getsampwidth() == 2, 'Only 16-bit PCM WAV files are supported'
+        channels = wav.getnchannels()
+        file_rate = wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+
+    audio = np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768.0
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1)
+
+    if file_rate != sample_rate:
+        duration = len(audio) / file_rate
+        target = np.linspace(0, duration, int(duration * sample_rate), endpoint=False)
+        audio = np.interp(target, np.arange(len(audio)) / file_rate, audio).astype(np.float32)
+
+    return audio
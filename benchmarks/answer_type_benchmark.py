@@ -0,0 +1,65 @@
+"""
+Accuracy, latency and API-call reduction of the local yes/no tier (AnswerClassifier)
+on a labelled set of user replies. Label null marks replies that should go to the LLM.
+
+Usage (from the repository root):
+    python -m benchmarks.answer_type_benchmark --threshold 0.85
+"""
+import os
+import json
+import time
+import argparse
+
+from answer_classifier import AnswerClassifier, SEED_EXAMPLES
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'answer_type_labels.jsonl')
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local yes/no classifier benchmark')
+    parser.add_argument('--threshold', type=float, default=0.85)
+    parser.add_argument('--fixture', default=FIXTURE)
+    parser.add_argument('--no-neighbours', action='store_true', help='Only lexicon and negation rules')
+    args = parser.parse_args()
+
+    with open(args.fixture) as file:
+        samples = [json.loads(line) for line in file if line.strip()]
+
+    examples = None if args.no_neighbours else SEED_EXAMPLES
+    classifier = AnswerClassifier(threshold=args.threshold, examples=examples)
+
+    latencies = []
+    answered = correct = 0
+    errors = []
+
+    for sample in samples:
+        start = time.perf_counter()
+        answer, confidence = classifier.classify(sample['text'])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        if answer is None or confidence < classifier.threshold:
+            continue  # falls through to the LLM
+
+        answered += 1
+        if answer == sample['label']:
+            correct += 1
+        else:
+            errors.append((sample['text'], answer, confidence, sample['label']))
+
+    print(f'Samples:              {len(samples)}')
+    print(f'Answered locally:     {answered} ({answered / len(samples):.0%} fewer API calls)')
+    print(f'Local accuracy:       {correct / max(1, answered):.1%}')
+    print(f'Latency mean/p99/max: {sum(latencies) / len(latencies):.3f} / {percentile(latencies, 99):.3f} '
+          f'/ {max(latencies):.3f} ms')
+
+    for text, answer, confidence, label in errors:
+        print(f'  wrong: {text!r} -> {answer} ({confidence}), expected {label}')
+
+
+if __name__ == '__main__':
+    main()
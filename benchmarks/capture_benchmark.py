@@ -0,0 +1,129 @@
+"""
+Microbenchmark and allocation check of the record_audio capture path, with a fake input stream instead of sounddevice.
+
+Compares the preallocated capture buffer (STT.record_audio) with the previous path
+(indata.copy() per block into a list, np.concatenate(...).flatten(), normalization copy).
+
+Usage (from the repository root):
+    python -m benchmarks.capture_benchmark --utterances 20 --duration 8
+"""
+import time
+import argparse
+import threading
+import tracemalloc
+import numpy as np
+
+from speech_to_text import STT
+from audio_source import SAMPLE_RATE
+
+
+def make_utterance(duration, seed=0):
+    """Harmonic 'voice' between two silences, long enough for the VAD to start and stop"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    voice = 0.1 * sum(np.sin(2 * np.pi * 140 * k * t) / k for k in range(1, 8))
+    silence = np.zeros(SAMPLE_RATE, dtype=np.float64)
+    audio = np.concatenate([silence, voice, silence]) + 0.001 * rng.standard_normal(len(t) + 2 * SAMPLE_RATE)
+    return audio.astype(np.float32)
+
+
+class FakeInputStream:
+    """Stands in for sounddevice.InputStream, feeds an array to the callback from a background thread"""
+    audio = None
+
+    def __init__(self, channels, dtype, samplerate, blocksize, callback):
+        self.blocksize = blocksize
+        self.callback = callback
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.stopped = False
+        # sounddevice reuses one input buffer between callbacks
+        self.indata = np.zeros((blocksize, channels), dtype=dtype)
+
+    def _run(self):
+        for offset in range(0, len(self.audio) - self.blocksize + 1, self.blocksize):
+            if self.stopped:
+                return
+            self.indata[:, 0] = self.audio[offset:offset + self.blocksize]
+            self.callback(self.indata, self.blocksize, None, None)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped = True
+        self.thread.join()
+
+
+class NullBackend:
+    """Skips inference, remembers what the model would have received"""
+    received = None
+
+    def transcribe(self, audio_data):
+        self.received = audio_data
+        return ''
+
+
+def legacy_capture(audio, block_size=4000):
+    """The previous capture path, without the threshold logic"""
+    audio_buffer = []
+    for offset in range(0, len(audio) - block_size + 1, block_size):
+        indata = audio[offset:offset + block_size].reshape(-1, 1)
+        audio_buffer.append(indata.copy())
+
+    audio_data = np.concatenate(audio_buffer).flatten()
+    if np.max(np.abs(audio_data)) > 0:
+        audio_data = audio_data / np.max(np.abs(audio_data))
+    return audio_data
+
+
+def measure(function, utterances):
+    tracemalloc.start()
+    function()  # warm-up, the capture buffer is allocated here
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+
+    start = time.perf_counter()
+    for _ in range(utterances):
+        function()
+    elapsed = (time.perf_counter() - start) / utterances
+
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak - baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description='record_audio capture benchmark')
+    parser.add_argument('--utterances', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=8.0, help='Speech length in seconds')
+    args = parser.parse_args()
+
+    FakeInputStream.audio = make_utterance(args.duration)
+
+    # The model is only loaded on first use, replaced here before that
+    stt = STT()
+    stt.backend = NullBackend()
+
+    def preallocated():
+        stt.record_audio(max_record_duration=args.duration + 2, input_stream=FakeInputStream)
+
+    preallocated_time, preallocated_peak = measure(preallocated, args.utterances)
+    assert stt.backend.received.base is stt._capture_buffer, 'The model must get a view of the capture buffer'
+
+    legacy_time, legacy_peak = measure(lambda: legacy_capture(FakeInputStream.audio), args.utterances)
+
+    utterance_mb = len(FakeInputStream.audio) * 4 / 1024 ** 2
+    print(f'Utterance: {args.duration:.0f} s speech ({utterance_mb:.2f} MB float32)')
+    print(f'Preallocated: {preallocated_time * 1000:.1f} ms/utterance (includes VAD and fake stream), '
+          f'peak new allocations {preallocated_peak / 1024:.0f} KB')
+    print(f'Legacy:       {legacy_time * 1000:.1f} ms/utterance (copies only), '
+          f'peak new allocations {legacy_peak / 1024:.0f} KB')
+
+    # Allocation test: audio sized allocations must be gone from the capture path
+    assert preallocated_peak < 0.1 * legacy_peak, 'record_audio allocates per-utterance audio copies'
+    print('OK: no per-utterance audio copies in record_audio')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""
+Load test of the asyncio dialog engine: N simulated text sessions at once against local stub LLM and Places servers.
+
+Every simulated user answers the last thing the assistant said (name, diet, cuisine, party size, date, location,
+"yes" to confirmations and to the first suggestion), so each session runs the full flow to a booking.
+
+Usage (from the repository root):
+    python -m benchmarks.dialog_load_test --sessions 1 4 16 64 --llm-delay 0.3
+    python -m benchmarks.dialog_load_test --sessions 1 16 --seconds-per-char 0.01 [--sequential]
+    python -m benchmarks.dialog_load_test --sessions 16 --trace traces.jsonl
+
+"Dead air" is the silence a user waits through after each reply, until the assistant speaks again.
+"""
+import os
+import io
+import json
+import time
+import yaml
+import asyncio
+import argparse
+import tempfile
+import contextlib
+
+from assistant_nlu import Assistant
+from places_client import PlacesClient
+from llm_cache import LLMCache
+from restaurant_ranker import RestaurantRanker
+from user_store import UserStore, WriteBehindPersister
+from dialog_engine import DialogEngine
+import tracing
+from benchmarks.stub_servers import make_places, places_server, chat_server
+
+# (keywords in the last assistant prompt, user reply), first match wins
+ANSWERS = [
+    (('correct', 'right?', 'confirm', 'first time', 'suggest a booking'), 'yes'),
+    (('name',), 'My name is Anna'),
+    (('diet',), 'vegan'),
+    (('cuisine',), 'italian'),
+    (('How many', 'party', 'guests'), 'four people'),
+    (('When', 'What day'), 'tomorrow at 7pm'),
+    (('area', 'location', 'located'), 'in the city center'),
+]
+DEFAULT_ANSWER = 'I would like to book a table'
+
+# A returning user (--returning) answers the first-time question with "no" and reuses the previous preferences
+RETURNING_ANSWERS = [
+    (('first time',), 'no'),
+    (('What name',), 'Anna'),
+    (('previous recommendation',), 'yes'),
+]
+
+
+class ScriptedIO:
+    def __init__(self, think_time=0.05, seconds_per_char=0.0, returning=False):
+        """
+        Simulated user
+        :param think_time: Delay before every reply
+        :param seconds_per_char: Simulated playback time of the assistant's prompts
+        :param returning: The user booked before and wants the same preferences
+        """
+        self.answers = RETURNING_ANSWERS + ANSWERS if returning else ANSWERS
+        self.think_time = think_time
+        self.seconds_per_char = seconds_per_char
+        self.last_prompt = ''
+
+        # Time the user spent waiting in silence: from their reply (or the end of the previous prompt) to the next prompt
+        self.silent_since = time.perf_counter()
+        self.dead_air = 0.0
+        self.replies = 0
+
+    async def say(self, text):
+        self.dead_air += time.perf_counter() - self.silent_since
+        self.last_prompt = text
+        await asyncio.sleep(len(text) * self.seconds_per_char)
+        self.silent_since = time.perf_counter()
+
+    async def listen(self, prompt=None):
+        await asyncio.sleep(self.think_time)
+        self.replies += 1
+        self.silent_since = time.perf_counter()
+
+        for keywords, answer in self.answers:
+            if any(keyword in self.last_prompt for keyword in keywords):
+                return answer
+        return DEFAULT_ANSWER
+
+
+async def run_sessions(engine, count, args):
+    async def timed_session():
+        start = time.perf_counter()
+        # a session stuck in the dialog loop fails the test instead of hanging it
+        io = ScriptedIO(args.think_time, args.seconds_per_char, returning=args.returning)
+        session = await asyncio.wait_for(engine.run_session(io), timeout=args.session_timeout)
+        return time.perf_counter() - start, session
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(timed_session() for _ in range(count)))
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dialog engine load test')
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--llm-delay', type=float, default=0.3, help='Latency of the stub chat completions')
+    parser.add_argument('--places-delay', type=float, default=0.05, help='Latency of the stub Places requests')
+    parser.add_argument('--places-workers', type=int, default=32, help='Concurrent Places requests (all sessions)')
+    # the stub servers share this process (and its GIL) with the sessions, so the default 6 s deadline is too tight
+    parser.add_argument('--places-deadline', type=float, default=30.0)
+    parser.add_argument('--think-time', type=float, default=0.05, help='Simulated user reply delay')
+    parser.add_argument('--seconds-per-char', type=float, default=0.0, help='Simulated TTS playback time')
+    parser.add_argument('--session-timeout', type=float, default=120.0)
+    parser.add_argument('--sequential', action='store_true',
+                        help='Wait for every prompt to be spoken before the next step, no speculative NLU calls')
+    parser.add_argument('--no-prefetch', action='store_true', help='Search restaurants only after the last slot')
+    parser.add_argument('--memoize', action='store_true', help='Memoize search queries and suggestions (in memory)')
+    parser.add_argument('--no-local', action='store_true', help='Send every turn to the (stub) LLM')
+    parser.add_argument('--returning', action='store_true',
+                        help='Every simulated user has a previous booking and skips slot filling')
+    parser.add_argument('--sync-save', action='store_true', help='Commit bookings on the dialog path')
+    parser.add_argument('--llm-ranking', action='store_true', help='Suggestions picked by the (stub) LLM')
+    parser.add_argument('--llm-summary', action='store_true', help='LLM summaries of the locally ranked picks')
+    parser.add_argument('--trace', metavar='FILE', default=None,
+                        help='Write the session traces to FILE (JSON lines) and print the latency per stage')
+    args = parser.parse_args()
+
+    if args.trace:
+        open(args.trace, 'w').close()
+        tracing.configure(trace_file=args.trace)
+
+    with open('intents.yaml', 'r') as file:
+        intents = yaml.safe_load(file)
+
+    with chat_server(delay=args.llm_delay) as chat, places_server(make_places(20), delay=args.places_delay) as places, \
+            tempfile.TemporaryDirectory() as workdir:
+        store = UserStore(os.path.join(workdir, 'user_store.sqlite'))
+        user_store = store if args.sync_save else WriteBehindPersister(store)
+        if args.returning:
+            store.save({'user_name': 'Anna', 'dietary_preferences': 'vegan', 'culinary_preferences': 'italian',
+                             'party_size': 4, 'booking_date_time': 'last friday at 7pm',
+                             'booking_location': 'the city center'})
+
+        for count in args.sessions:
+            assistant = Assistant(intents=intents, intent_categories=list(intents.keys()), api_key='stub',
+                                  base_url=f'{chat.url}/v1', local_answer_threshold=None if args.no_local else 0.85,
+                                  local_slots=not args.no_local, llm_cache=LLMCache() if args.memoize else None)
+            places_client = PlacesClient(api_key='stub', base_url=places.url, max_workers=args.places_workers,
+                                         total_deadline=args.places_deadline)
+            engine = DialogEngine(assistant, places_client, pipelined=not args.sequential,
+                                  prefetch=not args.no_prefetch,
+                                  ranker=None if args.llm_ranking else RestaurantRanker(),
+                                  llm_summaries=args.llm_summary, user_store=user_store)
+
+            async def run():
+                try:
+                    return await run_sessions(engine, count, args)
+                finally:
+                    await engine.aclose()
+
+            llm_calls = chat.httpd.RequestHandlerClass.requests_served
+            tracing.TRACER.reset()
+            with contextlib.redirect_stdout(io.StringIO()):
+                wall, results = asyncio.run(run())
+            llm_calls = chat.httpd.RequestHandlerClass.requests_served - llm_calls
+            places_client.close()
+
+            durations = sorted(duration for duration, _ in results)
+            booked = sum(session.booked is not None for _, session in results)
+            prefetch_used = sum(session.prefetch_stats['used'] for _, session in results)
+            hidden = sum(session.prefetch_stats['hidden_latency'] for _, session in results) / count
+            replies = sum(session.io.replies for _, session in results) / count
+            dead_air = sum(session.io.dead_air for _, session in results) / sum(session.io.replies for _, session in results)
+            print(f'{count:3d} sessions: wall {wall:.2f} s, {count / wall:.1f} sessions/s, '
+                  f'session mean {sum(durations) / count:.2f} s max {durations[-1]:.2f} s, '
+                  f'{llm_calls / count:.1f} LLM calls/session, {replies:.1f} replies/session, dead air {dead_air * 1000:.0f} ms/reply, '
+                  f'prefetch used {prefetch_used}/{count} hiding {hidden * 1000:.0f} ms/session, booked {booked}/{count}')
+
+            if args.memoize:
+                print(f'     LLM cache {assistant.llm_cache.stats()}')
+            if args.trace:
+                print('\n'.join(f'     {row}' for row in tracing.TRACER.format_summary().splitlines()))
+
+            assert booked == count, 'Not every simulated session ended with a booking'
+
+        if not args.sync_save:
+            user_store.close()
+            print(f'     user store writer {user_store.stats()}')
+        assert store.count() == sum(args.sessions) + args.returning, 'Not every booking was saved'
+
+    if args.trace:
+        with open(args.trace) as file:
+            spans = [json.loads(line) for line in file]
+        sessions = {span['session'] for span in spans}
+        print(f'{len(spans)} spans of {len(sessions)} sessions in {args.trace}')
+        assert len(sessions) == sum(args.sessions), 'Not every session was traced'
+
+
+if __name__ == '__main__':
+    main()
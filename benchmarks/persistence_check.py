@@ -0,0 +1,104 @@
+"""
+Write-behind persistence of the bookings (WriteBehindPersister):
+- save() latency seen by concurrent sessions, synchronous UserStore commits vs the write-behind queue
+- crash check: a child process queues bookings, flushes, queues some more and is killed with SIGKILL;
+  every booking queued before the flush must be in the database
+
+Usage (from the repository root):
+    python -m benchmarks.persistence_check [--sessions 64] [--bookings 20] [--max-queue 1024]
+"""
+import os
+import sys
+import time
+import signal
+import argparse
+import tempfile
+import subprocess
+import threading
+
+from user_store import UserStore, WriteBehindPersister
+
+
+def booking(idx):
+    return {'user_name': f'user {idx}', 'dietary_preferences': 'vegan', 'culinary_preferences': 'italian',
+            'party_size': 2, 'booking_date_time': 'tomorrow at 7pm', 'booking_location': 'old town'}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def save_latencies(store, sessions, bookings):
+    """Every session thread saves its bookings one by one, like the dialog at the end of a conversation"""
+    latencies, lock = [], threading.Lock()
+
+    def session(offset):
+        for idx in range(bookings):
+            start = time.perf_counter()
+            store.save(booking(offset + idx))
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=session, args=(idx * bookings,)) for idx in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def child(db_path, flushed, unflushed):
+    """Queue, flush, queue more, then die without any cleanup"""
+    persister = WriteBehindPersister(UserStore(db_path))
+    for idx in range(flushed):
+        persister.save(booking(idx))
+    persister.flush()
+    print('flushed', flush=True)
+
+    for idx in range(flushed, flushed + unflushed):
+        persister.save(booking(idx))
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write-behind persistence check')
+    parser.add_argument('--sessions', type=int, default=64, help='Concurrent sessions saving bookings')
+    parser.add_argument('--bookings', type=int, default=20, help='Bookings saved by every session')
+    parser.add_argument('--max-queue', type=int, default=1024)
+    parser.add_argument('--child', nargs=3, metavar=('DB', 'FLUSHED', 'UNFLUSHED'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], int(args.child[1]), int(args.child[2]))
+        return
+
+    total = args.sessions * args.bookings
+    with tempfile.TemporaryDirectory() as workdir:
+        sync_store = UserStore(os.path.join(workdir, 'sync.sqlite'))
+        sync = save_latencies(sync_store, args.sessions, args.bookings)
+
+        persister = WriteBehindPersister(UserStore(os.path.join(workdir, 'write_behind.sqlite')),
+                                         max_queue=args.max_queue)
+        write_behind = save_latencies(persister, args.sessions, args.bookings)
+        persister.close()
+        assert persister.store.count() == total, f'{persister.store.count()} of {total} bookings written'
+
+        for label, latencies in (('synchronous', sync), ('write-behind', write_behind)):
+            print(f'{label:12s} save p50 {percentile(latencies, 50) * 1000:.3f} ms '
+                  f'p99 {percentile(latencies, 99) * 1000:.3f} ms max {max(latencies) * 1000:.3f} ms')
+        print(f'writer {persister.stats()}')
+
+        db_path = os.path.join(workdir, 'crash.sqlite')
+        process = subprocess.run([sys.executable, '-m', 'benchmarks.persistence_check', '--child', db_path,
+                                  str(total), '100'], capture_output=True, text=True)
+        assert process.returncode == -signal.SIGKILL and 'flushed' in process.stdout, process
+        saved = UserStore(db_path).count()
+        print(f'killed after flush: {saved} bookings in the database, {total} flushed')
+        assert saved >= total, 'Bookings written before the flush were lost'
+
+    print('OK: no flushed booking lost')
+
+
+if __name__ == '__main__':
+    main()
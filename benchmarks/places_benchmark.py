@@ -0,0 +1,78 @@
+"""
+Compare serial Place Details fetching (one requests.get per place) with the pooled, concurrent PlacesClient,
+and with a warm PlacesCache.
+Runs against a local stub Places server with artificial latency.
+
+Usage (from the repository root):
+    python -m benchmarks.places_benchmark --places 20 --delay 0.1
+"""
+import os
+import time
+import argparse
+import tempfile
+import requests
+
+from places_client import PlacesClient
+from places_cache import PlacesCache
+from benchmarks.stub_servers import make_places, places_server
+
+
+def serial_find_restaurants(base_url, query):
+    """Baseline: same flow as the original find_restaurants, one blocking request after another"""
+    response = requests.get(f'{base_url}/textsearch/json', params={"query": query, "type": "restaurant"})
+    places_sorted = sorted(response.json().get("results", []), key=lambda x: x.get('rating', 0), reverse=True)
+
+    results = []
+    for place in places_sorted:
+        details_response = requests.get(f'{base_url}/details/json', params={"place_id": place["place_id"]})
+        if details_response.status_code != 200:
+            continue
+        results.append(details_response.json().get("result", {}).get("name"))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Places fetching benchmark')
+    parser.add_argument('--places', type=int, default=20)
+    parser.add_argument('--delay', type=float, default=0.1, help='Stub server latency per request')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--deadline', type=float, default=6.0)
+    args = parser.parse_args()
+
+    query = "Italian restaurant in Warsaw center"
+
+    with places_server(make_places(args.places), delay=args.delay) as server:
+        start = time.perf_counter()
+        serial = serial_find_restaurants(server.url, query)
+        serial_time = time.perf_counter() - start
+
+        client = PlacesClient(api_key='stub', base_url=server.url, max_workers=args.workers,
+                              total_deadline=args.deadline)
+        start = time.perf_counter()
+        concurrent = [r['name'] for r in client.find_restaurants(query)]
+        concurrent_time = time.perf_counter() - start
+        client.close()
+
+        # Second session with a warm on-disk cache
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = PlacesCache(os.path.join(tmp, 'places_cache.sqlite'))
+            client = PlacesClient(api_key='stub', base_url=server.url, max_workers=args.workers,
+                                  total_deadline=args.deadline, cache=cache)
+            client.find_restaurants(query)
+            start = time.perf_counter()
+            cached = [r['name'] for r in client.find_restaurants(query)]
+            cached_time = time.perf_counter() - start
+            client.close()
+
+    assert serial == concurrent, 'Concurrent results must keep the rating order'
+    assert serial == cached, 'Cached results must match the fetched ones'
+
+    print(f'Places: {args.places}, stub latency: {args.delay * 1000:.0f} ms, workers: {args.workers}')
+    print(f'Serial:     {serial_time:.3f} s ({len(serial)} restaurants)')
+    print(f'Concurrent: {concurrent_time:.3f} s ({len(concurrent)} restaurants)')
+    print(f'Speedup:    {serial_time / concurrent_time:.1f}x')
+    print(f'Warm cache: {cached_time:.3f} s, {cache.stats()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Checks that the suggestion prompt respects its token budget (PromptBudget) on large synthetic Places results
+and on the labelled ranking fixture, and reports the prompt size before and after trimming.
+
+Usage (from the repository root):
+    python -m benchmarks.prompt_budget_check [--restaurants 20] [--budgets 300 800 1500 4000]
+"""
+import os
+import json
+import time
+import random
+import argparse
+
+from prompt_budget import PromptBudget, count_tokens, dedupe_reviews
+from restaurant_ranker import normalize_text, preference_terms
+from benchmarks.stub_servers import REVIEWS
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'places_ranking.jsonl')
+PREFERENCES = ['city center', 'vegan', 'italian']
+
+FILLER = ('the waiter was friendly and the place was busy on a friday evening we had to wait a bit but the food '
+          'came quickly portions were fine prices are ok parking is hard desserts were nice music too loud').split()
+
+
+def large_restaurants(count, seed=0):
+    """Places results with 5 reviews of up to ~1500 words each, a share of them copied or near-identical"""
+    rng = random.Random(seed)
+    restaurants = []
+    for idx in range(count):
+        reviews = []
+        for _ in range(5):
+            if reviews and rng.random() < 0.2:
+                reviews.append(reviews[-1].replace('friendly', 'very friendly', 1))  # the same review twice
+                continue
+            words = rng.choices(FILLER, k=rng.randint(20, 1500))
+            words.insert(rng.randint(0, len(words)), rng.choice(REVIEWS))
+            reviews.append(' '.join(words))
+        restaurants.append({'name': f'Restaurant {idx}', 'address': f'Street {idx}, Warsaw',
+                            'rating': round(rng.uniform(3.5, 5.0), 1), 'recent_reviews': reviews,
+                            'matched_keywords': []})
+    return restaurants
+
+
+def check(label, restaurants, preferences, budget):
+    full_tokens = count_tokens(repr(restaurants))
+
+    start = time.perf_counter()
+    entries, stats = budget.fit_restaurants(restaurants, preferences)
+    elapsed = time.perf_counter() - start
+
+    tokens = count_tokens(repr(entries), budget.model)
+    assert tokens == stats['tokens'], f'{label}: reported {stats["tokens"]} tokens, counted {tokens}'
+    assert tokens <= budget.max_tokens, f'{label}: {tokens} tokens over the budget of {budget.max_tokens}'
+    for entry in entries:
+        reviews = entry['recent_reviews']
+        assert all(count_tokens(review, budget.model) <= budget.max_review_tokens for review in reviews), \
+            f'{label}: review over {budget.max_review_tokens} tokens in {entry["name"]}'
+        assert len(dedupe_reviews(reviews)) == len(reviews), f'{label}: duplicate reviews kept in {entry["name"]}'
+    # a restaurant is dropped only if the names, addresses and ratings alone are over the budget
+    if stats['dropped_restaurants']:
+        bases = [{'name': r['name'], 'address': r['address'], 'rating': r['rating'], 'recent_reviews': []}
+                 for r in restaurants[:len(entries) + 1]]
+        assert count_tokens(repr(bases), budget.model) > budget.max_tokens, \
+            f'{label}: restaurants dropped while they would fit without reviews'
+
+    print(f'{label:24s} budget {budget.max_tokens:5d}: {full_tokens:6d} -> {tokens:5d} tokens, '
+          f'{stats["restaurants"]} restaurants, {stats["reviews"]} reviews kept, {stats["deduplicated"]} duplicates, '
+          f'{stats["dropped_reviews"]} dropped, {elapsed * 1000:.1f} ms')
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Suggestion prompt token budget check')
+    parser.add_argument('--restaurants', type=int, default=20)
+    parser.add_argument('--budgets', type=int, nargs='+', default=[300, 800, 1500, 4000])
+    parser.add_argument('--max-review-tokens', type=int, default=80)
+    args = parser.parse_args()
+
+    with open(FIXTURE) as file:
+        cases = [json.loads(line) for line in file if line.strip()]
+    restaurants = large_restaurants(args.restaurants)
+
+    count_tokens('')  # loads the tokenizer, prints a warning if it falls back to the estimate
+
+    for max_tokens in args.budgets:
+        budget = PromptBudget(max_tokens=max_tokens, max_review_tokens=args.max_review_tokens)
+        check(f'{args.restaurants} large restaurants', restaurants, PREFERENCES, budget)
+
+        for case in cases:
+            entries = check(', '.join(case['preferences'])[:24], case['restaurants'], case['preferences'], budget)
+
+            # with room for one review per restaurant, it is one mentioning the preferences (if there is one)
+            if max_tokens >= 800:
+                terms = [f' {term} ' for term in preference_terms(case['preferences'])]
+                mentions = lambda review: any(term in normalize_text(review) for term in terms)
+                for entry, restaurant in zip(entries, case['restaurants']):
+                    if any(mentions(review) for review in restaurant['recent_reviews']):
+                        assert entry['recent_reviews'] and mentions(entry['recent_reviews'][0]), \
+                            f'{entry["name"]}: the review matching {case["preferences"]} was not kept first'
+
+    print('OK: every restaurant list fits its budget')
+
+
+if __name__ == '__main__':
+    main()
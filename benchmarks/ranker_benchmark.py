@@ -0,0 +1,92 @@
+"""
+Latency and quality of the local RestaurantRanker on labelled Places results (find_restaurants output),
+compared with sorting by rating only and, optionally, with the LLM ranking (Assistant.generate_restaurant_suggestion).
+
+Every fixture line has the user's preferences, the restaurants with their reviews and the names of the restaurants
+which match the preferences. Quality is precision@3 (share of the top three picks which are relevant)
+and top-1 (the first suggestion is relevant).
+
+Usage (from the repository root):
+    python -m benchmarks.ranker_benchmark [--repeat 200]
+    python -m benchmarks.ranker_benchmark --llm    # also the LLM ranking, needs OPENAI_KEY
+"""
+import os
+import io
+import json
+import time
+import copy
+import yaml
+import argparse
+import contextlib
+
+from restaurant_ranker import RestaurantRanker
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'places_ranking.jsonl')
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def by_rating(restaurants, preferences):
+    ranked = sorted(restaurants, key=lambda restaurant: -restaurant['rating'])[:3]
+    return [{'restaurant_name': restaurant['name']} for restaurant in ranked]
+
+
+def evaluate(label, pick, cases, repeat):
+    """
+    :param pick: Function (restaurants, preferences) -> suggestions with restaurant_name
+    """
+    latencies, precision, top1 = [], 0.0, 0
+    for case in cases:
+        for _ in range(repeat):
+            restaurants = copy.deepcopy(case['restaurants'])
+            start = time.perf_counter()
+            picks = pick(restaurants, case['preferences']) or []
+            latencies.append(time.perf_counter() - start)
+
+        names = [suggestion.get('restaurant_name') for suggestion in picks[:3]]
+        relevant = set(case['relevant'])
+        precision += sum(name in relevant for name in names) / 3
+        top1 += bool(names) and names[0] in relevant
+
+    print(f'{label:8s} precision@3 {precision / len(cases):.2f}, top-1 {top1}/{len(cases)}, '
+          f'latency p50 {percentile(latencies, 50) * 1000:.3f} ms p95 {percentile(latencies, 95) * 1000:.3f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local restaurant ranker benchmark')
+    parser.add_argument('--fixture', default=FIXTURE)
+    parser.add_argument('--repeat', type=int, default=200, help='Local rankings per case, for stable latencies')
+    parser.add_argument('--llm', action='store_true', help='Also rank with the LLM (one request per case)')
+    args = parser.parse_args()
+
+    with open(args.fixture) as file:
+        cases = [json.loads(line) for line in file if line.strip()]
+
+    print(f'{len(cases)} cases, {sum(len(case["restaurants"]) for case in cases)} restaurants')
+    evaluate('rating', by_rating, cases, args.repeat)
+
+    ranker = RestaurantRanker()
+    evaluate('local', ranker.top_picks, cases, args.repeat)
+
+    if args.llm:
+        from assistant_nlu import Assistant
+
+        with open('intents.yaml', 'r') as file:
+            intents = yaml.safe_load(file)
+        assistant = Assistant(intents=intents, intent_categories=list(intents.keys()))
+
+        def llm_pick(restaurants, preferences):
+            with contextlib.redirect_stdout(io.StringIO()):
+                return assistant.generate_restaurant_suggestion(restaurants, preferences)
+
+        prompt_tokens = sum(len(assistant._suggestion_prompt(case['restaurants'], case['preferences']))
+                            for case in cases) / len(cases) / 4
+        evaluate('llm', llm_pick, cases, 1)
+        print(f'llm      ~{prompt_tokens:.0f} prompt tokens per ranking')
+
+
+if __name__ == '__main__':
+    main()
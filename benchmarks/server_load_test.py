@@ -0,0 +1,138 @@
+"""
+Load generator for the dialog server: simulated callers talk to one DialogServer over HTTP (text turns),
+with local stub LLM and Places servers behind it. Reports turn latency percentiles at increasing concurrency
+and checks that abandoned sessions are evicted.
+
+Usage (from the repository root):
+    python -m benchmarks.server_load_test --clients 1 4 16 64 --llm-delay 0.3
+"""
+import os
+import io
+import time
+import yaml
+import argparse
+import tempfile
+import threading
+import contextlib
+import requests
+
+from assistant_nlu import Assistant
+from places_client import PlacesClient
+from restaurant_ranker import RestaurantRanker
+from user_store import UserStore, WriteBehindPersister
+from dialog_engine import DialogEngine
+from dialog_server import DialogServer
+from benchmarks.stub_servers import make_places, places_server, chat_server
+from benchmarks.dialog_load_test import ANSWERS, DEFAULT_ANSWER
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def answer(prompts):
+    last_prompt = prompts[-1] if prompts else ''
+    for keywords, reply in ANSWERS:
+        if any(keyword in last_prompt for keyword in keywords):
+            return reply
+    return DEFAULT_ANSWER
+
+
+def converse(url, max_turns=40):
+    """
+    One caller from the greeting to the end of the dialog
+    :return: (turn latencies, booked)
+    """
+    http = requests.Session()
+    response = http.post(f'{url}/sessions').json()
+    session_id, latencies = response['session_id'], []
+
+    for _ in range(max_turns):
+        start = time.perf_counter()
+        reply = http.post(f'{url}/sessions/{session_id}/text', json={'text': answer(response['prompts'])})
+        latencies.append(time.perf_counter() - start)
+        reply.raise_for_status()
+        response = reply.json()
+        if response['finished']:
+            return latencies, response.get('booked') is not None
+
+    http.delete(f'{url}/sessions/{session_id}')
+    return latencies, False
+
+
+def run_clients(url, clients, conversations):
+    results, lock = [], threading.Lock()
+
+    def client():
+        for _ in range(conversations):
+            result = converse(url)
+            with lock:
+                results.append(result)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dialog server load generator')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--conversations', type=int, default=2, help='Conversations per client')
+    parser.add_argument('--llm-delay', type=float, default=0.3, help='Latency of the stub chat completions')
+    parser.add_argument('--places-delay', type=float, default=0.05, help='Latency of the stub Places requests')
+    parser.add_argument('--idle-timeout', type=float, default=2.0, help='Session idle timeout of the server')
+    parser.add_argument('--abandoned', type=int, default=8, help='Sessions opened and left, must be evicted')
+    args = parser.parse_args()
+
+    with open('intents.yaml', 'r') as file:
+        intents = yaml.safe_load(file)
+
+    with chat_server(delay=args.llm_delay) as chat, places_server(make_places(20), delay=args.places_delay) as places, \
+            tempfile.TemporaryDirectory() as workdir:
+        assistant = Assistant(intents=intents, intent_categories=list(intents.keys()), api_key='stub',
+                              base_url=f'{chat.url}/v1')
+        places_client = PlacesClient(api_key='stub', base_url=places.url, max_workers=32, total_deadline=30)
+        user_store = WriteBehindPersister(UserStore(os.path.join(workdir, 'user_store.sqlite')))
+        engine = DialogEngine(assistant, places_client, ranker=RestaurantRanker(), user_store=user_store)
+        server = DialogServer(engine, port=0, idle_timeout=args.idle_timeout)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            server.start()
+        try:
+            for clients in args.clients:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    wall, results = run_clients(server.url, clients, args.conversations)
+
+                latencies = [latency for turns, _ in results for latency in turns]
+                booked = sum(booked for _, booked in results)
+                print(f'{clients:3d} clients: {len(results) / wall:5.1f} conversations/s, {len(latencies)} turns, '
+                      f'turn latency p50 {percentile(latencies, 50) * 1000:.0f} ms '
+                      f'p95 {percentile(latencies, 95) * 1000:.0f} ms p99 {percentile(latencies, 99) * 1000:.0f} ms, '
+                      f'booked {booked}/{len(results)}')
+                assert booked == len(results), 'Not every conversation ended with a booking'
+
+            # Callers that hang up without ending the dialog
+            for _ in range(args.abandoned):
+                requests.post(f'{server.url}/sessions')
+            time.sleep(args.idle_timeout + max(1.0, args.idle_timeout / 4) + 0.5)
+            stats = requests.get(f'{server.url}/stats').json()
+            print(f'registry {stats}')
+            assert stats['evicted'] >= args.abandoned and stats['live'] == 0, 'Idle sessions were not evicted'
+            # Every finished turn analysis is counted once by the shared Assistant, none lost between threads
+            tiers = stats['nlu']['intent_tiers']
+            assert tiers['local_turns'] + tiers['llm_turns'] == stats['latency']['nlu.analyze_turn']['count'], \
+                'NLU tier counters lost updates'
+        finally:
+            with contextlib.redirect_stdout(io.StringIO()):
+                server.stop()
+                places_client.close()
+                user_store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Checks the local slot filling tier (SlotExtractor.resolve) on labelled replies: every reply it resolves must give
+the expected intent and slots, intent null marks replies that must go to the LLM (ex. "no nuts" after the
+dietary question is a restriction, not "no preference").
+
+Usage (from the repository root):
+    python -m benchmarks.slot_extractor_check
+"""
+import os
+import json
+import argparse
+
+from slot_extractor import SlotExtractor
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'slot_replies.jsonl')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local slot filling check')
+    parser.add_argument('--fixture', default=FIXTURE)
+    args = parser.parse_args()
+
+    with open(args.fixture) as file:
+        samples = [json.loads(line) for line in file if line.strip()]
+
+    extractor = SlotExtractor()
+    errors = []
+    answered = 0
+
+    for sample in samples:
+        resolved = extractor.resolve(sample['text'], sample['last_question'])
+        if resolved is None:
+            if sample['intent'] is not None:
+                errors.append((sample['text'], 'sent to the LLM', sample['intent']))
+            continue
+
+        answered += 1
+        intent, info, _ = resolved
+        expected = dict(SlotExtractor.empty_info(), **sample.get('slots', {}))
+        if sample['intent'] is None or intent != sample['intent'] or info != expected:
+            errors.append((sample['text'], (intent, {k: v for k, v in info.items() if v}), sample['intent']))
+
+    print(f'Samples:          {len(samples)}')
+    print(f'Resolved locally: {answered}')
+    for text, got, expected in errors:
+        print(f'  wrong: {text!r} -> {got}, expected {expected}')
+
+    assert not errors, f'{len(errors)} replies handled wrongly'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Checks that a speculative NLU call (DialogSession.speculate) is recomputed for the new dialog state:
+the state changes between the start of the call and result(), the call used must be the one for the new state.
+
+Usage (from the repository root):
+    python -m benchmarks.speculation_check
+"""
+import asyncio
+
+from dialog_engine import DialogSession
+
+
+class RecordingAssistant:
+    """Stands in for Assistant.aanalyze_turn, records the arguments of every call"""
+    def __init__(self):
+        self.calls = []
+
+    async def aanalyze_turn(self, query, last_question_type=None, expect_answer=False, metrics=None):
+        self.calls.append((query, last_question_type, expect_answer))
+        await asyncio.sleep(0.01)
+        return last_question_type, expect_answer
+
+
+async def check(pipelined):
+    assistant = RecordingAssistant()
+    session = DialogSession(assistant, places_client=None, io=None, pipelined=pipelined)
+    conversation_manager = session.conversation_manager
+
+    conversation_manager.last_question = 'get_location'
+    turn_call = session.speculate(lambda state: session.analyze_turn('old town', state))
+
+    # Ex. the first-time question confirmed a field while the call was running
+    conversation_manager.last_question = 'get_party_size'
+    conversation_manager.current_confirm_field = 'party_size'
+    result = await turn_call.result(session._state())
+
+    assert result == ('get_party_size', True), f'result for a stale state: {result}'
+    assert assistant.calls[-1] == ('old town', 'get_party_size', True), f'stale request: {assistant.calls[-1]}'
+    print(f'pipelined={pipelined}: requests {assistant.calls}')
+
+
+def main():
+    for pipelined in (True, False):
+        asyncio.run(check(pipelined))
+    print('OK: recomputed with the new state')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Startup cost of main.py: cold import of its modules, time to the first prompt and peak RSS per mode.
+Every measurement runs in a fresh interpreter; the OpenAI endpoints are local stubs.
+Modes that need missing packages or an audio device (voice: torch, sounddevice, pyaudio) are reported as unavailable.
+
+Usage (from the repository root):
+    python -m benchmarks.startup_benchmark [--runs 3] [--modes text text-no-warmup serve voice]
+"""
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import contextlib
+import tempfile
+import importlib.util
+import threading
+import subprocess
+
+from benchmarks.stub_servers import speech_server
+
+HEAVY_MODULES = ('openai', 'torch', 'transformers')
+
+# Flags of main.py, the output line that marks the first prompt and the packages the mode needs
+MODES = {
+    'text': ([], 'ASSISTANT:', ()),
+    'text-no-warmup': (['--no-warmup'], 'ASSISTANT:', ()),
+    'serve': (['--serve', '--port', '0'], 'dialog server listening', ()),
+    'voice': (['--no-debug'], 'Listening for user input', ('torch', 'transformers', 'sounddevice', 'pyaudio')),
+}
+
+IMPORT_SCRIPT = f"""
+import sys, time, json
+start = time.perf_counter()
+import main
+print(json.dumps({{'seconds': time.perf_counter() - start,
+                  'heavy': [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))
+"""
+
+
+def peak_rss_mb(pid):
+    """VmHWM of a running process (Linux), None elsewhere"""
+    try:
+        with open(f'/proc/{pid}/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def cold_import():
+    process = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT], capture_output=True, text=True)
+    if process.returncode != 0:
+        return None, process.stderr.strip().splitlines()[-1]
+    return json.loads(process.stdout.strip().splitlines()[-1]), None
+
+
+def first_prompt(flags, marker, workdir, env, timeout=60):
+    """
+    Start main.py and wait for the marker line
+    :return: (seconds, peak RSS in MB, None) or (None, None, last output line) if it exited or timed out
+    """
+    command = [sys.executable, 'main.py', *flags,
+               '--user-db', os.path.join(workdir, 'user_store.sqlite'),
+               '--llm-cache', os.path.join(workdir, 'llm_cache.sqlite'),
+               '--places-cache', os.path.join(workdir, 'places_cache.sqlite'),
+               '--tts-cache-dir', os.path.join(workdir, 'tts')]
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               text=True, env=env)
+    lines = queue.Queue()
+
+    def read():
+        for line in process.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    threading.Thread(target=read, daemon=True).start()
+    last_line = ''
+    try:
+        while True:
+            line = lines.get(timeout=max(0.0, timeout - (time.perf_counter() - start)))
+            if line is None:
+                return None, None, last_line
+            if marker in line:
+                return time.perf_counter() - start, peak_rss_mb(process.pid), None
+            last_line = line.strip() or last_line
+    except queue.Empty:
+        return None, None, f'no "{marker}" within {timeout} s'
+    finally:
+        process.kill()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='main.py startup benchmark')
+    parser.add_argument('--runs', type=int, default=3, help='Runs per mode, the median is reported')
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    parser.add_argument('--timeout', type=float, default=60, help='Max seconds to the first prompt')
+    args = parser.parse_args()
+
+    imports = []
+    for _ in range(args.runs):
+        result, error = cold_import()
+        if error:
+            print(f'cold import of main: failed ({error})')
+            break
+        imports.append(result)
+    if imports:
+        seconds = sorted(result['seconds'] for result in imports)[len(imports) // 2]
+        print(f'cold import of main: {seconds * 1000:.0f} ms, heavy modules loaded: {imports[0]["heavy"] or "none"}')
+
+    # Prewarm requests of killed processes end with connection resets, the stub's tracebacks are not shown
+    with speech_server(first_byte_delay=0.05) as speech, open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stderr(devnull):
+        env = dict(os.environ, PYTHONUNBUFFERED='1', OPENAI_KEY='stub', GOOGLE_KEY='stub',
+                   OPENAI_BASE_URL=f'{speech.url}/v1')
+
+        for mode in args.modes:
+            flags, marker, packages = MODES[mode]
+            missing = [package for package in packages if importlib.util.find_spec(package) is None]
+            if missing:
+                print(f'{mode:15s} unavailable: {", ".join(missing)} not installed')
+                continue
+
+            results = []
+            for _ in range(args.runs):
+                with tempfile.TemporaryDirectory() as workdir:
+                    seconds, rss, error = first_prompt(flags, marker, workdir, env, timeout=args.timeout)
+                if error:
+                    print(f'{mode:15s} unavailable: {error}')
+                    break
+                results.append((seconds, rss))
+            else:
+                results.sort()
+                seconds, rss = results[len(results) // 2]
+                rss = f'{rss:.0f} MB' if rss is not None else 'n/a'
+                print(f'{mode:15s} first prompt after {seconds * 1000:.0f} ms, peak RSS {rss}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+End-of-speech to final transcript latency: streaming STT vs transcribing the whole utterance at the end.
+Replays WAV files (16-bit PCM) in real time instead of using the microphone.
+
+Usage (from the repository root):
+    python -m benchmarks.stream_stt_benchmark benchmarks/audio/*.wav --model openai/whisper-tiny.en
+"""
+import time
+import argparse
+
+from speech_to_text import STT
+from audio_source import WavFileSource
+
+
+class TimedSource(WavFileSource):
+    """WavFileSource remembering when the last block was handed out"""
+    last_block_at = None
+
+    def __iter__(self):
+        for block in super().__iter__():
+            self.last_block_at = time.perf_counter()
+            yield block
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Streaming STT benchmark')
+    parser.add_argument('wav_files', nargs='+')
+    parser.add_argument('--model', default='openai/whisper-large-v3-turbo')
+    parser.add_argument('--step', type=float, default=1.0)
+    parser.add_argument('--segment', type=float, default=5.0)
+    args = parser.parse_args()
+
+    stt = STT(model_id=args.model)
+    stt.warm_up()  # model load and first-call overhead out of the measured latency
+
+    for path in args.wav_files:
+        source = TimedSource(path, realtime=True)
+
+        partials = 0
+        for hypothesis in stt.stream_transcribe(source, step_duration=args.step, segment_duration=args.segment):
+            partials += not hypothesis['final']
+        streaming_latency = time.perf_counter() - source.last_block_at
+
+        # Baseline: the whole utterance is transcribed after the end of speech
+        start = time.perf_counter()
+        batch_text = stt._transcribe(source.audio.copy())
+        batch_latency = time.perf_counter() - start
+
+        print(f'{path}: streaming {streaming_latency * 1000:.0f} ms ({partials} partials), '
+              f'batch {batch_latency * 1000:.0f} ms')
+        print(f'  streaming: {hypothesis["text"]}')
+        print(f'  batch:     {batch_text}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Throughput and latency of concurrent STT streams: one utterance at a time vs the micro-batching BatchWorker.
+Every stream transcribes its utterances back to back from its own thread, like dialog server sessions.
+The model is loaded once and shared by both configurations.
+
+Usage (from the repository root):
+    python -m benchmarks.stt_batch_benchmark --audio-dir benchmarks/audio --model small --streams 1 4 16 64
+"""
+import time
+import argparse
+import threading
+import numpy as np
+
+from speech_to_text import STT
+from audio_source import SAMPLE_RATE
+from benchmarks.stt_warmup_benchmark import utterances
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def run_streams(stt, streams, clips, per_stream):
+    """
+    :return: (wall seconds, per-utterance latencies, seconds of audio transcribed)
+    """
+    latencies, lock = [], threading.Lock()
+
+    def stream(offset):
+        for idx in range(per_stream):
+            # copy: transcribe normalizes in place
+            audio = clips[(offset + idx) % len(clips)].copy()
+            start = time.perf_counter()
+            stt.transcribe(audio)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=stream, args=(idx,)) for idx in range(streams)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    audio_seconds = sum(len(clips[(offset + idx) % len(clips)]) for offset in range(streams)
+                        for idx in range(per_stream)) / SAMPLE_RATE
+    return time.perf_counter() - start, latencies, audio_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batched multi-stream STT benchmark')
+    parser.add_argument('--audio-dir', default='benchmarks/audio')
+    parser.add_argument('--backend', default='transformers', choices=['transformers', 'onnx'])
+    parser.add_argument('--model', default='small')
+    parser.add_argument('--quantize', default=None, choices=['int8', 'float16'])
+    parser.add_argument('--streams', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--utterances', type=int, default=4, help='Utterances per stream')
+    parser.add_argument('--max-batch', type=int, default=16)
+    parser.add_argument('--batch-wait', type=float, default=0.02, help='Max seconds an utterance waits for a batch')
+    args = parser.parse_args()
+
+    clips = utterances(args.audio_dir, 16)
+    model = STT(model_id=args.model, backend=args.backend, quantize=args.quantize)
+    model.warm_up()
+
+    print(f'{"streams":>7} {"mode":10} {"utt/s":>7} {"x realtime":>10} {"p50 ms":>8} {"p95 ms":>8} {"mean batch":>10}')
+    for streams in args.streams:
+        for label, batch_size in (('serial', 1), ('batched', min(streams, args.max_batch))):
+            if label == 'batched' and batch_size == 1:
+                continue
+            stt = STT(model_id=args.model, batch_size=batch_size, max_batch_delay=args.batch_wait)
+            stt.backend = model.backend
+            if batch_size > 1:
+                stt.warm_up()
+
+            wall, latencies, audio_seconds = run_streams(stt, streams, clips, args.utterances)
+            stats = stt.batch_stats() or {'mean_batch': 1.0}
+            stt.close()
+            print(f'{streams:7d} {label:10} {len(latencies) / wall:7.1f} {audio_seconds / wall:10.1f} '
+                  f'{percentile(latencies, 50) * 1000:8.0f} {percentile(latencies, 95) * 1000:8.0f} '
+                  f'{stats["mean_batch"]:10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Real-time factor, peak RSS and word error rate of the STT backends on a fixed local audio set.
+
+The audio set is a directory of 16-bit PCM WAV files, each with a reference transcript next to it
+(sample.wav + sample.txt). Every configuration runs in its own process, so peak RSS is not shared.
+
+Usage (from the repository root):
+    python -m benchmarks.stt_benchmark --audio-dir benchmarks/audio \\
+        --config transformers:small: --config transformers:small:int8 --config ctranslate2:small:int8
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import resource
+import argparse
+import subprocess
+
+
+def word_error_rate(reference, hypothesis):
+    """
+    Word-level Levenshtein distance divided by the reference length
+    :param reference: Reference transcript
+    :param hypothesis: Model transcript
+    :return: WER
+    """
+    ref = re.findall(r"[a-z0-9']+", reference.lower())
+    hyp = re.findall(r"[a-z0-9']+", hypothesis.lower())
+
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+
+    return previous[-1] / max(1, len(ref))
+
+
+def run_config(config, audio_dir):
+    """Run a single backend configuration, print JSON results on the last line"""
+    from speech_to_text import STT
+    from audio_source import read_wav, SAMPLE_RATE
+
+    backend, model, quantize = config.split(':')
+
+    start = time.perf_counter()
+    stt = STT(model_id=model, backend=backend, quantize=quantize or None).load()
+    load_time = time.perf_counter() - start
+
+    audio_time = processing_time = 0.0
+    errors = []
+
+    for wav_path in sorted(glob.glob(os.path.join(audio_dir, '*.wav'))):
+        audio = read_wav(wav_path)
+        with open(wav_path[:-4] + '.txt') as file:
+            reference = file.read()
+
+        start = time.perf_counter()
+        hypothesis = stt.backend.transcribe(audio)
+        processing_time += time.perf_counter() - start
+        audio_time += len(audio) / SAMPLE_RATE
+
+        errors.append(word_error_rate(reference, hypothesis))
+
+    print(json.dumps({
+        'config': config,
+        'load_s': load_time,
+        'rtf': processing_time / max(audio_time, 1e-9),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'wer': sum(errors) / max(1, len(errors)),
+        'files': len(errors),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='STT backend benchmark')
+    parser.add_argument('--audio-dir', default=os.path.join(os.path.dirname(__file__), 'audio'))
+    parser.add_argument('--config', action='append', dest='configs',
+                        help='backend:model:quantization, ex. transformers:small:int8 (empty quantization = float32)')
+    parser.add_argument('--single', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_config(args.single, args.audio_dir)
+        return
+
+    configs = args.configs or ['transformers:small:', 'transformers:small:int8', 'ctranslate2:small:int8',
+                               'onnx:small:', 'onnx:small:int8']
+
+    print(f'{"config":35} {"load s":>8} {"RTF":>8} {"peak RSS MB":>12} {"WER":>8}')
+    for config in configs:
+        process = subprocess.run([sys.executable, '-m', 'benchmarks.stt_benchmark', '--single', config,
+                                  '--audio-dir', args.audio_dir], capture_output=True, text=True)
+        if process.returncode != 0:
+            print(f'{config:35} failed: {process.stderr.strip().splitlines()[-1:]}')
+            continue
+
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        print(f'{config:35} {result["load_s"]:8.1f} {result["rtf"]:8.3f} {result["peak_rss_mb"]:12.0f} '
+              f'{result["wer"]:8.3f}')
+
+
+if __name__ == '__main__':
+    main()
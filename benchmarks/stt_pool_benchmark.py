@@ -0,0 +1,60 @@
+"""
+Throughput scaling of the STT process pool (STTProcessPool) with the number of worker processes,
+against the in-process STT serving the same concurrent streams from threads.
+
+Usage (from the repository root):
+    python -m benchmarks.stt_pool_benchmark --audio-dir benchmarks/audio --model small --quantize int8 \\
+        --workers 1 2 4 8 --streams 16
+"""
+import time
+import argparse
+
+from speech_to_text import STT
+from stt_pool import STTProcessPool, available_cpus
+from benchmarks.stt_warmup_benchmark import utterances
+from benchmarks.stt_batch_benchmark import run_streams, percentile
+
+
+def report(label, wall, latencies, audio_seconds, baseline=None):
+    throughput = len(latencies) / wall
+    speedup = f'{throughput / baseline:7.2f}x' if baseline else f'{"":8}'
+    print(f'{label:24} {throughput:7.1f} {speedup} {audio_seconds / wall:10.1f} '
+          f'{percentile(latencies, 50) * 1000:8.0f} {percentile(latencies, 95) * 1000:8.0f}')
+    return throughput
+
+
+def main():
+    parser = argparse.ArgumentParser(description='STT process pool scaling benchmark')
+    parser.add_argument('--audio-dir', default='benchmarks/audio')
+    parser.add_argument('--backend', default='transformers', choices=['transformers', 'ctranslate2', 'onnx'])
+    parser.add_argument('--model', default='small')
+    parser.add_argument('--quantize', default=None, choices=['int8', 'float16'])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=None, help='Threads per worker, default: CPUs / workers')
+    parser.add_argument('--streams', type=int, default=16, help='Concurrent streams')
+    parser.add_argument('--utterances', type=int, default=4, help='Utterances per stream')
+    args = parser.parse_args()
+
+    clips = utterances(args.audio_dir, 16)
+    print(f'{len(available_cpus())} CPUs, {args.streams} streams x {args.utterances} utterances')
+    print(f'{"configuration":24} {"utt/s":>7} {"speedup":>8} {"x realtime":>10} {"p50 ms":>8} {"p95 ms":>8}')
+
+    stt = STT(model_id=args.model, backend=args.backend, quantize=args.quantize)
+    stt.warm_up()
+    baseline = report('in-process', *run_streams(stt, args.streams, clips, args.utterances))
+    stt.close()
+
+    for workers in args.workers:
+        pool = STTProcessPool(workers=workers, model_id=args.model, backend=args.backend, quantize=args.quantize,
+                              threads_per_worker=args.threads)
+        start = time.perf_counter()
+        pool.warm_up()
+        started = time.perf_counter() - start
+
+        report(f'{workers} processes', *run_streams(pool, args.streams, clips, args.utterances), baseline=baseline)
+        print(f'{"":24} started in {started:.1f} s, CPUs {pool.cpus}, per worker {pool.stats()["per_worker"]}')
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
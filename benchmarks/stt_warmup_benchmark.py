@@ -0,0 +1,98 @@
+"""
+First-utterance vs steady-state STT latency, with and without STT.warm_up, and the reuse of compiled/exported
+models (cache/stt artifacts) by the next process start.
+
+Every configuration gets a fresh artifact directory and three process starts:
+    cold      - nothing cached, no warm-up: the first utterance pays for kernel initialization (and compilation)
+    cached    - second start, compiled/exported artifacts are loaded from disk
+    warmed up - STT.warm_up on silence before the first utterance
+
+Usage (from the repository root):
+    python -m benchmarks.stt_warmup_benchmark --audio-dir benchmarks/audio \\
+        --config transformers:small: --config transformers:small::compile --config onnx:small:int8
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+STARTS = (('cold', False), ('cached', False), ('warmed up', True))
+
+
+def utterances(audio_dir, count):
+    """WAV files of the audio set, or noise bursts of 2-4 s when there are none"""
+    from audio_source import read_wav, SAMPLE_RATE
+
+    paths = sorted(glob.glob(os.path.join(audio_dir, '*.wav')))[:count]
+    if paths:
+        return [read_wav(path) for path in paths]
+
+    rng = np.random.default_rng(0)
+    return [(0.1 * rng.standard_normal(int(rng.uniform(2, 4) * SAMPLE_RATE))).astype(np.float32)
+            for _ in range(count)]
+
+
+def run_start(config, audio_dir, count, artifact_dir, warm_up):
+    """One process start, prints JSON results on the last line"""
+    from speech_to_text import STT
+
+    backend, model, quantize, *compile_model = config.split(':')
+    stt = STT(model_id=model, backend=backend, quantize=quantize or None,
+              compile_model=compile_model == ['compile'], artifact_dir=artifact_dir)
+
+    start = time.perf_counter()
+    stt.load()
+    load_time = time.perf_counter() - start
+
+    warmup_time = sum(stt.warm_up()) if warm_up else 0.0
+
+    latencies = []
+    for audio in utterances(audio_dir, count):
+        start = time.perf_counter()
+        stt.transcribe(audio)
+        latencies.append(time.perf_counter() - start)
+
+    print(json.dumps({'load_s': load_time, 'warmup_s': warmup_time, 'first_s': latencies[0],
+                      'steady_s': float(np.median(latencies[1:]))}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='STT warm-up and compiled model cache benchmark')
+    parser.add_argument('--audio-dir', default=os.path.join(os.path.dirname(__file__), 'audio'))
+    parser.add_argument('--utterances', type=int, default=6, help='Utterances per start, the first is timed apart')
+    parser.add_argument('--config', action='append', dest='configs',
+                        help='backend:model:quantization[:compile], ex. transformers:small::compile')
+    parser.add_argument('--single', nargs=3, metavar=('CONFIG', 'ARTIFACT_DIR', 'WARM_UP'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        config, artifact_dir, warm_up = args.single
+        run_start(config, args.audio_dir, args.utterances, artifact_dir, warm_up == '1')
+        return
+
+    configs = args.configs or ['transformers:small:', 'transformers:small::compile', 'onnx:small:int8']
+
+    print(f'{"config":32} {"start":10} {"load s":>7} {"warm-up s":>10} {"first ms":>9} {"steady ms":>10}')
+    for config in configs:
+        with tempfile.TemporaryDirectory() as artifact_dir:
+            for label, warm_up in STARTS:
+                process = subprocess.run([sys.executable, '-m', 'benchmarks.stt_warmup_benchmark',
+                                          '--audio-dir', args.audio_dir, '--utterances', str(args.utterances),
+                                          '--single', config, artifact_dir, '1' if warm_up else '0'],
+                                         capture_output=True, text=True)
+                if process.returncode != 0:
+                    print(f'{config:32} {label:10} failed: {process.stderr.strip().splitlines()[-1:]}')
+                    break
+
+                result = json.loads(process.stdout.strip().splitlines()[-1])
+                print(f'{config:32} {label:10} {result["load_s"]:7.1f} {result["warmup_s"]:10.2f} '
+                      f'{result["first_s"] * 1000:9.0f} {result["steady_s"] * 1000:10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""
+Local stub servers used by the benchmarks, so they can run without network access or API keys
+"""
+import re
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from slot_extractor import SlotExtractor, INTENT_BY_SLOT
+
+REVIEWS = [
+    "Great vegan options and friendly staff.",
+    "Best pasta in town, the carbonara is amazing.",
+    "Nice place, a bit noisy on weekends.",
+    "Good gluten-free menu, would come back.",
+    "Authentic Italian food, lovely tiramisu.",
+]
+
+
+def make_places(count=20):
+    """
+    Fake Places results
+    :param count: Number of places
+    :return: Dictionary place_id -> details
+    """
+    places = {}
+    for idx in range(count):
+        place_id = f'place-{idx}'
+        places[place_id] = {
+            "place_id": place_id,
+            "name": f'Restaurant {idx}',
+            "formatted_address": f'Street {idx}, Warsaw',
+            "rating": round(3.5 + (idx % 15) / 10, 1),
+            "reviews": [{"text": REVIEWS[(idx + r) % len(REVIEWS)]} for r in range(5)],
+        }
+    return places
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # the default backlog of 5 resets connections under load tests
+
+
+class StubServer:
+    """Runs a handler class on a background ThreadingHTTPServer"""
+    def __init__(self, handler_class):
+        self.httpd = _HTTPServer(('127.0.0.1', 0), handler_class)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def places_server(places, delay=0.05):
+    """
+    Stub of the Google Places text search and details endpoints
+    :param places: Dictionary from make_places
+    :param delay: Artificial latency in seconds added to every request
+    """
+    class PlacesHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        requests_served = 0
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(delay)
+            PlacesHandler.requests_served += 1
+
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+
+            if url.path.endswith('/textsearch/json'):
+                results = [{"place_id": p["place_id"], "rating": p["rating"]} for p in places.values()]
+                body = {"results": results, "status": "OK" if results else "ZERO_RESULTS"}
+            elif url.path.endswith('/details/json'):
+                place = places.get(query.get('place_id', [''])[0])
+                body = {"result": place, "status": "OK"} if place is not None else {"status": "NOT_FOUND"}
+            else:
+                self.send_error(404)
+                return
+
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return StubServer(PlacesHandler)
+
+
+def speech_server(first_byte_delay=0.2, seconds_per_char=0.002, bytes_per_char=1200):
+    """
+    Stub of the OpenAI /v1/audio/speech endpoint returning silent 24 kHz 16-bit PCM
+    :param first_byte_delay: Latency before the first byte
+    :param seconds_per_char: Extra synthesis time per character of input
+    :param bytes_per_char: PCM bytes returned per character (~25 ms of audio)
+    """
+    class SpeechHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        requests_served = 0
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            SpeechHandler.requests_served += 1
+            text = body.get('input', '')
+
+            time.sleep(first_byte_delay + seconds_per_char * len(text))
+
+            payload = bytes(len(text) * bytes_per_char)
+            self.send_response(200)
+            self.send_header('Content-Type', 'audio/pcm')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return StubServer(SpeechHandler)
+
+
+YES_WORDS = ('yes', 'yeah', 'sure', 'ok', 'correct', 'right')
+NO_WORDS = ('no', 'nope', 'wrong')
+
+
+def _stub_intent(query, extractor):
+    info, _ = extractor.extract(query)
+    intents = [INTENT_BY_SLOT[slot] for slot in INTENT_BY_SLOT if info[slot]]
+    intent = intents[0] if intents else 'confirm_details'
+
+    location = re.search(r'\bin (?:the )?(.+)$', query)
+    if location and not intents:
+        info['booking_location'] = location.group(1)
+        intent = 'get_location'
+    return {"intent": intent, "confidence": 0.95, "extracted_info": info}
+
+
+def _stub_chat_content(prompt, extractor):
+    """Canned answer for each of the Assistant prompts"""
+    if 'recognize if the sentence means' in prompt:
+        query = re.search(r'User query: (.*)', prompt).group(1).strip().lower()
+        return json.dumps({"response": query.startswith(YES_WORDS)})
+
+    if 'Fill every field of the JSON schema' in prompt:
+        query = re.search(r'User input: "(.*)"', prompt).group(1)
+        result = _stub_intent(query, extractor)
+        result['extracted_info']['party_size'] = result['extracted_info']['party_size'] or None
+        first_word = query.strip().lower()
+        result['answer'] = True if first_word.startswith(YES_WORDS) else False if first_word.startswith(NO_WORDS) else None
+        return json.dumps(result)
+
+    if 'intent recognition system' in prompt:
+        query = re.search(r'User input: "(.*)"', prompt).group(1)
+        return json.dumps(_stub_intent(query, extractor))
+
+    if 'preapre an API query' in prompt:
+        return 'Italian restaurant in Warsaw center'
+
+    if 'already selected for the user' in prompt:
+        picks = re.findall(r'^\s*\d+\. ([^,]+), rating', prompt, re.MULTILINE)
+        return json.dumps({"summaries": [f"{name} fits your preferences." for name in picks]})
+
+    if 'culinary advisor' in prompt:
+        names = re.findall(r"'name': '([^']*)'", prompt)[:3]
+        addresses = re.findall(r"'address': '([^']*)'", prompt)[:3]
+        ratings = re.findall(r"'rating': ([\d.]+)", prompt)[:3]
+        picks = [{"restaurant_name": name, "address": address, "rating": float(rating),
+                  "summary": "Great vegan options."} for name, address, rating in zip(names, addresses, ratings)]
+        return json.dumps({"top_picks": picks})
+
+    return '{}'
+
+
+def chat_server(delay=0.3):
+    """
+    Stub of the OpenAI /v1/chat/completions endpoint, answering the Assistant prompts with canned responses
+    :param delay: Artificial latency of every completion
+    """
+    extractor = SlotExtractor()
+
+    class ChatHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        requests_served = 0
+        prompt_tokens = 0  # estimated, ~4 characters per token, response_format schema included
+        lock = threading.Lock()
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            prompt = body['messages'][-1]['content']
+            prompt_tokens = (len(prompt) + len(json.dumps(body.get('response_format', {})))) // 4
+            with ChatHandler.lock:
+                ChatHandler.requests_served += 1
+                ChatHandler.prompt_tokens += prompt_tokens
+            time.sleep(delay)
+
+            content = _stub_chat_content(prompt, extractor)
+            payload = json.dumps({
+                "id": f'chatcmpl-{ChatHandler.requests_served}',
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get('model'),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                          "total_tokens": prompt_tokens + len(content) // 4},
+            }).encode()
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return StubServer(ChatHandler)
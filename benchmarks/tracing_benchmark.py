@@ -0,0 +1,90 @@
+"""
+Overhead of the latency tracing (tracing.py): cost of a span, a traced call and an annotation,
+with tracing on (histograms only, and with a session traced to a JSON lines file) and off.
+Compare with the stages it times: an LLM call or a Places request takes 50-1000 ms, an STT inference 100+ ms.
+
+Usage (from the repository root):
+    python -m benchmarks.tracing_benchmark [--calls 200000]
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+import tracing
+
+
+def per_call_us(function, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def measure(calls):
+    """Microseconds per call of every operation, minus the bare loop"""
+    def plain():
+        pass
+
+    @tracing.traced('bench.traced')
+    def traced():
+        pass
+
+    def span():
+        with tracing.span('bench.span'):
+            pass
+
+    def nested():
+        with tracing.span('bench.outer'):
+            with tracing.span('bench.inner', size=1):
+                tracing.annotate(tokens=10)
+
+    @tracing.traced('bench.async')
+    async def traced_async():
+        pass
+
+    async def run_async():
+        for _ in range(calls):
+            await traced_async()
+
+    baseline = per_call_us(plain, calls)
+    results = {name: per_call_us(function, calls) - baseline
+               for name, function in (('span', span), ('traced call', traced), ('2 nested spans + annotate', nested))}
+
+    start = time.perf_counter()
+    asyncio.run(run_async())
+    results['traced coroutine'] = (time.perf_counter() - start) / calls * 1e6 - baseline
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tracing overhead benchmark')
+    parser.add_argument('--calls', type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        trace_file = os.path.join(workdir, 'traces.jsonl')
+        configurations = {'off': {}, 'histograms': {'trace': False}, 'session trace': {'trace': True}}
+
+        columns = {}
+        for label, options in configurations.items():
+            tracing.configure(enabled=bool(options), trace_file=trace_file if options.get('trace') else None)
+            tracing.TRACER.reset()
+            session_id = tracing.start_session()
+            columns[label] = measure(args.calls)
+
+            start = time.perf_counter()
+            tracing.end_session(session_id)
+            if options.get('trace'):
+                print(f'session of {sum(h.count for h in tracing.TRACER.histograms.values())} spans written in '
+                      f'{time.perf_counter() - start:.2f} s, {os.path.getsize(trace_file) / 1e6:.0f} MB')
+
+    tracing.configure(enabled=True)
+    print(f'{"us per call":28}' + ''.join(f'{label:>15}' for label in columns))
+    for operation in columns['off']:
+        print(f'{operation:28}' + ''.join(f'{columns[label][operation]:15.2f}' for label in columns))
+
+
+if __name__ == '__main__':
+    main()
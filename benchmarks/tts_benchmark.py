@@ -0,0 +1,58 @@
+"""
+Time-to-first-audio and total time of TTS.generate_audio on multi-sentence texts (restaurant suggestions),
+sentence streaming vs one request for the whole text. Uses a local stub speech endpoint and a null audio sink
+which blocks for the playback time, like a real device.
+
+Usage (from the repository root):
+    python -m benchmarks.tts_benchmark
+"""
+import time
+import argparse
+
+from text_to_speech import TTS, NullSink
+from benchmarks.stub_servers import speech_server
+
+SUGGESTION = """
+Based on your preferences, I would like to suggest a booking in Trattoria Roma - a restaurant with 4.7 rating.
+The restaurant's address is Nowy Swiat 12, Warsaw. Guests praise the homemade pasta and the vegan options.
+It is a great match for an Italian dinner with friends.
+"""
+
+
+def whole_text(tts, text, voice='ash'):
+    """Previous behaviour: one request for the whole text"""
+    start = time.perf_counter()
+    first_audio = None
+    with tts._request(text, voice) as response:
+        for chunk in response.iter_bytes(1024):
+            if first_audio is None:
+                first_audio = time.perf_counter() - start
+            tts.sink.write(chunk)
+    return first_audio
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TTS time-to-first-audio benchmark')
+    parser.add_argument('--first-byte-delay', type=float, default=0.2)
+    parser.add_argument('--seconds-per-char', type=float, default=0.003)
+    args = parser.parse_args()
+
+    with speech_server(args.first_byte_delay, args.seconds_per_char) as server:
+        tts = TTS(sink=NullSink(realtime=True), base_url=f'{server.url}/v1', api_key='stub')
+
+        start = time.perf_counter()
+        baseline_ttfa = whole_text(tts, SUGGESTION)
+        baseline_total = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tts.generate_audio(SUGGESTION)
+        streaming_total = time.perf_counter() - start
+
+        tts.close()
+
+    print(f'Whole text:         first audio {baseline_ttfa * 1000:.0f} ms, total {baseline_total:.2f} s')
+    print(f'Sentence streaming: first audio {tts.time_to_first_audio * 1000:.0f} ms, total {streaming_total:.2f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+API calls, prompt tokens and latency per conversation: recognize_intent + recognize_answer_type per reply (before)
+vs one structured Assistant.analyze_turn call per reply (after), against the local stub chat completions server.
+
+Usage (from the repository root):
+    python -m benchmarks.turn_analysis_benchmark --llm-delay 0.3 [--local]
+"""
+import io
+import time
+import yaml
+import argparse
+import contextlib
+
+from assistant_nlu import Assistant
+from benchmarks.stub_servers import chat_server
+
+# (user reply, last question, the reply answers a confirmation prompt) - one full slot filling conversation
+CONVERSATION = [
+    ("Hi, I'd like to book a table", None, False),
+    ("My name is Anna", 'ask_name', False),
+    ("yes", 'ask_name', True),
+    ("I'm vegan", 'get_dietary_preferences', False),
+    ("yes that's right", 'get_dietary_preferences', True),
+    ("Italian please", 'get_cuisine_preferences', False),
+    ("correct", 'get_cuisine_preferences', True),
+    ("somewhere in the old town", 'get_location', False),
+    ("yes", 'get_location', True),
+    ("four of us", 'get_party_size', False),
+    ("no, five of us", 'get_party_size', True),
+    ("tomorrow at 7pm", 'get_date_time', False),
+    ("yes exactly", 'get_date_time', True),
+]
+
+
+def separate_calls(assistant, query, last_question, confirming):
+    intent, extracted_info, confidence = assistant.recognize_intent(query, last_question)
+    answer = assistant.recognize_answer_type(query) if confirming else None
+    return intent, answer
+
+
+def combined_call(assistant, query, last_question, confirming):
+    analysis = assistant.analyze_turn(query, last_question, expect_answer=confirming)
+    return analysis.intent, analysis.answer
+
+
+def run(chat, assistant, turn, conversations):
+    handler = chat.httpd.RequestHandlerClass
+    calls, tokens = handler.requests_served, handler.prompt_tokens
+
+    results = []
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(conversations):
+            results = [turn(assistant, *reply) for reply in CONVERSATION]
+    elapsed = (time.perf_counter() - start) / conversations
+
+    calls = (handler.requests_served - calls) / conversations
+    tokens = (handler.prompt_tokens - tokens) / conversations
+    return calls, tokens, elapsed, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Separate vs combined turn analysis')
+    parser.add_argument('--conversations', type=int, default=3)
+    parser.add_argument('--llm-delay', type=float, default=0.3, help='Latency of the stub chat completions')
+    parser.add_argument('--local', action='store_true', help='Keep the local slot/yes-no tiers in front of the LLM')
+    args = parser.parse_args()
+
+    with open('intents.yaml', 'r') as file:
+        intents = yaml.safe_load(file)
+
+    with chat_server(delay=args.llm_delay) as chat:
+        assistant = Assistant(intents=intents, intent_categories=list(intents.keys()), api_key='stub',
+                              base_url=f'{chat.url}/v1', local_answer_threshold=0.85 if args.local else None,
+                              local_slots=args.local)
+
+        before = run(chat, assistant, separate_calls, args.conversations)
+        after = run(chat, assistant, combined_call, args.conversations)
+
+    print(f'{len(CONVERSATION)} replies per conversation, {args.llm_delay * 1000:.0f} ms per LLM call')
+    for label, (calls, tokens, elapsed, _) in (('separate', before), ('combined', after)):
+        print(f'{label:9s} {calls:5.1f} API calls, {tokens:6.0f} prompt tokens, {elapsed:.2f} s per conversation')
+
+    # Same decisions from both paths
+    assert before[3] == after[3], f'Results differ: {before[3]} vs {after[3]}'
+    print('OK: same intents and yes/no answers')
+
+
+if __name__ == '__main__':
+    main()
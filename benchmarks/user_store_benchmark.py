@@ -0,0 +1,98 @@
+"""
+Returning-user lookup: scanning the old per-session files (user_data/{timestamp}-{hash}.sqlite) vs one indexed
+UserStore query, after importing the same files with migrate_user_data.
+
+Usage (from the repository root):
+    python -m benchmarks.user_store_benchmark --sessions 5000 --users 500
+"""
+import os
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+from user_store import UserStore, hash_name
+from migrate_user_data import migrate
+
+DIETS = ['vegan', 'vegetarian', 'No specific dietary preferences', 'gluten free']
+CUISINES = ['italian', 'japanese', 'georgian', 'No specific cuisine preferences']
+
+
+def write_session_file(directory, when, user_name, diet, cuisine):
+    """Same table and (column-shifted) INSERT as the old ConversationManager.save_user_data"""
+    path = os.path.join(directory, f'{when.strftime("%Y%m%d_%H%M%S")}-{hash_name(user_name)}.sqlite')
+    conn = sqlite3.connect(path)
+    conn.execute('''CREATE TABLE user_booking_data (user_name TEXT, dietary_preferences TEXT,
+                    culinary_preferences TEXT, party_size INTEGER, booking_date_time TEXT, booking_location TEXT,
+                    accuracy_evaluation FLOAT)''')
+    conn.execute('INSERT INTO user_booking_data VALUES (?, ?, ?, ?, ?, ?, ?)',
+                 (hash_name(user_name), 'friday 7pm', 'old town', 2, diet, cuisine, 1.0))
+    conn.commit()
+    conn.close()
+
+
+def scan_latest(directory, user_name):
+    """What the returning-user path would have to do with the old files: list, filter by hash, open the newest"""
+    suffix = f'-{hash_name(user_name)}.sqlite'
+    paths = sorted(name for name in os.listdir(directory) if name.endswith(suffix))
+    if not paths:
+        return None
+    conn = sqlite3.connect(os.path.join(directory, paths[-1]))
+    row = conn.execute('SELECT * FROM user_booking_data').fetchone()
+    conn.close()
+    return row[4], row[5]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='User store lookup benchmark')
+    parser.add_argument('--sessions', type=int, default=5000, help='Old session files')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    expected = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        legacy = os.path.join(workdir, 'user_data')
+        os.makedirs(legacy)
+
+        start = datetime(2024, 1, 1)
+        for idx in range(args.sessions):
+            user_name = f'user {rng.randrange(args.users)}'
+            diet, cuisine = rng.choice(DIETS), rng.choice(CUISINES)
+            write_session_file(legacy, start + timedelta(minutes=idx), user_name, diet, cuisine)
+            expected[user_name] = (diet, cuisine)
+
+        store = UserStore(os.path.join(workdir, 'user_store.sqlite'))
+        started = time.perf_counter()
+        files, inserted = migrate(store, legacy)
+        migration = time.perf_counter() - started
+        again = migrate(store, legacy)[1]
+
+        names = rng.choices(sorted(expected), k=args.lookups)
+
+        started = time.perf_counter()
+        for name in names:
+            assert scan_latest(legacy, name) == expected[name]
+        scan = (time.perf_counter() - started) / args.lookups
+
+        started = time.perf_counter()
+        for name in names:
+            latest = store.latest(name)
+            assert (latest['dietary_preferences'], latest['culinary_preferences']) == expected[name], latest
+        indexed = (time.perf_counter() - started) / args.lookups
+
+        plan = store._connection().execute('EXPLAIN QUERY PLAN SELECT * FROM bookings WHERE user_hash = ? '
+                                           'ORDER BY created_at DESC LIMIT 1', ('x',)).fetchall()
+        store.close()
+
+    print(f'migrated {inserted}/{files} session files in {migration:.2f} s, {again} inserted on a second run')
+    print(f'latest preferences: file scan {scan * 1000:.2f} ms, user store {indexed * 1000:.3f} ms per lookup')
+    print(f'query plan: {plan[0][-1]}')
+    assert again == 0 and 'idx_bookings_user_time' in plan[0][-1]
+
+
+if __name__ == '__main__':
+    main()
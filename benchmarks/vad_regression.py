@@ -0,0 +1,164 @@
+"""
+VAD regression suite on recorded WAV fixtures, compared with the old fixed RMS threshold (0.03 on 0.25 s blocks).
+
+Each fixture is a 16-bit PCM WAV with a label file next to it (name.wav + name.json):
+    {"speech": [1.20, 2.85]}   - start and end of speech in seconds
+    {"speech": null}           - noise only, must not trigger
+
+Checks per fixture: the onset is not clipped, end of speech is signalled within the tolerance,
+noise-only recordings never start an utterance. Exits with status 1 on any failure.
+
+Without fixtures in the --fixtures directory the synthetic set is generated into a temporary directory.
+
+Usage (from the repository root):
+    python -m benchmarks.vad_regression [--fixtures benchmarks/vad_fixtures]
+    python -m benchmarks.vad_regression --synthesize /tmp/vad_fixtures   # generate synthetic fixtures first
+"""
+import os
+import sys
+import glob
+import json
+import wave
+import argparse
+import tempfile
+import numpy as np
+
+from vad import VoiceActivityDetector
+from audio_source import read_wav, SAMPLE_RATE
+
+
+def run_vad(audio, block_size=320):
+    """
+    :return: (utterance start, end-of-speech time, utterance length) in seconds, None values if not triggered
+    """
+    vad = VoiceActivityDetector()
+    collected = 0
+    start = None
+
+    for offset in range(0, len(audio), block_size):
+        collected += sum(len(frame) for frame in vad.process(audio[offset:offset + block_size]))
+        if vad.speech_started.is_set() and start is None:
+            # the first returned frames are the pre-roll, ending at the current position
+            start = (offset + block_size) / SAMPLE_RATE - collected / SAMPLE_RATE
+        if vad.end_of_speech.is_set():
+            return start, (offset + block_size) / SAMPLE_RATE, collected / SAMPLE_RATE
+
+    return start, None, collected / SAMPLE_RATE
+
+
+def run_legacy(audio, block_size=4000, threshold=0.03, silent_blocks=2):
+    """The previous record_audio logic"""
+    start = None
+    silent = 0
+    collected = 0
+
+    for offset in range(0, len(audio), block_size):
+        block = audio[offset:offset + block_size]
+        loud = np.linalg.norm(block) / np.sqrt(len(block)) > threshold
+
+        if start is None:
+            if not loud:
+                continue
+            start = offset / SAMPLE_RATE
+
+        collected += len(block)
+        silent = 0 if loud else silent + 1
+        if silent >= silent_blocks:
+            return start, (offset + block_size) / SAMPLE_RATE, collected / SAMPLE_RATE
+
+    return start, None, collected / SAMPLE_RATE
+
+
+def synthesize(directory, seed=0):
+    """Write synthetic fixtures (harmonic 'voice' in white noise at several levels)"""
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    def write(name, audio, speech):
+        pcm = (np.clip(audio, -1, 1) * 32767).astype(np.int16)
+        with wave.open(os.path.join(directory, f'{name}.wav'), 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(SAMPLE_RATE)
+            wav.writeframes(pcm.tobytes())
+        with open(os.path.join(directory, f'{name}.json'), 'w') as file:
+            json.dump({'speech': speech}, file)
+
+    for noise_level in (0.001, 0.005, 0.02):
+        for voice_level in (0.02, 0.1):
+            lead, speech, tail = 1.0 + rng.random(), 1.0 + rng.random() * 2, 1.5
+            t = np.arange(int(speech * SAMPLE_RATE)) / SAMPLE_RATE
+            f0 = 100 + rng.random() * 120
+            voice = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 10))
+            voice *= voice_level * (0.4 + 0.6 * np.sin(2 * np.pi * 2.5 * t) ** 2)
+
+            audio = np.concatenate([np.zeros(int(lead * SAMPLE_RATE)), voice, np.zeros(int(tail * SAMPLE_RATE))])
+            audio += noise_level * rng.standard_normal(len(audio))
+            write(f'synthetic_n{noise_level}_v{voice_level}', audio, [lead, lead + speech])
+
+        noise = noise_level * 5 * rng.standard_normal(3 * SAMPLE_RATE)
+        write(f'synthetic_noise_only_{noise_level}', noise, None)
+
+
+def load_fixtures(directory):
+    """:return: (file name, speech label, audio) of every WAV fixture in the directory"""
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.wav'))):
+        with open(path[:-4] + '.json') as file:
+            label = json.load(file)['speech']
+        fixtures.append((os.path.basename(path), label, read_wav(path)))
+    return fixtures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='VAD regression suite')
+    parser.add_argument('--fixtures', default=os.path.join(os.path.dirname(__file__), 'vad_fixtures'))
+    parser.add_argument('--synthesize', metavar='DIR', help='Generate synthetic fixtures into DIR and use them')
+    parser.add_argument('--end-tolerance', type=float, default=0.8, help='Max seconds from end of speech to signal')
+    args = parser.parse_args()
+
+    if args.synthesize:
+        synthesize(args.synthesize)
+        args.fixtures = args.synthesize
+
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        print(f'SYSTEM: No fixtures in {args.fixtures}, running on the synthetic set')
+        with tempfile.TemporaryDirectory() as directory:
+            synthesize(directory)
+            fixtures = load_fixtures(directory)
+
+    failures = []
+    totals = {'vad': [0.0, 0.0], 'legacy': [0.0, 0.0]}  # end-of-turn latency, audio sent to Whisper
+
+    for name, label, audio in fixtures:
+        for detector, run in (('vad', run_vad), ('legacy', run_legacy)):
+            start, end, length = run(audio)
+
+            if label is None:
+                ok = start is None
+                detail = 'no trigger' if ok else f'false trigger at {start:.2f}s'
+            else:
+                latency = None if end is None else end - label[1]
+                ok = start is not None and start <= label[0] and latency is not None \
+                    and 0 <= latency <= args.end_tolerance
+                detail = f'start {start if start is None else round(start, 2)}s, ' \
+                         f'end latency {latency if latency is None else round(latency, 2)}s, audio {length:.2f}s'
+                if latency is not None:
+                    totals[detector][0] += latency
+                totals[detector][1] += length
+
+            print(f'{detector:7} {name:40} {"OK  " if ok else "FAIL"} {detail}')
+            if detector == 'vad' and not ok:
+                failures.append(name)
+
+    for detector, (latency, audio_seconds) in totals.items():
+        print(f'{detector}: total end-of-turn latency {latency:.2f}s, audio sent to Whisper {audio_seconds:.2f}s')
+
+    if failures:
+        print(f'{len(failures)} VAD regression(s): {failures}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,13 @@
-import os
-import sqlite3
-import hashlib
-from datetime import datetime
+# Slots the restaurant search depends on
+SEARCH_FIELDS = ('booking_location', 'culinary_preferences', 'dietary_preferences')
 
 class ConversationManager:
-    def __init__(self):
+    def __init__(self, user_store=None):
+        """
+        :param user_store: UserStore (or WriteBehindPersister) the booking details are saved to, shared by all sessions
+        """
+        self.user_store = user_store
+
         # User details
         self.user_name = None
         self.dietary_preferences = None
@@ -127,12 +130,13 @@ class ConversationManager:
             missing_info.append("get_dietary_preferences")
         if not self.culinary_preferences and 'culinary_preferences' not in self.no_preference_fields:
             missing_info.append("get_cuisine_preferences")
+        # Location before party size and time, so the restaurant search can be prefetched early
+        if not self.booking_location:
+            missing_info.append("get_location")
         if not self.party_size:
             missing_info.append("get_party_size")
         if not self.booking_date_time:
             missing_info.append("get_date_time")
-        if not self.booking_location:
-            missing_info.append("get_location")
 
         if missing_info:
             self.last_question = missing_info[0]
@@ -150,54 +154,55 @@ class ConversationManager:
             'culinary_preferences': self.culinary_preferences,
         }
 
-    def save_user_data(self):
-        assert self.user_name is not None, 'SYSTEM: No user name'
+    def search_details(self) -> dict:
+        """Confirmed slots the restaurant search depends on"""
+        return {field: getattr(self, field) for field in SEARCH_FIELDS if field in self.confirmed_fields}
 
-        data = self.return_details()
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    def search_ready(self) -> bool:
+        """Location and cuisine are confirmed, the search can start before the rest of the slots are filled"""
+        return {'booking_location', 'culinary_preferences'} <= self.confirmed_fields
 
-        # Hashmap for user's name storing
-        hashed_name = hashlib.sha256(self.user_name.encode()).hexdigest()
-        data['user_name'] = hashed_name
+    def restore_preferences(self, user_name, preferences):
+        """
+        Returning user: take the preferences of their latest booking as confirmed, only the date is asked again
+        :param user_name: Name the booking was found under
+        :param preferences: UserStore.latest result
+        """
+        self.user_name = user_name
+        self.confirmed_fields.add('name')
+
+        for field in ('dietary_preferences', 'culinary_preferences', 'booking_location', 'party_size'):
+            value = preferences.get(field)
+            if not value:
+                continue
+            setattr(self, field, value)
+            self.confirmed_fields.add(field)
+            if field in ('dietary_preferences', 'culinary_preferences') and value.startswith('No specific'):
+                self.no_preference_fields.add(field)
+
+    def user_record(self) -> dict:
+        """Booking details in the shape of UserStore.save"""
+        return {
+            'user_name': self.user_name,
+            'dietary_preferences': self.dietary_preferences,
+            'culinary_preferences': self.culinary_preferences,
+            'party_size': self.party_size,
+            'booking_date_time': self.booking_date_time,
+            'booking_location': self.booking_location,
+            'accuracy_evaluation': self.return_evaluation_accuracy(),
+        }
 
-        # Creates user_data directory if doesnt exist
-        os.makedirs("user_data", exist_ok=True)
+    def save_user_data(self):
+        assert self.user_name is not None, 'SYSTEM: No user name'
 
-        db_path = f"user_data/{timestamp}-{hashed_name}.sqlite"
+        if self.user_store is None:
+            print('SYSTEM: No user store, booking details not saved')
+            return
 
         try:
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-
-            # Create table
-            cursor.execute('''
-                CREATE TABLE user_booking_data (
-                    user_name TEXT,
-                    dietary_preferences TEXT,
-                    culinary_preferences TEXT,
-                    party_size INTEGER,
-                    booking_date_time TEXT,
-                    booking_location TEXT,
-                    accuracy_evaluation FLOAT
-                )
-                ''')
-
-            # Insert data
-            cursor.execute('''
-                    INSERT INTO user_booking_data VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                data['user_name'],
-                data['booking_time'],
-                data['booking_location'],
-                data['party_size'],
-                data['dietary_preferences'],
-                data['culinary_preferences'],
-                self.return_evaluation_accuracy()
-            ))
-
-            conn.commit()
-            conn.close()
-            print(f"Data saved to {db_path}")
+            # With a WriteBehindPersister this only queues the record, the search doesn't wait for the commit
+            self.user_store.save(self.user_record())
+            print(f"Data saved to {self.user_store.db_path}")
         except Exception as e:
             print(f"Error saving data: {e}")
 
@@ -0,0 +1,556 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+from converstaion_manager import ConversationManager
+
+ERROR_RESPONSE = 'ASSISTANT: I am sorry, there was a problem while processing your request. Please try again.'
+
+
+class ConsoleIO:
+    """Text session on stdin/stdout (debug mode)"""
+    async def say(self, text):
+        print(f'ASSISTANT: {text}')
+
+    async def listen(self, prompt='User: '):
+        return await asyncio.to_thread(input, prompt)
+
+
+class VoiceIO:
+    def __init__(self, stt, tts, stt_executor, stream=False):
+        """
+        Voice session: microphone + STT in, TTS out
+        :param stt: Shared STT instance
+        :param tts: TTS instance
+        :param stt_executor: Executor running the blocking recording and Whisper inference
+        :param stream: Transcribe while the user is speaking (partial hypotheses)
+        """
+        self.stt = stt
+        self.tts = tts
+        self.stt_executor = stt_executor
+        self.stream = stream
+
+    def _listen(self):
+        if not self.stream:
+            return self.stt.record_audio()
+
+        for hypothesis in self.stt.stream_transcribe():
+            if not hypothesis['final']:
+                print(f"USER (partial): {hypothesis['text']}")
+        return hypothesis['text']
+
+    async def say(self, text):
+        await asyncio.to_thread(self.tts.generate_audio, text)
+
+    async def listen(self, prompt=None):
+        print('Listening for user input...')
+        loop = asyncio.get_running_loop()
+        # The executor thread gets the session's trace context, so capture and inference are part of the turn
+        user_query = await loop.run_in_executor(self.stt_executor, tracing.in_context(self._listen))
+        print(f'USER: {user_query}')
+        return user_query
+
+
+class Speculation:
+    def __init__(self, make_call, state, start=True):
+        """
+        LLM/NLU request started before it is known whether its result will be used
+        :param make_call: Function from the dialog state to the coroutine of the request, the request must be
+            built from that argument only (not from locals captured earlier) so a recomputation uses the new state
+        :param state: Snapshot of the dialog state the request depends on
+        :param start: Start right away, otherwise the request runs on the first result() call
+        """
+        self.make_call = make_call
+        self.state = state
+        self.task = asyncio.ensure_future(make_call(state)) if start else None
+
+    async def result(self, state):
+        """
+        Result of the request, recomputed if the dialog state changed since it was started
+        :param state: Current dialog state
+        """
+        if self.task is None:
+            return await self.make_call(state)
+
+        if state != self.state:
+            self.cancel()
+            return await self.make_call(state)
+
+        return await self.task
+
+    def cancel(self):
+        """Drop the request, ex. the reply turned out not to need it"""
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+
+class SearchPrefetch:
+    def __init__(self, key, coro):
+        """
+        Restaurant search running in the background while the remaining slots are collected
+        :param key: Search slots the search was started with
+        :param coro: Coroutine returning the restaurants
+        """
+        self.key = key
+        self.started = time.perf_counter()
+        self.finished = None
+        self.task = asyncio.ensure_future(self._run(coro))
+
+    async def _run(self, coro):
+        try:
+            return await coro
+        finally:
+            self.finished = time.perf_counter()
+
+
+class DialogSession:
+    def __init__(self, assistant, places_client, io, debug=False, pipelined=True, prefetch=True, ranker=None,
+                 llm_summaries=False, user_store=None):
+        """
+        One conversation: slot filling, restaurant search and suggestions.
+        Everything specific to the caller lives here, the assistant and the places client are shared.
+        :param assistant: Shared Assistant (only its async, stateless methods are used)
+        :param places_client: Shared PlacesClient
+        :param io: ConsoleIO, VoiceIO or anything with async say(text) / listen(prompt)
+        :param debug: Print NLU tier metrics
+        :param pipelined: Keep computing while a prompt is spoken, and start NLU calls speculatively
+        :param prefetch: Start the restaurant search as soon as location and cuisine are confirmed
+        :param ranker: Shared RestaurantRanker picking the suggestions locally, None asks the LLM to pick them
+        :param llm_summaries: With a ranker, let the LLM write the summary sentence of the local picks
+        :param user_store: Shared UserStore, bookings are saved to it and returning users get their preferences back
+        """
+        self.assistant = assistant
+        self.places_client = places_client
+        self.io = io
+        self.debug = debug
+        self.pipelined = pipelined
+        self.ranker = ranker
+        self.llm_summaries = llm_summaries
+
+        self.user_store = user_store
+        self.conversation_manager = ConversationManager(user_store)
+        self.past_bookings = False  # preferences restored from the user's previous booking
+        self.booked = None  # accepted suggestion
+
+        self.playback = None  # task speaking the queued prompts, in order
+        # When the last user reply arrived: the turn latency is measured until the response is ready to be spoken
+        # (dialog.response) and until the dialog listens again (dialog.turn, the prompts spoken included)
+        self.reply_at = None
+        self.turn_started = None
+
+        self.turn_metrics = []  # this session's turns: which NLU tier answered and how long it took
+
+        self.prefetch_enabled = prefetch
+        self.prefetch = None
+        self.prefetch_stats = {'started': 0, 'invalidated': 0, 'used': 0, 'hidden_latency': 0.0}
+
+    def _state(self):
+        """What the NLU calls of a turn depend on"""
+        return self.conversation_manager.last_question, self.conversation_manager.current_confirm_field
+
+    def speculate(self, make_call):
+        """Speculation started with the current state, make_call gets the state the request is for"""
+        return Speculation(make_call, self._state(), start=self.pipelined)
+
+    def analyze_turn(self, user_query, state):
+        """
+        Coroutine of the NLU call of a reply
+        :param user_query: User reply
+        :param state: _state() the reply is analyzed in, the last question and the field being confirmed
+        """
+        last_question, confirm_field = state
+        return self.assistant.aanalyze_turn(user_query, last_question, expect_answer=confirm_field is not None,
+                                            metrics=self.turn_metrics)
+
+    async def say(self, text):
+        """
+        Queue the text for playback. In pipelined mode this returns straight away,
+        so the next question or LLM call is prepared while the current prompt is still being spoken.
+        """
+        if self.reply_at is not None:
+            # Time from the reply to the first response being ready to speak
+            tracing.record('dialog.response', time.perf_counter() - self.reply_at)
+            self.reply_at = None
+        previous = self.playback
+
+        async def play():
+            if previous is not None:
+                await previous
+            await self.io.say(text)
+
+        self.playback = asyncio.ensure_future(play())
+        if not self.pipelined:
+            await self.flush()
+
+    async def flush(self):
+        """Wait until everything queued is spoken"""
+        if self.playback is not None:
+            playback, self.playback = self.playback, None
+            await playback
+
+    async def listen(self, prompt='User: '):
+        # The user answers once the prompt was heard (the microphone must not pick up the TTS)
+        await self.flush()
+        if self.reply_at is not None:
+            # Nothing was said back, ex. a yes/no that only moves on to the next listen
+            tracing.record('dialog.response', time.perf_counter() - self.reply_at)
+            self.reply_at = None
+        if self.turn_started is not None:
+            tracing.record('dialog.turn', time.perf_counter() - self.turn_started)
+            self.turn_started = None
+
+        reply = await self.io.listen(prompt)
+
+        # Spans from here on (and the tasks started from them) belong to the next turn
+        tracing.next_turn()
+        self.reply_at = self.turn_started = time.perf_counter()
+        return reply
+
+    async def run(self):
+        try:
+            await self.collect_details()
+            await self.suggest_restaurants()
+            await self.flush()
+        finally:
+            if self.playback is not None:
+                self.playback.cancel()
+            if self.prefetch is not None:
+                self.prefetch.task.cancel()
+        return self.booked
+
+    async def search(self, search_details):
+        """Google query from the search slots, then the Places lookups"""
+        api_query = await self.assistant.agenerate_api_query(search_details)
+        return await self.places_client.afind_restaurants(api_query)
+
+    def update_prefetch(self):
+        """Start the background search once the search slots are confirmed, restart it when they change"""
+        conversation_manager = self.conversation_manager
+        search_details = conversation_manager.search_details()
+        key = tuple(sorted(search_details.items()))
+
+        if self.prefetch is not None:
+            if self.prefetch.key == key:
+                return
+            # Stale: a search slot was corrected or added
+            self.prefetch.task.cancel()
+            self.prefetch = None
+            self.prefetch_stats['invalidated'] += 1
+
+        if self.prefetch_enabled and conversation_manager.search_ready():
+            self.prefetch = SearchPrefetch(key, self.search(search_details))
+            self.prefetch_stats['started'] += 1
+
+    async def find_restaurants(self, search_details):
+        """
+        Restaurants for the search slots, from the prefetch when it was started with the same slots
+        :param search_details: Final search slots
+        """
+        prefetch, self.prefetch = self.prefetch, None
+
+        if prefetch is not None and prefetch.key == tuple(sorted(search_details.items())):
+            needed_at = time.perf_counter()
+            try:
+                restaurants = await prefetch.task
+            except Exception as e:
+                print(f'SYSTEM: Prefetched search failed: {e}')
+            else:
+                self.prefetch_stats['used'] += 1
+                self.prefetch_stats['hidden_latency'] += min(prefetch.finished, needed_at) - prefetch.started
+                return restaurants
+        elif prefetch is not None:
+            prefetch.task.cancel()
+            self.prefetch_stats['invalidated'] += 1
+
+        return await self.search(search_details)
+
+    async def collect_details(self):
+        assistant = self.assistant
+        conversation_manager = self.conversation_manager
+
+        # Greeting to the user opening the app
+        await self.say(assistant.generate_response('greetings'))
+
+        conversation_active = True
+
+        while conversation_active:
+            turn_call = None
+            try:
+                user_query = await self.listen()
+
+                # Intent, details and yes/no in one call. It depends only on the reply and the current state:
+                # started now, it runs while the first-time question below is spoken
+                recorded_turns = len(self.turn_metrics)
+                turn_call = self.speculate(lambda state: self.analyze_turn(user_query, state))
+
+                # Ask if first time using app
+                # If yes, ask if want to use the past recommendation
+                    # If yes jump straight to previous data
+                # If no continue
+                if conversation_manager.first_time_user_confiramtion is None:
+                    await self.say('Is this the first time you are using this application?')
+                    first_time_reply = await self.listen()
+
+                    if not await assistant.arecognize_answer_type(first_time_reply):
+                        conversation_manager.first_time_user_confiramtion = False
+
+                        await self.say('Would you like to use your previous recommendation?')
+                        reply = await self.listen()
+
+                        if await assistant.arecognize_answer_type(reply):
+                            self.past_bookings = await self.restore_preferences()
+                    else:
+                        conversation_manager.first_time_user_confiramtion = True
+
+                # Extracting information from user's input, last question gives the context (cuisine and diet)
+                analysis = await turn_call.result(self._state())
+                intent, extracted_info, confidence = analysis.intent_result()
+
+                # Nothing is recorded when every attempt failed
+                if self.debug and len(self.turn_metrics) > recorded_turns:
+                    metrics = self.turn_metrics[-1]
+                    print(f"SYSTEM: intent by {metrics['tier']} tier in {metrics['latency'] * 1000:.1f} ms, "
+                          f"saved {metrics['saved'] * 1000:.0f} ms")
+
+                # We fill the slot and then pass them for confirmation
+                confirmation_prompt = conversation_manager.extract_info(extracted_info)
+                if confirmation_prompt:
+                    await self.say(confirmation_prompt)
+                    continue
+
+                # Check if we're in confirmation mode first
+                if conversation_manager.current_confirm_field:
+                    confirmed = analysis.answer
+                    if confirmed is None:
+                        # Not a clear yes/no, or the reply wasn't expected to be one
+                        confirmed = await assistant.arecognize_answer_type(user_query)
+
+                    if confirmed:
+                        await self.say(conversation_manager.process_confirmation(True))
+                        conversation_manager.positive_responses += 1
+
+                        missing_info = conversation_manager.check_missing_info()
+                        if missing_info:
+                            await self.say(assistant.generate_response(missing_info[0]))
+                        else:
+                            print('ASSISTANT: I believe I have all information now')
+                            conversation_active = False
+                            await asyncio.to_thread(conversation_manager.save_user_data)
+                    else:
+                        await self.say(conversation_manager.process_confirmation(False))
+                        conversation_manager.negative_responses += 1
+                    continue
+
+                # Handle intents only if not in confirmation mode
+                elif intent == 'farewell':
+                    await self.say(assistant.generate_response('farewell'))
+                    break
+                elif intent == 'fallback':
+                    await self.say(assistant.generate_response('fallback'))
+                    continue
+                elif intent == 'greetings':
+                    await self.say(assistant.generate_response('greetings'))
+                    continue
+
+                # Check missing info and ask
+                missing_info = conversation_manager.check_missing_info()
+
+                if missing_info:
+                    await self.say(assistant.generate_response(missing_info[0]))
+                else:
+                    print('ASSISTANT: I believe I have all information now')
+                    conversation_active = False
+                    await asyncio.to_thread(conversation_manager.save_user_data)
+
+            except Exception as e:
+                print(f'ERROR:{type(e)}, {e}')
+                await self.say(ERROR_RESPONSE)
+            finally:
+                # The turn failed before the analysis was needed
+                if turn_call is not None:
+                    turn_call.cancel()
+                self.update_prefetch()
+
+        if self.debug:
+            print(f'SYSTEM: intent tiers {self.assistant.intent_metrics_summary(self.turn_metrics)}, '
+                  f"answer tiers {self.assistant.stats()['answer_tiers']}")
+
+    async def restore_preferences(self):
+        """
+        Returning user: ask for the name and take the preferences of the latest booking,
+        slot filling then only asks for what is missing (the date and time)
+        :return: True if a previous booking was found
+        """
+        if self.user_store is None:
+            return False
+
+        conversation_manager = self.conversation_manager
+
+        await self.say('What name did you use for your previous booking?')
+        reply = await self.listen()
+        analysis = await self.assistant.aanalyze_turn(reply, 'ask_name', metrics=self.turn_metrics)
+        user_name = (analysis.extracted_info.name or '').strip()
+        if not user_name:
+            # The whole reply ("it is under my name") is not a name to look up
+            await self.say("Sorry, I didn't catch your name, let's start from the beginning.")
+            return False
+
+        preferences = await asyncio.to_thread(self.user_store.latest, user_name)
+        if preferences is None:
+            await self.say("I couldn't find your previous booking, let's start from the beginning.")
+            return False
+
+        conversation_manager.restore_preferences(user_name, preferences)
+        await self.say(f'Welcome back, {user_name.title()}! I will use your previous preferences: '
+                       f'{conversation_manager.dietary_preferences}, {conversation_manager.culinary_preferences} '
+                       f'in {conversation_manager.booking_location}.')
+        return True
+
+    async def rank_restaurants(self, restaurants, details, user_preferences):
+        """
+        Top picks of the local ranker, the LLM only rewrites their summaries (if llm_summaries)
+        :return: Suggestions in the shape of Assistant.generate_restaurant_suggestion
+        """
+        picks = self.ranker.top_picks(restaurants, [details.get('dietary_preferences'),
+                                                    details.get('culinary_preferences')])
+
+        if self.llm_summaries and picks:
+            try:
+                summaries = await self.assistant.agenerate_pick_summaries(picks, user_preferences)
+            except Exception as e:
+                # the review sentences picked by the ranker are good enough
+                print(f'SYSTEM: Pick summaries failed: {e}')
+                summaries = None
+
+            for pick, summary in zip(picks, summaries or []):
+                pick['summary'] = summary
+
+        return picks
+
+    async def suggest_restaurants(self):
+        assistant = self.assistant
+
+        # The search below runs while this is spoken
+        await self.say('ASSISTANT: Please wait while I prepare the list of restaurants.')
+
+        # Get all user's details (a returning user's preferences were restored into the conversation manager)
+        details = self.conversation_manager.return_details()
+        user_preferences = [details['booking_location'], details['dietary_preferences'],
+                            details['culinary_preferences']]
+
+        # Based on user preferences, create query for Google search (only the search slots, so the prefetched
+        # results started with the same slots can be reused)
+        search_details = self.conversation_manager.search_details()
+        restaurants = await self.find_restaurants(search_details)
+
+        if self.debug:
+            print(f"SYSTEM: search prefetch {self.prefetch_stats}, "
+                  f"hidden latency {self.prefetch_stats['hidden_latency'] * 1000:.0f} ms")
+
+        if not restaurants:
+            await self.say('Sorry, I did not find any restaurants matching your preferences.')
+            return
+
+        # Based on the results prepare restaurant suggestions
+        if self.ranker is not None:
+            suggestions = await self.rank_restaurants(restaurants, details, user_preferences)
+        else:
+            suggestions = await assistant.agenerate_restaurant_suggestion(restaurants, user_preferences)
+
+        if not suggestions:
+            print('ASSISTANT: Sorry, I did not find any suggestions.')
+            return
+
+        for idx, suggestion in enumerate(suggestions):
+            print(suggestion)
+
+            restaurant_suggestion = f"""
+            Based on your preferences, I would like to suggest a booking in {suggestion['restaurant_name']} - a restaurant wit {suggestion['rating']} rating.
+            The restaurant's address is {suggestion['address']}.
+            {suggestion['summary']}
+            """
+            await self.say(restaurant_suggestion)
+
+            user_response = await self.listen('User (yes/no): ')
+
+            if await assistant.arecognize_answer_type(user_response):
+                # User confirmed this suggestion, complete the booking
+                booking_confirmation = f"Great! I've booked a table for {details['party_size']} at {suggestion['restaurant_name']} "
+                booking_confirmation += f"for {details['booking_time']}. You'll receive a confirmation shortly. "
+                booking_confirmation += "Thank you for using our restaurant booking service!"
+
+                await self.say(booking_confirmation)
+                self.booked = suggestion
+                return
+
+            # User rejected this suggestion
+            if idx < len(suggestions) - 1:
+                await self.say("Let me suggest another restaurant for you.")
+            else:
+                # This was the last suggestion
+                await self.say(
+                    "I'm sorry, I've run out of suggestions that match your preferences. Would you like to try with different criteria?")
+                return
+
+
+class DialogEngine:
+    def __init__(self, assistant, places_client, stt=None, tts=None, debug=False, stream_stt=False,
+                 pipelined=True, prefetch=True, ranker=None, llm_summaries=False, user_store=None):
+        """
+        Runs any number of concurrent dialog sessions on one asyncio event loop.
+        The Assistant, Places client and speech models are shared, every session has its own ConversationManager.
+        :param assistant: Assistant instance
+        :param places_client: PlacesClient instance
+        :param stt: STT instance, needed for voice sessions
+        :param tts: TTS instance, needed for voice sessions
+        :param debug: Print NLU tier metrics
+        :param stream_stt: Transcribe while the user is speaking
+        :param pipelined: Overlap LLM calls with TTS playback (see DialogSession)
+        :param prefetch: Search restaurants in the background once location and cuisine are confirmed
+        :param ranker: RestaurantRanker for local suggestions, None keeps the LLM ranking
+        :param llm_summaries: Let the LLM write the summaries of the local picks
+        :param user_store: UserStore with the users' previous bookings
+        """
+        self.assistant = assistant
+        self.places_client = places_client
+        self.stt = stt
+        self.tts = tts
+        self.debug = debug
+        self.stream_stt = stream_stt
+        self.pipelined = pipelined
+        self.prefetch = prefetch
+        self.ranker = ranker
+        self.llm_summaries = llm_summaries
+        self.user_store = user_store
+
+        # Whisper inference is blocking and the model is shared - off the event loop, one utterance at a time,
+        # or as many as the STT takes at once (batch worker, process pool)
+        self.stt_executor = ThreadPoolExecutor(max_workers=getattr(stt, 'concurrency', 1), thread_name_prefix='stt')
+
+    def voice_io(self):
+        assert self.stt is not None and self.tts is not None, 'Voice sessions need STT and TTS'
+        return VoiceIO(self.stt, self.tts, self.stt_executor, stream=self.stream_stt)
+
+    async def run_session(self, io, session_id=None):
+        """
+        Run one conversation to the end
+        :param io: Session input/output (ConsoleIO, VoiceIO, ...)
+        :param session_id: Id of the session in the latency trace, default: random
+        :return: Finished DialogSession
+        """
+        session = DialogSession(self.assistant, self.places_client, io, debug=self.debug,
+                                pipelined=self.pipelined, prefetch=self.prefetch, ranker=self.ranker,
+                                llm_summaries=self.llm_summaries, user_store=self.user_store)
+        session_id = tracing.start_session(session_id)
+        try:
+            with tracing.span('dialog.session'):
+                await session.run()
+        finally:
+            tracing.end_session(session_id)
+        return session
+
+    async def aclose(self):
+        await self.assistant.aclose()
+        await self.places_client.aclose()
+        self.stt_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,314 @@
+import re
+import json
+import time
+import uuid
+import base64
+import asyncio
+import threading
+import numpy as np
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import tracing
+
+SESSION_PATH = re.compile(r'^/sessions/([0-9a-f]{32})(?:/(text|audio))?$')
+
+
+class ServerIO:
+    def __init__(self):
+        """
+        Session input/output of the dialog server: prompts are collected for the HTTP response,
+        replies come from the turn requests
+        """
+        self.inbox = asyncio.Queue()
+        self.prompts = []
+        self.listening = asyncio.Event()  # the dialog waits for the next reply (or has ended)
+
+    async def say(self, text):
+        self.prompts.append(' '.join(text.split()))
+
+    async def listen(self, prompt=None):
+        self.listening.set()
+        return await self.inbox.get()
+
+    def take_prompts(self) -> list:
+        prompts, self.prompts = self.prompts, []
+        return prompts
+
+
+class ServerSession:
+    def __init__(self, session_id, io, task):
+        self.session_id = session_id
+        self.io = io
+        self.task = task
+        self.lock = asyncio.Lock()  # one turn at a time
+        self.audio_chunks = []  # audio received for the current utterance
+        self.last_active = time.monotonic()
+        self.turns = 0
+
+    @property
+    def finished(self):
+        return self.task.done()
+
+
+class SessionRegistry:
+    def __init__(self, engine, idle_timeout=300, max_sessions=1000):
+        """
+        Live dialog sessions of the server, all on the engine's event loop
+        :param engine: DialogEngine with the shared Assistant, Places client, STT and TTS
+        :param idle_timeout: Seconds without a request after which a session is dropped
+        :param max_sessions: Max live sessions, new ones are refused above it
+        """
+        self.engine = engine
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+
+        self.sessions = {}
+        self.stats = {'created': 0, 'finished': 0, 'evicted': 0, 'refused': 0}
+
+    async def _run(self, session_id, io):
+        try:
+            return await self.engine.run_session(io, session_id=session_id)
+        finally:
+            io.listening.set()  # wake up a turn waiting for the next prompt
+
+    async def _response(self, session, speech=False):
+        """Prompts since the last turn, once the dialog waits for the user again or has ended"""
+        await session.io.listening.wait()
+        prompts = session.io.take_prompts()
+        response = {'session_id': session.session_id, 'prompts': prompts, 'finished': session.finished}
+
+        if session.finished:
+            self.stats['finished'] += 1
+            self.sessions.pop(session.session_id, None)
+            dialog = None if session.task.cancelled() or session.task.exception() else session.task.result()
+            response['booked'] = dialog.booked if dialog is not None else None
+
+        if speech and prompts:
+            assert self.engine.tts is not None, 'Speech output needs TTS'
+            audio = await asyncio.to_thread(self.engine.tts.synthesize, ' '.join(prompts))
+            response['audio'] = base64.b64encode(audio).decode()
+        return response
+
+    async def create(self, speech=False):
+        """
+        Start a session
+        :return: Response with the session id and the greeting, None if the server is full
+        """
+        self.evict_idle()
+        if len(self.sessions) >= self.max_sessions:
+            self.stats['refused'] += 1
+            return None
+
+        session_id = uuid.uuid4().hex
+        io = ServerIO()
+        session = ServerSession(session_id, io, asyncio.create_task(self._run(session_id, io)))
+        self.sessions[session_id] = session
+        self.stats['created'] += 1
+
+        return await self._response(session, speech)
+
+    async def turn(self, session_id, text=None, audio=None, final=True, speech=False):
+        """
+        One user reply
+        :param text: Text reply
+        :param audio: Chunk of float32 16 kHz mono audio, chunks are joined until final
+        :param final: The chunk ends the utterance, it is transcribed and sent to the dialog
+        :param speech: Return the prompts as PCM audio too
+        :return: Response with the next prompts, None for an unknown (or evicted) session
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        session.last_active = time.monotonic()
+
+        async with session.lock:
+            response = {'session_id': session_id}
+            if audio is not None:
+                session.audio_chunks.append(audio)
+                if not final:
+                    return dict(response, buffered=sum(len(chunk) for chunk in session.audio_chunks))
+
+                assert self.engine.stt is not None, 'Audio turns need STT'
+                audio_data, session.audio_chunks = np.concatenate(session.audio_chunks), []
+                # The transcription is traced as part of the reply's turn of the session
+                tracing.bind_session(session_id, session.turns + 1)
+                loop = asyncio.get_running_loop()
+                text = await loop.run_in_executor(self.engine.stt_executor,
+                                                  tracing.in_context(self.engine.stt.transcribe), audio_data)
+                response['transcript'] = text
+
+            session.turns += 1
+            session.io.listening.clear()
+            session.io.inbox.put_nowait(text)
+            response.update(await self._response(session, speech))
+            session.last_active = time.monotonic()
+            return response
+
+    def close(self, session_id) -> bool:
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return False
+        session.task.cancel()
+        return True
+
+    def evict_idle(self):
+        """Drop the sessions nobody talked to for idle_timeout"""
+        now = time.monotonic()
+        for session_id, session in list(self.sessions.items()):
+            if now - session.last_active > self.idle_timeout and not session.lock.locked():
+                self.close(session_id)
+                self.stats['evicted'] += 1
+
+    async def evict_loop(self):
+        while True:
+            await asyncio.sleep(max(1.0, min(30.0, self.idle_timeout / 4)))
+            self.evict_idle()
+
+    def summary(self) -> dict:
+        return dict(self.stats, live=len(self.sessions))
+
+
+class DialogServer:
+    def __init__(self, engine, host='127.0.0.1', port=8080, idle_timeout=300, max_sessions=1000, turn_timeout=120):
+        """
+        HTTP front end of the dialog engine: many callers in one process, the models loaded once.
+        The sessions run on one asyncio loop (own thread), requests are handled by a ThreadingHTTPServer.
+
+        POST   /sessions                  start a session, returns its id and the greeting
+        POST   /sessions/<id>/text        {"text": "..."}, returns the next prompts
+        POST   /sessions/<id>/audio       float32 16 kHz mono PCM body, ?final=0 for a chunk of a longer utterance
+        DELETE /sessions/<id>             end a session
+        GET    /stats                     session registry counters, NLU tier and token counters,
+                                          per-stage latency (p50/p95/p99)
+        ?speech=1 on POST requests adds the prompts as base64 PCM (TTS) to the response.
+
+        :param engine: DialogEngine, sessions get its shared Assistant, Places client, STT and TTS
+        :param idle_timeout: Seconds without a request after which a session is dropped
+        :param max_sessions: Max live sessions
+        :param turn_timeout: Max seconds a request waits for the dialog
+        """
+        self.engine = engine
+        self.registry = SessionRegistry(engine, idle_timeout=idle_timeout, max_sessions=max_sessions)
+        self.turn_timeout = turn_timeout
+
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, name='dialog-loop', daemon=True)
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.http_thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def call(self, coro):
+        """Run a coroutine on the sessions' loop from a request thread"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout=self.turn_timeout)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self):
+                return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+            def do_GET(self):
+                if urlparse(self.path).path == '/stats':
+                    return self._send(200, dict(server.registry.summary(), nlu=server.engine.assistant.stats(),
+                                                latency=tracing.summary()))
+                self._send(404, {'error': 'not found'})
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                speech = query.get('speech', ['0'])[0] == '1'
+                body = self._body()
+
+                try:
+                    if url.path == '/sessions':
+                        response = server.call(server.registry.create(speech=speech))
+                        if response is None:
+                            return self._send(503, {'error': 'too many sessions'})
+                        return self._send(200, response)
+
+                    match = SESSION_PATH.match(url.path)
+                    if match is None or match.group(2) is None:
+                        return self._send(404, {'error': 'not found'})
+
+                    session_id, kind = match.groups()
+                    if kind == 'text':
+                        text = json.loads(body or b'{}').get('text', '')
+                        turn = server.registry.turn(session_id, text=text, speech=speech)
+                    else:
+                        final = query.get('final', ['1'])[0] != '0'
+                        audio = np.frombuffer(body, dtype=np.float32).copy()
+                        turn = server.registry.turn(session_id, audio=audio, final=final, speech=speech)
+
+                    response = server.call(turn)
+                    if response is None:
+                        return self._send(404, {'error': 'unknown or expired session'})
+                    self._send(200, response)
+                except Exception as e:
+                    print(f'ERROR: {type(e)}, {e}')
+                    self._send(500, {'error': str(e)})
+
+            def do_DELETE(self):
+                match = SESSION_PATH.match(urlparse(self.path).path)
+                if match is None or match.group(2) is not None:
+                    return self._send(404, {'error': 'not found'})
+                closed = server.call(self._close(match.group(1)))
+                self._send(200 if closed else 404, {'closed': closed})
+
+            @staticmethod
+            async def _close(session_id):
+                return server.registry.close(session_id)
+
+        return Handler
+
+    def start(self):
+        self.loop_thread.start()
+        asyncio.run_coroutine_threadsafe(self._start_eviction(), self.loop).result()
+        self.http_thread = threading.Thread(target=self.httpd.serve_forever, name='dialog-http', daemon=True)
+        self.http_thread.start()
+        print(f'SYSTEM: dialog server listening on {self.url}')
+        return self
+
+    async def _start_eviction(self):
+        self.eviction = asyncio.create_task(self.registry.evict_loop())
+
+    def serve_forever(self):
+        self.start()
+        try:
+            self.http_thread.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    async def _shutdown(self):
+        self.eviction.cancel()
+        for session_id in list(self.registry.sessions):
+            self.registry.close(session_id)
+        await self.engine.aclose()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(timeout=10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import functools
+import threading
+from collections import OrderedDict
+
+import tracing
+
+
+def normalize_inputs(value):
+    """
+    Canonical form of the method inputs: strings lowercased with collapsed whitespace, dictionaries sorted by key
+    :param value: Arguments of the memoized method
+    :return: JSON serializable value
+    """
+    if isinstance(value, str):
+        return ' '.join(value.split()).casefold()
+    if isinstance(value, dict):
+        return {str(key): normalize_inputs(item) for key, item in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (list, tuple)):
+        return [normalize_inputs(item) for item in value]
+    return value
+
+
+def cache_key(method, model, template_version, inputs) -> str:
+    payload = json.dumps([method, model, template_version, normalize_inputs(inputs)], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, max_entries=1024, db_path=None, ttl=24 * 3600):
+        """
+        Memoized Assistant responses: in-memory LRU, optionally backed by an SQLite table with a TTL,
+        so repeated searches skip the LLM across sessions and restarts
+        :param max_entries: Max number of responses kept in memory
+        :param db_path: Optional path of the on-disk tier
+        :param ttl: Time to live of the on-disk entries in seconds
+        """
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.ttl = ttl
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {}  # method -> {'hits', 'disk_hits', 'joined', 'misses'}
+
+        # Identical concurrent calls of the async dialog sessions wait for the first one
+        self.in_flight = {}
+
+        self._local = threading.local()
+        if db_path:
+            if os.path.dirname(db_path):
+                os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            self._connection().execute('''
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    method TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                ''')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, method, counter):
+        with self.lock:
+            counters = self.counters.setdefault(method, {'hits': 0, 'disk_hits': 0, 'joined': 0, 'misses': 0})
+            counters[counter] += 1
+
+    def _remember(self, key, value):
+        """Insert into the LRU. Caller holds the lock"""
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, method, key):
+        """
+        :return: Cached response or None
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                value = self.entries[key]
+            else:
+                value = None
+
+        if value is not None:
+            self._count(method, 'hits')
+            return value
+
+        if self.db_path:
+            row = self._connection().execute('SELECT value, created_at FROM llm_cache WHERE key = ?',
+                                             (key,)).fetchone()
+            if row is not None and time.time() - row[1] <= self.ttl:
+                value = json.loads(row[0])
+                with self.lock:
+                    self._remember(key, value)
+                self._count(method, 'disk_hits')
+                return value
+
+        self._count(method, 'misses')
+        return None
+
+    def set(self, method, key, value):
+        with self.lock:
+            self._remember(key, value)
+
+        if self.db_path:
+            now = time.time()
+            conn = self._connection()
+            try:
+                conn.execute('INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?)',
+                             (key, method, json.dumps(value), now))
+                conn.execute('DELETE FROM llm_cache WHERE created_at < ?', (now - self.ttl,))
+            except sqlite3.Error as e:
+                print(f'SYSTEM: LLM cache write failed: {e}')
+
+    def stats(self) -> dict:
+        """Hit/miss counters per memoized method"""
+        with self.lock:
+            return {
+                method: dict(counters, hit_rate=1 - counters['misses'] / max(1, sum(counters.values())))
+                for method, counters in self.counters.items()
+            }
+
+
+def memoized(method, template_version):
+    """
+    Memoize an Assistant method (sync or async) in assistant.llm_cache, if the method is in assistant.memoize.
+    The key covers the model, the prompt template version and the normalized arguments,
+    bump template_version whenever the prompt changes. None responses are not cached.
+    :param method: Name of the method in the cache and in Assistant(memoize=...)
+    :param template_version: Version of the prompt template
+    """
+    def decorator(function):
+        def cache_for(self):
+            if self.llm_cache is None or method not in self.memoize:
+                return None
+            return self.llm_cache
+
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(self, *args, **kwargs):
+                cache = cache_for(self)
+                if cache is None:
+                    return await function(self, *args, **kwargs)
+
+                key = cache_key(method, self.model, template_version, [args, kwargs])
+                if key in cache.in_flight:
+                    pending = cache.in_flight[key]
+                    try:
+                        value = await asyncio.shield(pending)
+                        cache._count(method, 'joined')
+                        tracing.annotate(cache='joined')
+                        return value
+                    except asyncio.CancelledError:
+                        if not pending.cancelled():
+                            raise
+                        # the first caller was cancelled (ex. a discarded prefetch), compute it here
+
+                value = await asyncio.to_thread(cache.get, method, key) if cache.db_path else cache.get(method, key)
+                if value is not None:
+                    tracing.annotate(cache='hit')
+                    return value
+
+                future = asyncio.get_running_loop().create_future()
+                cache.in_flight[key] = future
+                try:
+                    value = await function(self, *args, **kwargs)
+                    if value is not None and cache.db_path:
+                        await asyncio.to_thread(cache.set, method, key, value)
+                    elif value is not None:
+                        cache.set(method, key, value)
+                    future.set_result(value)
+                    return value
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as e:
+                    future.set_exception(e)
+                    future.exception()  # mark as retrieved, the waiters get it re-raised
+                    raise
+                finally:
+                    if cache.in_flight.get(key) is future:
+                        del cache.in_flight[key]
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            cache = cache_for(self)
+            if cache is None:
+                return function(self, *args, **kwargs)
+
+            key = cache_key(method, self.model, template_version, [args, kwargs])
+            value = cache.get(method, key)
+            if value is not None:
+                tracing.annotate(cache='hit')
+                return value
+
+            value = function(self, *args, **kwargs)
+            if value is not None:
+                cache.set(method, key, value)
+            return value
+
+        return wrapper
+
+    return decorator
@@ -1,299 +1,140 @@
-import os
 import yaml
-import requests
+import asyncio
 import argparse
+import threading
 
+import tracing
 from speech_to_text import STT
+from stt_pool import STTProcessPool
 from text_to_speech import TTS
 from assistant_nlu import Assistant
-from converstaion_manager import ConversationManager
+from dialog_engine import DialogEngine, ConsoleIO
+from dialog_server import DialogServer
+from places_client import PlacesClient
+from places_cache import PlacesCache
+from llm_cache import LLMCache
+from restaurant_ranker import RestaurantRanker
+from user_store import UserStore, WriteBehindPersister
+from tts_cache import PhraseAudioCache, intents_phrases
+
+# Fixed prompts spoken by the dialog loop, prewarmed in the TTS cache with the intents.yaml responses
+STATIC_PROMPTS = [
+    'Is this the first time you are using this application?',
+    'Would you like to use your previous recommendation?',
+    'Let me suggest another restaurant for you.',
+    'ASSISTANT: I am sorry, there was a problem while processing your request. Please try again.',
+    'ASSISTANT: Please wait while I prepare the list of restaurants.',
+]
+
+def in_background(target, name):
+    """Run a warm-up step in a daemon thread, a failure is only logged (the first real use raises again)"""
+    def run():
+        try:
+            target()
+        except Exception as e:
+            print(f'SYSTEM: {name} failed: {type(e).__name__}: {e}')
+
+    threading.Thread(target=run, name=name, daemon=True).start()
 
-GOOGLE_API_KEY = os.getenv('GOOGLE_KEY')
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Voice Assistant for Restaurant Booking')
     parser.add_argument('--no-debug', dest='debug', action='store_false',
                         help='Disable debug mode (debug is enabled by default)')
 
+    parser.add_argument('--places-workers', type=int, default=8,
+                        help='Max number of concurrent Google Place Details lookups')
+    parser.add_argument('--places-timeout', type=float, default=3.0,
+                        help='Timeout in seconds for a single Google Places request')
+    parser.add_argument('--places-deadline', type=float, default=6.0,
+                        help='Total time in seconds for collecting restaurant details')
+
+    parser.add_argument('--places-cache', default='cache/places_cache.sqlite',
+                        help='Path of the on-disk Google Places response cache')
+    parser.add_argument('--no-places-cache', dest='places_cache', action='store_const', const=None,
+                        help='Disable the Google Places response cache')
+
+    parser.add_argument('--llm-cache', default='cache/llm_cache.sqlite',
+                        help='Path of the on-disk tier of memoized LLM responses (search query, suggestions)')
+    parser.add_argument('--no-llm-cache', dest='llm_cache', action='store_const', const=None,
+                        help='Keep memoized LLM responses in memory only')
+
+    parser.add_argument('--user-db', default='user_data/user_store.sqlite',
+                        help='Database of the users\' bookings (python migrate_user_data.py imports the old files)')
+
+    parser.add_argument('--stream-stt', action='store_true',
+                        help='Transcribe while the user is speaking (partial hypotheses)')
+
+    parser.add_argument('--stt-backend', default='transformers', choices=['transformers', 'ctranslate2', 'onnx'],
+                        help='Speech-to-text inference engine')
+    parser.add_argument('--stt-model', default='large-v3-turbo',
+                        help='Whisper size (tiny, base, small, medium, large-v3, large-v3-turbo) or model id')
+    parser.add_argument('--stt-quantize', default=None, choices=['int8', 'float16'],
+                        help='Quantize the STT model (int8 for CPU, float16 for GPU)')
+    parser.add_argument('--stt-compile', action='store_true',
+                        help='torch.compile the STT model (transformers backend), the kernels are cached on disk')
+    parser.add_argument('--stt-artifacts', default='cache/stt',
+                        help='Directory of the compiled/exported STT models reused by the next start')
+    parser.add_argument('--stt-batch-size', type=int, default=1,
+                        help='Transcribe concurrent utterances (server sessions) in micro-batches of up to this size')
+    parser.add_argument('--stt-batch-wait', type=float, default=0.02,
+                        help='Max seconds an utterance waits for others to join its STT batch')
+    parser.add_argument('--stt-processes', type=int, default=0,
+                        help='Dialog server: transcribe in this many worker processes, each with its own model copy')
+    parser.add_argument('--stt-threads', type=int, default=None,
+                        help='Threads (pinned CPUs) per STT worker process, default: CPUs / processes')
+
+    parser.add_argument('--no-warmup', dest='warmup', action='store_false',
+                        help='Load the speech model and API clients on first use instead of warming them up '
+                             'in the background at start')
+
+    parser.add_argument('--no-pipeline', dest='pipeline', action='store_false',
+                        help='Wait for every prompt to be spoken before preparing the next step')
+
+    parser.add_argument('--no-prefetch', dest='prefetch', action='store_false',
+                        help='Search restaurants only after all details are collected')
+
+    parser.add_argument('--llm-ranking', dest='local_ranking', action='store_false',
+                        help='Let the LLM pick the suggestions instead of the local review/rating ranker')
+    parser.add_argument('--llm-summary', action='store_true',
+                        help='Let the LLM write the summary sentence of the locally ranked suggestions')
+    parser.add_argument('--suggestion-budget', type=int, default=1500,
+                        help='Max tokens of the restaurant list in the LLM suggestion prompt')
+
+    parser.add_argument('--tts-cache-dir', default='cache/tts',
+                        help='Directory of the synthesized phrases cache')
+    parser.add_argument('--tts-cache-mb', type=int, default=64,
+                        help='Max size of the synthesized phrases kept in memory')
+    parser.add_argument('--tts-disk-mb', type=int, default=512,
+                        help='Max size of the synthesized phrases kept on disk (least recently used are deleted)')
+
+    parser.add_argument('--trace-file', default=None,
+                        help='Append the per-session latency traces (one span per line, JSON) to this file')
+    parser.add_argument('--no-trace', dest='trace', action='store_false',
+                        help='Disable the latency tracing (per-stage p50/p95/p99 printed at exit, /stats of the server)')
+
+    parser.add_argument('--serve', action='store_true',
+                        help='Run the HTTP dialog server (many callers, text or audio turns) instead of one local session')
+    parser.add_argument('--host', default='127.0.0.1', help='Dialog server address')
+    parser.add_argument('--port', type=int, default=8080, help='Dialog server port')
+    parser.add_argument('--session-idle-timeout', type=float, default=300,
+                        help='Seconds without a request after which a server session is dropped')
+    parser.add_argument('--max-sessions', type=int, default=1000, help='Max live server sessions')
+
     parser.set_defaults(debug=True)
     return parser.parse_args()
 
 
-def find_restaurants(query) -> list:
-
-    text_search_url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
-
-    params = {
-        "query": query,
-        "type": "restaurant",
-        "key": GOOGLE_API_KEY
-    }
-
-    response = requests.get(text_search_url, params=params)
-
-    if response.status_code != 200:
-        print("Error:", response.status_code, response.text)
-        return []
-
-    places = response.json().get("results", [])
-    places_sorted = sorted(places, key=lambda x: x.get('rating', 0), reverse=True)
-
-    details_url = "https://maps.googleapis.com/maps/api/place/details/json"
-
-    results = []
-
-    for place in places_sorted:
-        place_id = place["place_id"]
-
-        details_params = {
-            "place_id": place_id,
-            "fields": "name,rating,formatted_address,review",
-            "key": GOOGLE_API_KEY
-        }
-
-        details_response = requests.get(details_url, params=details_params)
-
-        if details_response.status_code != 200:
-            continue
-
-        details = details_response.json().get("result", {})
-        name = details.get("name")
-        address = details.get("formatted_address")
-        rating = details.get("rating")
-        reviews = details.get("reviews", [])
-
-        # Process reviews
-        review_texts = []
-        matched_keywords = []
-
-        for review in reviews[:5]:
-            text = review.get('text', '')
-            review_texts.append(text)
-
-
-        restaurant_data = {
-            "name": name,
-            "address": address,
-            "rating": rating,
-            "recent_reviews": review_texts,
-            "matched_keywords": list(set(matched_keywords))  # avoid duplicates
-        }
-
-        results.append(restaurant_data)
-
-    return results
-
-
-def dialog_response(response):
-    if DEBUG:
-        print(f'ASSISTANT: {response}')
-    else:
-        tts.generate_audio(response)
-
-
-def main():
-    # Greeting to the user opening the app
-    greetings_response = assistant.generate_response('greetings')
-    dialog_response(greetings_response)
-
-    # "global" varaibles for the dialog
-    past_bookings = False
-    conversation_active = True
-
-    # MAIN dialog loop
-    while conversation_active:
-        try:
-            # User input
-            if DEBUG:
-                user_query = input('User: ')
-            else:
-                print('Listening for user input...')
-                user_query = stt.record_audio()
-                print(f'USER: {user_query}')
-
-            # Ask if first time using app
-            # If yes, ask if want to use the past recommendation
-                # If yes jump straight to previous data
-            # If no continue
-            if not conversation_manager.first_time_user_confiramtion:
-                dialog_response('Is this the first time you are using this application?')
-
-                if DEBUG:
-                    first_time_reply = input('User: ')
-                else:
-                    first_time_reply = stt.record_audio()
-
-                if not assistant.recognize_answer_type(first_time_reply):
-                    conversation_manager.first_time_user_confiramtion = False
-
-                    dialog_response('Would you like to use your previous recommendation?')
-
-                    if DEBUG:
-                        reply = input('User: ')
-                    else:
-                        reply = stt.record_audio()
-
-                    if assistant.recognize_answer_type(reply):
-                        past_bookings = True
-                        conversation_active = False
-                else:
-                    conversation_manager.first_time_user_confiramtion = True
-
-            # keep track of the last asked question (for cuisine and diet)
-            last_question = conversation_manager.last_question
-
-            # Extracting information from user's input
-            intent, extracted_info, confidence = assistant.recognize_intent(user_query, last_question)
-
-            # We fill the slot and then pass them for confirmation
-            # extract_info -> confirm_field
-            confirmation_prompt = conversation_manager.extract_info(extracted_info)
-            if confirmation_prompt:
-                dialog_response(confirmation_prompt)
-                continue
-
-            # Check if we're in confirmation mode first
-            if conversation_manager.current_confirm_field:
-                confirmed = assistant.recognize_answer_type(user_query)
-
-                if confirmed: # If user said yes
-                    response = conversation_manager.process_confirmation(True)
-
-                    # Add correct recognition
-                    conversation_manager.positive_responses += 1
-
-                    # print(response)
-                    dialog_response(response)
-                    missing_info = conversation_manager.check_missing_info()
-
-                    if missing_info:
-                        next_question = assistant.generate_response(missing_info[0])
-                        dialog_response(next_question)
-                    else:
-                        print('ASSISTANT: I believe I have all information now')
-                        # print(conversation_manager.return_details())
-                        conversation_active = False
-                        conversation_manager.save_user_data()
-                    continue
-
-                else: # if user said "no"
-                    response = conversation_manager.process_confirmation(False)
-
-                    # Add wrong
-                    conversation_manager.negative_responses += 1
-
-                    dialog_response(response)
-                    continue
-
-            # Handle intents only if not in confirmation mode
-            elif intent == 'farewell':
-                response = assistant.generate_response('farewell')
-                dialog_response(response)
-                conversation_active = False
-                break
-            elif intent == 'fallback':
-                response = assistant.generate_response('fallback')
-                dialog_response(response)
-                continue
-            elif intent == 'greetings':
-                response = assistant.generate_response('greetings')
-                dialog_response(response)
-                continue
-
-            # Check missing info and ask
-            missing_info = conversation_manager.check_missing_info()
-            # print(f'DEBUG Missing info: {missing_info}')
-
-            if missing_info:
-                response = assistant.generate_response(missing_info[0])
-                conversation_manager.last_question = missing_info[0]
-                dialog_response(response)
-            else:
-                print('ASSISTANT: I believe I have all information now')
-                # print(conversation_manager.return_details())
-                conversation_active = False
-                conversation_manager.save_user_data()
-
-        except Exception as e:
-            print(f'ERROR:{type(e)}, {e}')
-            response = f'ASSISTANT: I am sorry, there was a problem while processing your request. Please try again.'
-            dialog_response(response)
-
-
-    dialog_response('ASSISTANT: Please wait while I prepare the list of restaurants.')
-
-    # Get all user's details
-    details = {}
-    user_preferences = []
-
-    if not past_bookings:
-        details = conversation_manager.return_details()
-        user_preferences = [details['booking_location'], details['dietary_preferences'], details['culinary_preferences']]
-    else:
-        # TODO: Add part where we search in the past data
-        pass
-
-    # Based on user preferences, create query for Google search
-    api_query = assistant.generate_api_query(details)
-
-    # Create a query based on user's preferences
-    restaurants = find_restaurants(api_query)
-
-    # Based on the results prepare restaurant suggestions
-    suggestions = assistant.generate_restaurant_suggestion(restaurants, user_preferences)
-
-    if not suggestions:
-        print('ASSISTANT: Sorry, I did not find any suggestions.')
-        return
-
-    for idx, suggestion in enumerate(suggestions):
-        print(suggestion)
-
-        restaurant_suggestion = f"""
-        Based on your preferences, I would like to suggest a booking in {suggestion['restaurant_name']} - a restaurant wit {suggestion['rating']} rating.
-        The restaurant's address is {suggestion['address']}.
-        {suggestion['summary']}        
-        """
-
-        dialog_response(restaurant_suggestion)
-
-        if DEBUG:
-            user_response = input('User (yes/no): ')
-        else:
-            print('Listening for confirmation...')
-            user_response = stt.record_audio()
-            print(f'USER: {user_response}')
-
-        # Check if user confirms this suggestion
-        # yesses = ['yes', 'yeah', 'sure', 'ok', 'okay', 'book it', 'sounds good', 'perfect']
-        # nopes = ['no', 'nope', 'next', 'another', 'different', 'something else', 'pass']
-
-        confirmed = assistant.recognize_answer_type(user_response)
-
-        if confirmed:
-            # User confirmed this suggestion, complete the booking
-            booking_confirmation = f"Great! I've booked a table for {details['party_size']} at {suggestion['restaurant_name']} "
-            booking_confirmation += f"for {details['booking_date_time']}. You'll receive a confirmation shortly. "
-            booking_confirmation += "Thank you for using our restaurant booking service!"
-
-            dialog_response(booking_confirmation)
-            return  # end here
-
-        else:
-            # User rejected this suggestion
-            if idx < len(suggestions) - 1:
-                dialog_response("Let me suggest another restaurant for you.")
-            else:
-                # This was the last suggestion
-                dialog_response(
-                    "I'm sorry, I've run out of suggestions that match your preferences. Would you like to try with different criteria?")
-                return
-
-    # for suggestion in suggestions:
-    #     print('Restaurant: ', suggestion['restaurant_name'])
-    #     print('Address: ', suggestion['restaurant_address'])
-    #     print('Rating: ', suggestion['rating'])
-    #     print('Summary: ', suggestion['summary'])
+async def main(engine, io):
+    """
+    Run one conversation on the dialog engine
+    :param engine: DialogEngine with the shared assistant, places client and speech models
+    :param io: ConsoleIO (debug) or VoiceIO
+    """
+    try:
+        await engine.run_session(io)
+    finally:
+        await engine.aclose()
 
 if __name__ == '__main__':
     # For testing so I don't have to speak everytime
@@ -302,18 +143,45 @@ if __name__ == '__main__':
     args = parse_args()
     DEBUG = args.debug
 
-    DEBUG = False
-
     with open('intents.yaml', 'r') as file:
         intents = yaml.safe_load(file)
 
     intents_categories = list(intents.keys())
 
-    # Initialize all my classes
-    stt = STT()
-    tts = TTS()
-    assistant = Assistant(intents=intents, intent_categories=intents_categories)
-    conversation_manager = ConversationManager()
+    # Per-stage latency histograms are always kept (cheap), full traces only with --trace-file
+    tracing.configure(enabled=args.trace, trace_file=args.trace_file)
+
+    # Initialize all my classes - Whisper and the OpenAI clients are only loaded on first use,
+    # so the text mode starts without torch
+    if args.stt_processes:
+        # Service mode: audio is handed to worker processes through shared memory, no microphone
+        assert args.serve, '--stt-processes is only available for the dialog server (--serve)'
+        stt = STTProcessPool(workers=args.stt_processes, model_id=args.stt_model, backend=args.stt_backend,
+                             quantize=args.stt_quantize, artifact_dir=args.stt_artifacts,
+                             threads_per_worker=args.stt_threads)
+    else:
+        stt = STT(model_id=args.stt_model, backend=args.stt_backend, quantize=args.stt_quantize,
+                  compile_model=args.stt_compile, artifact_dir=args.stt_artifacts,
+                  batch_size=args.stt_batch_size, max_batch_delay=args.stt_batch_wait)
+    tts = TTS(cache=PhraseAudioCache(max_bytes=args.tts_cache_mb * 1024 * 1024, directory=args.tts_cache_dir,
+                                     max_disk_bytes=args.tts_disk_mb * 1024 * 1024))
+    assistant = Assistant(intents=intents, intent_categories=intents_categories,
+                          llm_cache=LLMCache(db_path=args.llm_cache), suggestion_budget=args.suggestion_budget)
+    if not DEBUG or args.serve:
+        # Static responses are synthesized in the background, so they play without a request later
+        threading.Thread(target=tts.prewarm, args=(intents_phrases(intents) + STATIC_PROMPTS,), daemon=True).start()
+        if args.warmup:
+            # The model loads and runs once on silence while the greeting is spoken,
+            # so the first utterance is transcribed at steady-state speed
+            in_background(stt.warm_up, 'STT warm-up')
+    if args.warmup:
+        in_background(assistant.warm_up, 'LLM client warm-up')
+    places_client = PlacesClient(
+        max_workers=args.places_workers,
+        request_timeout=args.places_timeout,
+        total_deadline=args.places_deadline,
+        cache=PlacesCache(args.places_cache) if args.places_cache else None
+    )
 
 
     # deets = {
@@ -327,6 +195,34 @@ if __name__ == '__main__':
     # assistant.generate_api_query(deets)
 
 
+    # Bookings are committed by a background writer, the dialog only queues them
+    user_store = WriteBehindPersister(UserStore(args.user_db))
+
     # Initialize the app
+    engine = DialogEngine(assistant, places_client, stt=stt, tts=tts, debug=DEBUG, stream_stt=args.stream_stt,
+                          pipelined=args.pipeline, prefetch=args.prefetch,
+                          ranker=RestaurantRanker() if args.local_ranking else None, llm_summaries=args.llm_summary,
+                          user_store=user_store)
+    if args.serve:
+        # One process, many callers: the sessions share the models loaded above
+        DialogServer(engine, host=args.host, port=args.port, idle_timeout=args.session_idle_timeout,
+                     max_sessions=args.max_sessions).serve_forever()
+    else:
+        io = ConsoleIO() if DEBUG else engine.voice_io()
+        asyncio.run(main(engine, io))
 
-    main()
\ No newline at end of file
+    user_store.close()
+    if DEBUG:
+        print(f'SYSTEM: LLM cache {assistant.llm_cache.stats()}')
+        print(f'SYSTEM: user store writer {user_store.stats()}')
+    else:
+        print(f'SYSTEM: TTS cache {tts.cache.stats()}')
+    if args.stt_processes:
+        print(f'SYSTEM: STT worker processes {stt.stats()}')
+    elif stt.batch_stats() is not None:
+        print(f'SYSTEM: STT batches {stt.batch_stats()}')
+    if args.trace:
+        print(f'SYSTEM: latency per stage\n{tracing.TRACER.format_summary()}')
+    stt.close()
+    tts.close()
+    places_client.close()
\ No newline at end of file
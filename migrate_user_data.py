@@ -0,0 +1,87 @@
+"""
+Import the per-conversation files written by the old ConversationManager.save_user_data
+(user_data/{timestamp}-{hashed name}.sqlite, one user_booking_data row each) into the central UserStore.
+
+Files already imported are skipped, so the tool can run again after new files appear.
+
+Usage (from the repository root):
+    python migrate_user_data.py [--source user_data] [--db user_data/user_store.sqlite] [--batch-size 500]
+"""
+import os
+import re
+import sqlite3
+import argparse
+from datetime import datetime
+
+from user_store import UserStore
+
+SESSION_FILE = re.compile(r'^(\d{8}_\d{6})-([0-9a-f]{64})\.sqlite$')
+
+
+def read_session_file(path):
+    """
+    :return: UserStore record of the file, None if it can't be read
+    """
+    timestamp, user_hash = SESSION_FILE.match(os.path.basename(path)).groups()
+    try:
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            row = conn.execute('SELECT * FROM user_booking_data LIMIT 1').fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f'SYSTEM: Skipping {path}: {e}')
+        return None
+
+    if row is None:
+        return None
+
+    # The old INSERT listed the values in a different order than the table columns:
+    # (name, booking time, location, party size, diet, cuisine, accuracy) went into
+    # (user_name, dietary_preferences, culinary_preferences, party_size, booking_date_time, booking_location, ...)
+    _, booking_date_time, booking_location, party_size, dietary_preferences, culinary_preferences, accuracy = row
+    return {
+        'user_hash': user_hash,
+        'created_at': datetime.strptime(timestamp, '%Y%m%d_%H%M%S').timestamp(),
+        'dietary_preferences': dietary_preferences,
+        'culinary_preferences': culinary_preferences,
+        'party_size': party_size,
+        'booking_date_time': booking_date_time,
+        'booking_location': booking_location,
+        'accuracy_evaluation': accuracy,
+        'source': os.path.basename(path),
+    }
+
+
+def migrate(store, source, batch_size=500):
+    """
+    :param store: UserStore to import into
+    :param source: Directory with the session files
+    :return: (files found, rows inserted)
+    """
+    paths = sorted(os.path.join(source, name) for name in os.listdir(source) if SESSION_FILE.match(name))
+
+    inserted = 0
+    for start in range(0, len(paths), batch_size):
+        records = [read_session_file(path) for path in paths[start:start + batch_size]]
+        inserted += store.save_many([record for record in records if record is not None])
+        print(f'SYSTEM: {min(start + batch_size, len(paths))}/{len(paths)} files read, {inserted} bookings imported')
+
+    return len(paths), inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import per-session user data files into the user store')
+    parser.add_argument('--source', default='user_data', help='Directory of the old session files')
+    parser.add_argument('--db', default='user_data/user_store.sqlite', help='User store database')
+    parser.add_argument('--batch-size', type=int, default=500, help='Files imported per transaction')
+    args = parser.parse_args()
+
+    store = UserStore(args.db)
+    files, inserted = migrate(store, args.source, args.batch_size)
+    print(f'SYSTEM: imported {inserted} of {files} session files, {store.count()} bookings in {args.db}')
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+from typing import Optional
+from pydantic import BaseModel, ConfigDict, ValidationInfo, field_validator
+
+
+class ExtractedInfo(BaseModel):
+    """Booking details found in one reply, empty string / None when not mentioned"""
+    model_config = ConfigDict(extra='forbid')
+
+    name: Optional[str]
+    dietary_preferences: Optional[str]
+    culinary_preferences: Optional[str]
+    party_size: Optional[int]
+    booking_date_time: Optional[str]
+    booking_location: Optional[str]
+
+    @classmethod
+    def empty(cls):
+        return cls(name='', dietary_preferences='', culinary_preferences='', party_size=None,
+                   booking_date_time='', booking_location='')
+
+    @field_validator('party_size', mode='before')
+    @classmethod
+    def empty_party_size(cls, value):
+        # The rule based extractor and older prompts use '' for "not mentioned"
+        return None if value == '' else value
+
+    @field_validator('party_size')
+    @classmethod
+    def positive_party_size(cls, value):
+        if value is not None and value < 1:
+            raise ValueError('party_size must be a positive number')
+        return value
+
+
+class TurnAnalysis(BaseModel):
+    """Everything the dialog needs from one user reply"""
+    model_config = ConfigDict(extra='forbid')
+
+    intent: str
+    confidence: float
+    extracted_info: ExtractedInfo
+    answer: Optional[bool]  # True for "yes", False for "no", None if the reply is neither
+
+    @field_validator('intent')
+    @classmethod
+    def known_intent(cls, value, info: ValidationInfo):
+        intents = (info.context or {}).get('intents')
+        if intents is not None and value not in intents:
+            raise ValueError(f'Unknown intent: {value}')
+        return value
+
+    @field_validator('confidence')
+    @classmethod
+    def confidence_range(cls, value):
+        if not 0 <= value <= 1:
+            raise ValueError('confidence must be between 0 and 1')
+        return value
+
+    def intent_result(self):
+        """Same shape as Assistant.recognize_intent: (intent, extracted_info dict, confidence)"""
+        return self.intent, self.extracted_info.model_dump(), self.confidence
+
+
+class AnswerType(BaseModel):
+    """Response of the yes/no prompt"""
+    response: bool
+
+
+def _compact(schema):
+    """Drop titles/descriptions and write nullable fields as type lists - the schema is sent with every call"""
+    if isinstance(schema, list):
+        return [_compact(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+
+    schema = {key: _compact(value) for key, value in schema.items() if key not in ('title', 'description')}
+
+    variants = schema.get('anyOf')
+    if variants and all(set(variant) == {'type'} for variant in variants):
+        schema['type'] = [variant['type'] for variant in schema.pop('anyOf')]
+    return schema
+
+
+def turn_analysis_format(intent_categories) -> dict:
+    """
+    Strict structured output response_format for TurnAnalysis, intent restricted to the known categories
+    https://platform.openai.com/docs/guides/structured-outputs
+    :param intent_categories: Intents from intents.yaml
+    """
+    schema = _compact(TurnAnalysis.model_json_schema())
+    schema['properties']['intent']['enum'] = list(intent_categories)
+
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": "turn_analysis", "strict": True, "schema": schema}
+    }
@@ -0,0 +1,189 @@
+import re
+import json
+import time
+import sqlite3
+import threading
+import os
+
+SEARCH = 'search'
+DETAILS = 'details'
+
+
+def normalize_query(query):
+    """
+    Normalize a search query, so trivially different phrasings share one cache entry
+    :param query: Raw query, ex. " Italian restaurant in  Warsaw center."
+    :return: Normalized query, ex. "italian restaurant in warsaw center"
+    """
+    query = re.sub(r'\s+', ' ', query.lower())
+    return query.strip(' .,!?"\'')
+
+
+class PlacesCache:
+    def __init__(self, db_path='cache/places_cache.sqlite', search_ttl=6 * 3600, details_ttl=24 * 3600,
+                 max_bytes=50 * 1024 * 1024, evict_batch=64):
+        """
+        On-disk TTL cache for Google Places responses, shared by all assistant processes on the host.
+        SQLite in WAL mode handles concurrent readers/writers from many processes.
+        :param db_path: Path of the cache database
+        :param search_ttl: Time to live of text search results in seconds
+        :param details_ttl: Time to live of place details in seconds
+        :param max_bytes: Max total size of cached responses, least recently used entries are evicted above it
+        :param evict_batch: Least recently used entries deleted per eviction statement
+        """
+        self.db_path = db_path
+        self.ttl = {SEARCH: search_ttl, DETAILS: details_ttl}
+        self.max_bytes = max_bytes
+        self.evict_batch = evict_batch
+
+        self.hits = {SEARCH: 0, DETAILS: 0}
+        self.misses = {SEARCH: 0, DETAILS: 0}
+        self._stats_lock = threading.Lock()
+
+        # sqlite connections can't be shared between threads, PlacesClient looks up details from a thread pool
+        self._local = threading.local()
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS places_cache (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (kind, key)
+            )
+            ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_places_cache_last_access ON places_cache (last_access)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_places_cache_created_at ON places_cache (kind, created_at)')
+
+        # Running total of the sizes, kept by triggers so writes don't sum the whole table.
+        # Created in the same transaction as the triggers (a database from before them starts from the sum)
+        conn.execute('CREATE TABLE IF NOT EXISTS places_cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), '
+                     'total INTEGER NOT NULL)')
+        conn.execute('INSERT OR IGNORE INTO places_cache_size SELECT 0, COALESCE(SUM(size), 0) FROM places_cache')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS places_cache_insert AFTER INSERT ON places_cache BEGIN
+                UPDATE places_cache_size SET total = total + NEW.size;
+            END
+            ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS places_cache_update AFTER UPDATE OF size ON places_cache BEGIN
+                UPDATE places_cache_size SET total = total + NEW.size - OLD.size;
+            END
+            ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS places_cache_delete AFTER DELETE ON places_cache BEGIN
+                UPDATE places_cache_size SET total = total - OLD.size;
+            END
+            ''')
+        conn.execute('COMMIT')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None -> autocommit, transactions are opened explicitly
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, counter, kind):
+        with self._stats_lock:
+            counter[kind] += 1
+
+    def get(self, kind, key):
+        """
+        Return cached value or None if missing/expired
+        :param kind: SEARCH or DETAILS
+        :param key: Normalized query or place_id
+        :return: Cached response
+        """
+        now = time.time()
+        conn = self._connection()
+
+        row = conn.execute('SELECT value, created_at FROM places_cache WHERE kind = ? AND key = ?',
+                           (kind, key)).fetchone()
+
+        if row is None or now - row[1] > self.ttl[kind]:
+            self._count(self.misses, kind)
+            return None
+
+        try:
+            conn.execute('UPDATE places_cache SET last_access = ? WHERE kind = ? AND key = ?', (now, kind, key))
+        except sqlite3.OperationalError:
+            pass  # another process holds the write lock, LRU order is best effort
+        self._count(self.hits, kind)
+        return json.loads(row[0])
+
+    def total_size(self) -> int:
+        """Bytes of the cached responses"""
+        return self._connection().execute('SELECT total FROM places_cache_size').fetchone()[0]
+
+    def set(self, kind, key, value):
+        """
+        Store a response and evict least recently used entries over the size limit.
+        Cost is independent of the table size: indexed expiry, the size total kept by triggers,
+        eviction in batches along the last_access index.
+        :param kind: SEARCH or DETAILS
+        :param key: Normalized query or place_id
+        :param value: JSON serializable response
+        """
+        now = time.time()
+        payload = json.dumps(value)
+        conn = self._connection()
+
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            # An upsert, not INSERT OR REPLACE: the replaced row would not fire the delete trigger
+            conn.execute('INSERT INTO places_cache VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (kind, key) DO UPDATE SET '
+                         'value = excluded.value, size = excluded.size, created_at = excluded.created_at, '
+                         'last_access = excluded.last_access', (kind, key, payload, len(payload), now, now))
+
+            # Expired entries go first, then the least recently used ones
+            conn.execute('DELETE FROM places_cache WHERE kind = ? AND created_at < ?',
+                         (SEARCH, now - self.ttl[SEARCH]))
+            conn.execute('DELETE FROM places_cache WHERE kind = ? AND created_at < ?',
+                         (DETAILS, now - self.ttl[DETAILS]))
+
+            while conn.execute('SELECT total FROM places_cache_size').fetchone()[0] > self.max_bytes:
+                deleted = conn.execute('DELETE FROM places_cache WHERE rowid IN (SELECT rowid FROM places_cache '
+                                       'ORDER BY last_access LIMIT ?)', (self.evict_batch,)).rowcount
+                if not deleted:
+                    break
+
+            conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            print(f'SYSTEM: Places cache write failed: {e}')
+
+    def get_search(self, query):
+        return self.get(SEARCH, normalize_query(query))
+
+    def set_search(self, query, places):
+        self.set(SEARCH, normalize_query(query), places)
+
+    def get_details(self, place_id):
+        return self.get(DETAILS, place_id)
+
+    def set_details(self, place_id, details):
+        self.set(DETAILS, place_id, details)
+
+    def stats(self) -> dict:
+        """Hit/miss counters of this process"""
+        with self._stats_lock:
+            return {
+                kind: {
+                    'hits': self.hits[kind],
+                    'misses': self.misses[kind],
+                    'hit_rate': self.hits[kind] / max(1, self.hits[kind] + self.misses[kind]),
+                }
+                for kind in (SEARCH, DETAILS)
+            }
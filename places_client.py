@@ -0,0 +1,341 @@
+import os
+import time
+import asyncio
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import tracing
+
+# https://developers.google.com/maps/documentation/places/web-service/search-text
+GOOGLE_API_KEY = os.getenv('GOOGLE_KEY')
+PLACES_BASE_URL = "https://maps.googleapis.com/maps/api/place"
+
+
+def response_status(response):
+    """
+    Body and status of a Places response. Google answers errors (REQUEST_DENIED, OVER_QUERY_LIMIT,
+    INVALID_REQUEST) with HTTP 200 as well, so only bodies with status 'OK' may be cached.
+    :param response: requests or httpx response
+    :return: (body or None, status), status 'INVALID_RESPONSE' for a body which is not a JSON object
+    """
+    if response.status_code != 200:
+        return None, f'HTTP {response.status_code}'
+    try:
+        body = response.json()
+    except ValueError:
+        # Ex. an HTML error page from a proxy, skipped like any other failed request
+        return None, 'INVALID_RESPONSE'
+    if not isinstance(body, dict):
+        return None, 'INVALID_RESPONSE'
+    return body, body.get('status')
+
+
+class PlacesClient:
+    def __init__(self, api_key=GOOGLE_API_KEY, base_url=PLACES_BASE_URL, max_workers=8,
+                 request_timeout=3.0, total_deadline=6.0, max_reviews=5, cache=None):
+        """
+        Google Places client sharing one keep-alive connection pool between all requests
+        :param api_key: Google Places API key
+        :param base_url: Places web service url (overridable for local stubs)
+        :param max_workers: Max number of concurrent Place Details lookups
+        :param request_timeout: Timeout in seconds for a single HTTP request
+        :param total_deadline: Time in seconds after which unfinished details lookups are dropped
+        :param max_reviews: Number of reviews kept per restaurant
+        :param cache: Optional PlacesCache consulted before every HTTP request
+        """
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.max_workers = max_workers
+        self.request_timeout = request_timeout
+        self.total_deadline = total_deadline
+        self.max_reviews = max_reviews
+        self.cache = cache
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='places')
+
+        # Pool of the asyncio dialog engine, created on first use inside the running event loop
+        self.async_session = None
+        self.async_limit = None
+
+    @tracing.traced('places.text_search')
+    def text_search(self, query) -> list:
+        """
+        Text search for restaurants matching the query
+        :param query: Search query, ex. "Italian restaurant in Warsaw center"
+        :return: List of places, sorted by rating
+        """
+        if self.cache is not None:
+            cached = self.cache.get_search(query)
+            if cached is not None:
+                tracing.annotate(cache='hit')
+                return cached
+
+        params = {
+            "query": query,
+            "type": "restaurant",
+            "key": self.api_key
+        }
+
+        response = self.session.get(f'{self.base_url}/textsearch/json', params=params,
+                                    timeout=self.request_timeout)
+
+        body, status = response_status(response)
+        tracing.annotate(status=status)
+        if status not in ('OK', 'ZERO_RESULTS'):
+            print("Error:", status, response.text)
+            return []
+
+        places = body.get("results", [])
+        places_sorted = sorted(places, key=lambda x: x.get('rating', 0), reverse=True)
+
+        if self.cache is not None and status == 'OK':
+            self.cache.set_search(query, places_sorted)
+
+        return places_sorted
+
+    @tracing.traced('places.details')
+    def place_details(self, place_id):
+        """
+        Fetch name, rating, address and reviews of a single place
+        :param place_id: Google place id
+        :return: Details dictionary or None if the request failed
+        """
+        if self.cache is not None:
+            cached = self.cache.get_details(place_id)
+            if cached is not None:
+                tracing.annotate(cache='hit')
+                return cached
+
+        details_params = {
+            "place_id": place_id,
+            "fields": "name,rating,formatted_address,review",
+            "key": self.api_key
+        }
+
+        response = self.session.get(f'{self.base_url}/details/json', params=details_params,
+                                    timeout=self.request_timeout)
+
+        body, status = response_status(response)
+        tracing.annotate(status=status)
+        if status != 'OK':
+            print(f'SYSTEM: Place details of {place_id} failed: {status}')
+            return None
+
+        details = body.get("result", {})
+
+        if self.cache is not None:
+            self.cache.set_details(place_id, details)
+
+        return details
+
+    def _restaurant_data(self, details):
+        reviews = details.get("reviews", [])
+
+        # Process reviews
+        review_texts = []
+        matched_keywords = []
+
+        for review in reviews[:self.max_reviews]:
+            text = review.get('text', '')
+            review_texts.append(text)
+
+        return {
+            "name": details.get("name"),
+            "address": details.get("formatted_address"),
+            "rating": details.get("rating"),
+            "recent_reviews": review_texts,
+            "matched_keywords": list(set(matched_keywords))  # avoid duplicates
+        }
+
+    def fetch_details(self, place_ids) -> list:
+        """
+        Fetch details for many places concurrently.
+        Lookups still running when the total deadline passes are dropped.
+        :param place_ids: Place ids, in the order the results should be returned
+        :return: List of details dictionaries (same order as place_ids, missing ones skipped)
+        """
+        deadline = time.monotonic() + self.total_deadline
+        # The lookups are traced as children of the caller's span
+        futures = {self.executor.submit(tracing.in_context(self.place_details), place_id): idx
+                   for idx, place_id in enumerate(place_ids)}
+
+        finished = {}
+        pending = set(futures)
+
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    details = future.result()
+                except requests.RequestException as e:
+                    print(f'SYSTEM: Place details request failed: {e}')
+                    continue
+
+                if details is not None:
+                    finished[futures[future]] = details
+
+        if pending:
+            print(f'SYSTEM: {len(pending)} place details lookups missed the deadline')
+            tracing.annotate(missed_deadline=len(pending))
+            for future in pending:
+                future.cancel()
+
+        return [finished[idx] for idx in sorted(finished)]
+
+    @tracing.traced('places.find_restaurants')
+    def find_restaurants(self, query) -> list:
+        """
+        Search restaurants for the query and collect their details
+        :param query: Search query
+        :return: List of restaurants (name, address, rating, reviews), sorted by rating
+        """
+        try:
+            places_sorted = self.text_search(query)
+        except requests.RequestException as e:
+            print(f'SYSTEM: Text search request failed: {e}')
+            return []
+
+        details = self.fetch_details([place["place_id"] for place in places_sorted])
+        tracing.annotate(restaurants=len(details))
+
+        return [self._restaurant_data(place_details) for place_details in details]
+
+    def _get_async_session(self):
+        if self.async_session is None:
+            self.async_session = httpx.AsyncClient(
+                timeout=self.request_timeout,
+                limits=httpx.Limits(max_connections=self.max_workers, max_keepalive_connections=self.max_workers)
+            )
+            self.async_limit = asyncio.Semaphore(self.max_workers)
+        return self.async_session
+
+    async def _aget(self, path, params):
+        session = self._get_async_session()
+        async with self.async_limit:
+            return await session.get(f'{self.base_url}/{path}', params=params)
+
+    @tracing.traced('places.text_search')
+    async def atext_search(self, query) -> list:
+        """Async version of text_search, the cache is read and written off the event loop"""
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get_search, query)
+            if cached is not None:
+                tracing.annotate(cache='hit')
+                return cached
+
+        params = {
+            "query": query,
+            "type": "restaurant",
+            "key": self.api_key
+        }
+
+        response = await self._aget('textsearch/json', params)
+
+        body, status = response_status(response)
+        tracing.annotate(status=status)
+        if status not in ('OK', 'ZERO_RESULTS'):
+            print("Error:", status, response.text)
+            return []
+
+        places = body.get("results", [])
+        places_sorted = sorted(places, key=lambda x: x.get('rating', 0), reverse=True)
+
+        if self.cache is not None and status == 'OK':
+            await asyncio.to_thread(self.cache.set_search, query, places_sorted)
+
+        return places_sorted
+
+    @tracing.traced('places.details')
+    async def aplace_details(self, place_id):
+        """Async version of place_details"""
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get_details, place_id)
+            if cached is not None:
+                tracing.annotate(cache='hit')
+                return cached
+
+        details_params = {
+            "place_id": place_id,
+            "fields": "name,rating,formatted_address,review",
+            "key": self.api_key
+        }
+
+        response = await self._aget('details/json', details_params)
+
+        body, status = response_status(response)
+        tracing.annotate(status=status)
+        if status != 'OK':
+            print(f'SYSTEM: Place details of {place_id} failed: {status}')
+            return None
+
+        details = body.get("result", {})
+
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.set_details, place_id, details)
+
+        return details
+
+    async def afetch_details(self, place_ids) -> list:
+        """
+        Async version of fetch_details: max_workers lookups in flight, the rest dropped at the total deadline
+        :param place_ids: Place ids, in the order the results should be returned
+        :return: List of details dictionaries (same order as place_ids, missing ones skipped)
+        """
+        tasks = [asyncio.ensure_future(self.aplace_details(place_id)) for place_id in place_ids]
+        if not tasks:
+            return []
+
+        done, pending = await asyncio.wait(tasks, timeout=self.total_deadline)
+
+        if pending:
+            print(f'SYSTEM: {len(pending)} place details lookups missed the deadline')
+            tracing.annotate(missed_deadline=len(pending))
+            for task in pending:
+                task.cancel()
+
+        results = []
+        for task in tasks:
+            if task not in done:
+                continue
+            try:
+                details = task.result()
+            except httpx.HTTPError as e:
+                print(f'SYSTEM: Place details request failed: {e}')
+                continue
+            if details is not None:
+                results.append(details)
+        return results
+
+    @tracing.traced('places.find_restaurants')
+    async def afind_restaurants(self, query) -> list:
+        """Async version of find_restaurants"""
+        try:
+            places_sorted = await self.atext_search(query)
+        except httpx.HTTPError as e:
+            print(f'SYSTEM: Text search request failed: {e}')
+            return []
+
+        details = await self.afetch_details([place["place_id"] for place in places_sorted])
+        tracing.annotate(restaurants=len(details))
+
+        return [self._restaurant_data(place_details) for place_details in details]
+
+    async def aclose(self):
+        if self.async_session is not None:
+            await self.async_session.aclose()
+            self.async_session = None
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
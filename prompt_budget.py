@@ -0,0 +1,164 @@
+import functools
+import tiktoken
+
+from restaurant_ranker import normalize_text, preference_terms
+
+CHARS_PER_TOKEN = 4  # estimate used when the tokenizer can't be loaded
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model):
+    """
+    tiktoken encoding of the model, loaded once per process
+    :return: Encoding, None if it is not available (the BPE file is downloaded on first use)
+    """
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # model name tiktoken doesn't know yet, the gpt-4o family encoding
+        return tiktoken.get_encoding('o200k_base')
+    except Exception as e:
+        print(f'SYSTEM: Could not load the tokenizer of {model} ({e}), estimating {CHARS_PER_TOKEN} characters per token')
+        return None
+
+
+def count_tokens(text, model='gpt-4o-mini') -> int:
+    encoding = get_encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text))
+
+
+def truncate_tokens(text, max_tokens, model='gpt-4o-mini') -> str:
+    """
+    Cut the text to max_tokens, at a word boundary, marking the cut with '...'
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return text
+
+    encoding = get_encoding(model)
+    keep = max_tokens - count_tokens('...', model)
+    if encoding is None:
+        cut = text[:keep * CHARS_PER_TOKEN]
+    else:
+        cut = encoding.decode(encoding.encode(text)[:keep])
+
+    # cutting at a word boundary and appending the marker can still merge into more tokens, remove words until it fits
+    words = cut.split(' ')
+    if len(words) > 1:
+        words.pop()
+    while True:
+        truncated = ' '.join(words).rstrip(' ,.;:') + '...'
+        if len(words) <= 1 or count_tokens(truncated, model) <= max_tokens:
+            return truncated
+        words.pop()
+
+
+def shingles(text, size=3) -> set:
+    """Word n-grams of the text, the words themselves for shorter texts"""
+    words = normalize_text(text).split()
+    if len(words) < size:
+        return set(words)
+    return {' '.join(words[idx:idx + size]) for idx in range(len(words) - size + 1)}
+
+
+def dedupe_reviews(reviews, threshold=0.8) -> list:
+    """
+    Drop near-identical reviews (copied text, the same review posted twice with small edits, ...)
+    :param threshold: Jaccard similarity of the word 3-grams above which a review is a duplicate of an earlier one
+    :return: Reviews without duplicates, first occurrence kept
+    """
+    kept, kept_shingles = [], []
+    for review in reviews:
+        current = shingles(review)
+        if not current:
+            continue
+        if any(len(current & other) / len(current | other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(review)
+        kept_shingles.append(current)
+    return kept
+
+
+def rank_reviews(reviews, terms) -> list:
+    """
+    Reviews mentioning more of the preference terms first, then the shorter ones, otherwise the original (recent) order
+    """
+    padded_terms = [f' {term} ' for term in terms]
+
+    def key(item):
+        idx, review = item
+        text = normalize_text(review)
+        return -sum(term in text for term in padded_terms), len(review), idx
+
+    return [review for _, review in sorted(enumerate(reviews), key=key)]
+
+
+class PromptBudget:
+    def __init__(self, max_tokens=1500, max_review_tokens=80, model='gpt-4o-mini'):
+        """
+        Fits the restaurant list of the suggestion prompt into a token budget
+        :param max_tokens: Tokens of the restaurant list in the prompt
+        :param max_review_tokens: Max tokens of a single review, longer ones are cut
+        :param model: Model whose tokenizer is used
+        """
+        self.max_tokens = max_tokens
+        self.max_review_tokens = max_review_tokens
+        self.model = model
+
+    def count(self, text) -> int:
+        return count_tokens(text, self.model)
+
+    def fit_restaurants(self, restaurants, preferences):
+        """
+        Restaurant list for the prompt: reviews deduplicated, ranked by the preference terms and cut to max_review_tokens,
+        then added round robin (best review of every restaurant first) while the list fits max_tokens.
+        Restaurants are dropped from the end only if even their name, address and rating don't fit.
+        :param restaurants: find_restaurants output
+        :param preferences: User preferences, used to rank the reviews
+        :return: (list of restaurant dictionaries, stats dictionary)
+        """
+        terms = preference_terms(preferences)
+
+        entries, candidates = [], []
+        for restaurant in restaurants:
+            entries.append({'name': restaurant.get('name'), 'address': restaurant.get('address'),
+                            'rating': restaurant.get('rating'), 'recent_reviews': []})
+            reviews = dedupe_reviews(restaurant.get('recent_reviews', []))
+            candidates.append([truncate_tokens(review, self.max_review_tokens, self.model)
+                               for review in rank_reviews(reviews, terms)])
+
+        total_reviews = sum(len(restaurant.get('recent_reviews', [])) for restaurant in restaurants)
+        deduplicated = total_reviews - sum(len(reviews) for reviews in candidates)
+
+        # every entry is written as repr(entry) joined with ', ' inside [ ]
+        used = 1 + sum(self.count(repr(entry)) + 1 for entry in entries)
+        while entries and used > self.max_tokens:
+            used -= self.count(repr(entries.pop())) + 1
+            candidates.pop()
+
+        # an added review costs its quoted text and the separator
+        rounds = max((len(reviews) for reviews in candidates), default=0)
+        for round_idx in range(rounds):
+            for entry, reviews in zip(entries, candidates):
+                if round_idx < len(reviews):
+                    cost = self.count(repr(reviews[round_idx])) + 1
+                    if used + cost <= self.max_tokens:
+                        entry['recent_reviews'].append(reviews[round_idx])
+                        used += cost
+
+        # the pieces are counted separately, check the joined text and drop the last reviews while it is over
+        tokens = self.count(repr(entries))
+        while tokens > self.max_tokens:
+            longest = max(entries, key=lambda entry: len(entry['recent_reviews']))
+            if not longest['recent_reviews']:
+                entries.pop()
+            else:
+                longest['recent_reviews'].pop()
+            tokens = self.count(repr(entries))
+
+        kept_reviews = sum(len(entry['recent_reviews']) for entry in entries)
+        stats = {'tokens': tokens, 'budget': self.max_tokens, 'restaurants': len(entries),
+                 'dropped_restaurants': len(restaurants) - len(entries), 'reviews': kept_reviews,
+                 'deduplicated': deduplicated, 'dropped_reviews': total_reviews - deduplicated - kept_reviews}
+        return entries, stats
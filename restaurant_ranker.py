@@ -0,0 +1,163 @@
+import re
+import numpy as np
+
+# Words reviewers use for a preference, the key is what the user says
+PREFERENCE_TERMS = {
+    'vegan': ['vegan', 'plant based', 'dairy free'],
+    'vegetarian': ['vegetarian', 'veggie', 'meat free', 'vegan'],
+    'gluten free': ['gluten free', 'celiac', 'coeliac', 'gluten'],
+    'halal': ['halal'],
+    'kosher': ['kosher'],
+    'lactose free': ['lactose free', 'dairy free'],
+    'pescatarian': ['pescatarian', 'fish', 'seafood'],
+    'italian': ['italian', 'pasta', 'pizza', 'risotto', 'carbonara', 'tiramisu', 'lasagna'],
+    'japanese': ['japanese', 'sushi', 'ramen', 'sashimi', 'tempura', 'izakaya'],
+    'indian': ['indian', 'curry', 'tandoori', 'naan', 'biryani', 'masala'],
+    'chinese': ['chinese', 'dim sum', 'dumplings', 'noodles', 'szechuan'],
+    'mexican': ['mexican', 'tacos', 'burrito', 'quesadilla', 'guacamole'],
+    'french': ['french', 'bistro', 'croissant', 'escargot', 'brasserie'],
+    'georgian': ['georgian', 'khachapuri', 'khinkali'],
+    'polish': ['polish', 'pierogi', 'zurek', 'bigos'],
+    'thai': ['thai', 'pad thai', 'green curry', 'tom yum'],
+    'greek': ['greek', 'gyros', 'souvlaki', 'moussaka'],
+    'seafood': ['seafood', 'fish', 'oysters', 'shrimp'],
+    'steak': ['steak', 'steakhouse', 'grill'],
+}
+
+# Words of a preference which say nothing about the food
+STOP_WORDS = {
+    'no', 'specific', 'preferences', 'preference', 'dietary', 'cuisine', 'food', 'options', 'option',
+    'restaurant', 'and', 'or', 'with', 'a', 'an', 'the', 'some', 'any', 'i', 'like', 'please', 'none',
+}
+NO_PREFERENCE = {'no_preference', 'no specific dietary preferences', 'no specific cuisine preferences'}
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def normalize_text(text):
+    """Lowercase, hyphens as spaces, single spaces, padded, so ' term ' matches whole words and phrases"""
+    text = re.sub(r'[^a-z0-9]+', ' ', (text or '').lower())
+    return f' {text.strip()} '
+
+
+def preference_terms(preferences) -> list:
+    """
+    Review terms for the user's preferences
+    :param preferences: Preference strings, ex. ['Vegan', 'Italian'] or ['No specific dietary preferences', 'Georgian']
+    :return: Terms to look for in the reviews, without duplicates
+    """
+    terms = []
+    for preference in preferences:
+        if not preference or preference.strip().lower() in NO_PREFERENCE:
+            continue
+
+        text = normalize_text(preference)
+        known = [key for key in PREFERENCE_TERMS if f' {key} ' in text]
+        for key in known:
+            terms.extend(PREFERENCE_TERMS[key])
+
+        # Words the lexicon doesn't know are searched as they are
+        covered = set(' '.join(known).split())
+        terms.extend(word for word in text.split() if word not in STOP_WORDS and word not in covered)
+
+    return list(dict.fromkeys(terms))
+
+
+class RestaurantRanker:
+    def __init__(self, relevance_weight=0.7, rating_weight=0.3, top_k=3):
+        """
+        Deterministic ranking of the Places results: TF-IDF of the preference terms in the reviews combined with rating
+        :param relevance_weight: Weight of the review relevance (normalized to 0-1 within the list)
+        :param rating_weight: Weight of the rating (1-5 mapped to 0-1)
+        :param top_k: Number of picks
+        """
+        self.relevance_weight = relevance_weight
+        self.rating_weight = rating_weight
+        self.top_k = top_k
+
+    @staticmethod
+    def term_counts(documents, terms) -> np.ndarray:
+        """
+        :param documents: Normalized review texts, one per restaurant
+        :param terms: Preference terms
+        :return: Matrix restaurants x terms with the number of occurrences
+        """
+        padded_terms = [f' {term} ' for term in terms]
+        return np.array([[document.count(term) for term in padded_terms] for document in documents],
+                        dtype=np.float64).reshape(len(documents), len(terms))
+
+    @staticmethod
+    def relevance(counts, lengths) -> np.ndarray:
+        """
+        TF-IDF score of every restaurant, scaled so the best one has 1
+        :param counts: term_counts matrix
+        :param lengths: Number of review words per restaurant
+        """
+        if counts.size == 0:
+            return np.zeros(len(counts))
+
+        tf = counts / np.maximum(lengths, 1)[:, None]
+        document_frequency = (counts > 0).sum(axis=0)
+        idf = np.log((1 + len(counts)) / (1 + document_frequency)) + 1
+
+        scores = (tf * idf).sum(axis=1)
+        best = scores.max()
+        return scores / best if best > 0 else scores
+
+    def rank(self, restaurants, preferences) -> list:
+        """
+        Score and sort the restaurants. The input dicts are left untouched (they may be cached by the Places client),
+        the returned ones are copies with matched_keywords filled in
+        :param restaurants: find_restaurants output
+        :param preferences: Dietary and cuisine preferences
+        :return: (score, restaurant) pairs, best first
+        """
+        terms = preference_terms(preferences)
+        documents = [normalize_text(' '.join(r.get('recent_reviews', []))) for r in restaurants]
+
+        counts = self.term_counts(documents, terms)
+        lengths = np.array([len(document.split()) for document in documents], dtype=np.float64)
+        ratings = np.array([r.get('rating') or 0 for r in restaurants], dtype=np.float64)
+
+        scores = (self.relevance_weight * self.relevance(counts, lengths) +
+                  self.rating_weight * np.clip((ratings - 1) / 4, 0, 1))
+
+        ranked = [dict(restaurant, matched_keywords=[term for term, count in zip(terms, row) if count > 0])
+                  for restaurant, row in zip(restaurants, counts)]
+
+        order = np.argsort(-scores, kind='stable')
+        return [(float(scores[idx]), ranked[idx]) for idx in order]
+
+    @staticmethod
+    def summary(restaurant) -> str:
+        """Review sentence mentioning most of the matched keywords, or the rating"""
+        keywords = restaurant.get('matched_keywords', [])
+        sentences = [s for review in restaurant.get('recent_reviews', []) for s in SENTENCE_END.split(review) if s]
+
+        best, best_matches = None, 0
+        for sentence in sentences:
+            text = normalize_text(sentence)
+            matches = sum(f' {keyword} ' in text for keyword in keywords)
+            if matches > best_matches:
+                best, best_matches = sentence, matches
+
+        if best is not None:
+            return f'Guests say: "{best.strip()}"'
+        return f'It is one of the best rated places nearby, with a {restaurant.get("rating")} rating.'
+
+    def top_picks(self, restaurants, preferences) -> list:
+        """
+        Top restaurants in the shape of Assistant.generate_restaurant_suggestion
+        :return: List of {restaurant_name, address, rating, summary, matched_keywords}
+        """
+        ranked = self.rank(restaurants, preferences)[:self.top_k]
+        return [
+            {
+                'restaurant_name': restaurant.get('name'),
+                'address': restaurant.get('address'),
+                'rating': restaurant.get('rating'),
+                'summary': self.summary(restaurant),
+                'matched_keywords': restaurant.get('matched_keywords', []),
+            }
+            for _, restaurant in ranked
+        ]
@@ -0,0 +1,254 @@
+import re
+
+from answer_classifier import AnswerClassifier, YES_PHRASES, NO_PHRASES, NEGATIONS, tokenize
+
+NUMBERS = {
+    'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7, 'eight': 8, 'nine': 9,
+    'ten': 10, 'eleven': 11, 'twelve': 12, 'a couple': 2, 'a couple of': 2, 'couple': 2,
+}
+NUMBER = r'(\d{1,2}|' + '|'.join(sorted(NUMBERS, key=len, reverse=True)) + r')'
+
+DIETS = {
+    'vegan': 'vegan', 'vegetarian': 'vegetarian', 'veggie': 'vegetarian', 'pescatarian': 'pescatarian',
+    'gluten free': 'gluten-free', 'gluten-free': 'gluten-free', 'celiac': 'gluten-free',
+    'lactose free': 'lactose-free', 'lactose-free': 'lactose-free', 'dairy free': 'dairy-free',
+    'dairy-free': 'dairy-free', 'halal': 'halal', 'kosher': 'kosher', 'keto': 'keto',
+    'nut allergy': 'nut allergy', 'nut-free': 'nut allergy', 'low carb': 'low carb',
+}
+CUISINES = {
+    'italian', 'japanese', 'indian', 'chinese', 'french', 'mexican', 'thai', 'georgian', 'polish', 'greek',
+    'spanish', 'korean', 'vietnamese', 'turkish', 'lebanese', 'american', 'ukrainian', 'middle eastern',
+    'mediterranean', 'asian', 'sushi', 'pizza', 'seafood', 'steak', 'burgers', 'ramen', 'tapas', 'local',
+}
+NEGATIVE_REPLIES = {
+    'no', 'none', 'nope', 'nah', 'not really', 'nothing', 'no preference', 'no preferences', 'anything',
+    'whatever', 'no restrictions', 'no dietary restrictions', 'i eat everything', 'anything is fine',
+    'i do not', 'i do not have any', 'not at all', 'any', 'any cuisine', 'everything',
+}
+# Words of a plain yes/no reply
+ANSWER_WORDS = {word for phrase in YES_PHRASES | NO_PHRASES for word in phrase.split()} | NEGATIONS
+
+# A reply made only of these (and fillers) means "no preference", anything else is what the user wants to avoid
+NEGATIVE_WORDS = {word for reply in NEGATIVE_REPLIES for word in reply.split()} | {
+    'not', 'thanks', 'fine', 'particular', 'special', 'restriction', 'requirements', 'none', 'at',
+}
+
+DAY = (r"(?:day after tomorrow|today|tonight|tomorrow|this (?:evening|afternoon|weekend)"
+       r"|(?:next |this |on )?(?:monday|tuesday|wednesday|thursday|friday|saturday|sunday)"
+       r"|(?:on )?(?:the )?\d{1,2}(?:st|nd|rd|th)?(?: of)? (?:january|february|march|april|may|june|july|august"
+       r"|september|october|november|december))")
+TIME = (r"(?:(?:at|around|about|for) )?(?:\d{1,2}(?::\d{2})? ?(?:am|pm|o'clock)|\d{1,2}:\d{2}"
+        r"|noon|midnight|(?:at|around) \d{1,2}(?! ?(?:people|persons|guests)))")
+
+PATTERNS = {
+    'party_size': [
+        rf"\b(?:for|party of|table for|group of|we are|we're|there will be|there are) {NUMBER}\b"
+        r"(?! ?(?::|am|pm|o'clock))(?: (?:people|persons|guests|of us|adults))?",
+        rf"\b{NUMBER} (?:people|persons|guests|of us|adults|pax)\b",
+    ],
+    'single': [r"\b(?:just|only) (?:me|myself)\b", r"\bby myself\b"],
+    'name': [r"\b(?:my name is|my name's|call me|name is) ([a-z][a-z'-]+)"],
+    'name_answer': [r"\b(?:i am|i'm|this is|it's) ([a-z][a-z'-]+)"],
+    'farewell': [r"^(?:ok(?:ay)? )?(?:thanks? (?:you )?)?(?:bye|goodbye|good bye|see you|that is all|that's all)\b"],
+    'greetings': [r"^(?:hi|hello|hey|good (?:morning|afternoon|evening))\b"],
+}
+
+# Words that can be left over in a fully understood reply
+FILLERS = {
+    'a', 'an', 'the', 'i', 'we', 'me', 'my', 'our', 'us', 'you', 'it', 'is', 'are', 'am', 'be', 'will', 'would',
+    'like', 'love', 'want', 'prefer', 'have', 'has', 'do', 'eat', 'only', 'just', 'please', 'thanks', 'thank',
+    'yes', 'yeah', 'sure', 'ok', 'okay', 'so', 'well', 'uh', 'um', 'and', 'or', 'with', 'some', 'something',
+    'food', 'cuisine', 'restaurant', 'place', 'table', 'booking', 'reservation', 'book', 'dinner', 'lunch',
+    'meal', 'options', 'option', 'diet', 'maybe', 'let', 'go', 'for', 'at', 'on', 'in', 'of',
+    'to', 'that', 'this', 'hi', 'hello', 'hey', 'im', 'name', 'called', 'people', 'guests', 'persons',
+    's', 'm', 'd', 'll', 're', 've',
+    'preferably', 'really', 'all', 'friendly', 'strictly', 'fully', 'mostly', 'think', 'probably', 'need',
+}
+
+# Words after "i am", "it's", "call me" ... which describe the user or the moment, not their name
+NOT_NAMES = FILLERS | {
+    'fine', 'good', 'great', 'alright', 'sorry', 'afraid', 'glad', 'happy', 'busy', 'free', 'ready',
+    'here', 'back', 'later', 'now', 'soon', 'again', 'home', 'done', 'sure', 'not', 'no', 'also', 'still',
+    'actually', 'too', 'very', 'quite', 'always', 'never', 'usually', 'late', 'early', 'hungry', 'starving',
+    'tired', 'allergic', 'intolerant', 'pregnant', 'flexible', 'easy', 'new', 'interested', 'looking',
+    'calling', 'trying', 'thinking', 'hoping', 'going', 'coming', 'alone', 'single', 'married', 'open',
+    'available', 'perfect', 'correct', 'right', 'wrong', 'exactly', 'anything',
+    'nothing', 'everything', 'whatever', 'any', 'none', 'him', 'her', 'them', 'what', 'when', 'whenever',
+}
+
+INTENT_BY_SLOT = {
+    'name': 'ask_name',
+    'dietary_preferences': 'get_dietary_preferences',
+    'culinary_preferences': 'get_cuisine_preferences',
+    'party_size': 'get_party_size',
+    'booking_date_time': 'get_date_time',
+}
+
+
+def _parse_number(value):
+    return int(value) if value.isdigit() else NUMBERS[value]
+
+
+class SlotExtractor:
+    def __init__(self, confidence=0.95):
+        """
+        Rule based slot filling run before the LLM.
+        Output uses the extracted_info schema consumed by ConversationManager.extract_info.
+        :param confidence: Confidence reported for turns resolved locally
+        """
+        self.confidence = confidence
+        self.answer_classifier = AnswerClassifier(examples=None)
+
+        self._diets = re.compile(r'\b(' + '|'.join(sorted(map(re.escape, DIETS), key=len, reverse=True)) + r')\b')
+        self._cuisines = re.compile(r'\b(' + '|'.join(sorted(CUISINES, key=len, reverse=True)) + r')\b')
+        self._date_time = re.compile(rf"\b(?:{DAY}|{TIME})\b")
+        self._patterns = {key: [re.compile(p) for p in patterns] for key, patterns in PATTERNS.items()}
+
+    @staticmethod
+    def empty_info() -> dict:
+        return {
+            'name': '',
+            'dietary_preferences': '',
+            'culinary_preferences': '',
+            'party_size': '',
+            'booking_date_time': '',
+            'booking_location': '',
+        }
+
+    @staticmethod
+    def _clean(query):
+        text = query.lower().replace('’', "'")
+        text = re.sub(r"[^a-z0-9:'\- ]", ' ', text)
+        return re.sub(r'\s+', ' ', text).strip()
+
+    def extract(self, query, last_question=None):
+        """
+        Fill the slots that can be recognized with rules
+        :param query: User's reply
+        :param last_question: Last asked question type (ex. get_party_size)
+        :return: (extracted_info, spans) - spans are (start, end) of the text explained by the slots
+        """
+        text = self._clean(query)
+        info = self.empty_info()
+        spans = []
+
+        def first(key):
+            for pattern in self._patterns[key]:
+                match = pattern.search(text)
+                if match:
+                    return match
+            return None
+
+        # Party size
+        match = first('party_size')
+        if match:
+            info['party_size'] = _parse_number(match.group(1))
+            spans.append(match.span())
+        elif match := first('single'):
+            info['party_size'] = 1
+            spans.append(match.span())
+        elif last_question == 'get_party_size' and re.fullmatch(NUMBER, text):
+            info['party_size'] = _parse_number(text)
+            spans.append((0, len(text)))
+
+        # Date and time, ex. "tomorrow at 7pm", "friday around 8:30"
+        date_time = [m for m in self._date_time.finditer(text) if not self._overlaps(m.span(), spans)]
+        if date_time:
+            info['booking_date_time'] = ' '.join(m.group(0) for m in date_time)
+            spans.extend(m.span() for m in date_time)
+
+        # Dietary and cuisine keywords
+        diets = list(self._diets.finditer(text))
+        if diets:
+            info['dietary_preferences'] = ', '.join(dict.fromkeys(DIETS[m.group(1)] for m in diets))
+            spans.extend(m.span() for m in diets)
+
+        cuisines = list(self._cuisines.finditer(text))
+        if cuisines:
+            info['culinary_preferences'] = ', '.join(dict.fromkeys(m.group(1).title() for m in cuisines))
+            spans.extend(m.span() for m in cuisines)
+
+        # "No", "none", "anything" right after the preference questions ("no nuts" is a restriction, not "none")
+        if self._is_no_preference(text):
+            if last_question == 'get_dietary_preferences' and not diets:
+                info['dietary_preferences'] = 'NO_PREFERENCE'
+                spans.append((0, len(text)))
+            elif last_question == 'get_cuisine_preferences' and not cuisines:
+                info['culinary_preferences'] = 'NO_PREFERENCE'
+                spans.append((0, len(text)))
+
+        # Name, only when it ends the reply ("call me later", "i am fine" and "i'm allergic to nuts" are not names)
+        match = first('name')
+        if match is None and last_question == 'ask_name':
+            match = first('name_answer')
+        if match and match.group(1) not in NOT_NAMES and not self._overlaps(match.span(1), spans) \
+                and self._ends_reply(text, match.end(1), spans):
+            info['name'] = match.group(1).title()
+            spans.append(match.span())
+        elif last_question == 'ask_name' and not spans and re.fullmatch(r"[a-z][a-z'-]+", text) \
+                and text not in NOT_NAMES:
+            info['name'] = text.title()
+            spans.append((0, len(text)))
+
+        return info, spans
+
+    @staticmethod
+    def _is_no_preference(text):
+        """The whole reply says there is nothing to note: negative words and fillers only"""
+        if text in NEGATIVE_REPLIES:
+            return True
+        words = re.findall(r"[a-z0-9]+", text.replace("n't", ' not'))
+        return any(w in NEGATIVE_WORDS for w in words) and all(w in NEGATIVE_WORDS or w in FILLERS for w in words)
+
+    @staticmethod
+    def _ends_reply(text, position, spans):
+        """Only fillers and the recognized slots follow the position"""
+        for start, end in spans:
+            text = text[:start] + ' ' * (end - start) + text[end:]
+        return all(w in FILLERS for w in re.findall(r"[a-z0-9]+", text[position:]))
+
+    @staticmethod
+    def _overlaps(span, spans):
+        return any(span[0] < end and start < span[1] for start, end in spans)
+
+    def _leftover_words(self, text, spans):
+        for start, end in sorted(spans, reverse=True):
+            text = text[:start] + ' ' + text[end:]
+        return [w for w in re.findall(r"[a-z0-9]+", text) if w not in FILLERS]
+
+    def resolve(self, query, last_question=None):
+        """
+        Try to handle the whole turn locally
+        :param query: User's reply
+        :param last_question: Last asked question type
+        :return: (intent, extracted_info, confidence) or None when the LLM is needed
+        """
+        text = self._clean(query)
+        if not text:
+            return None
+
+        for intent in ('farewell', 'greetings'):
+            match = self._patterns[intent][0].search(text)
+            if match and not self._leftover_words(text, [match.span()]):
+                return intent, self.empty_info(), self.confidence
+
+        info, spans = self.extract(query, last_question)
+
+        if not spans:
+            # Plain yes/no (ex. answer to a confirmation) - nothing to fill.
+            # "no pork please" is not one: it names something the rules don't know
+            answer, confidence = self.answer_classifier.classify_rules(text)
+            plain = all(w in ANSWER_WORDS or w in FILLERS for w in tokenize(text))
+            if answer is not None and confidence >= self.answer_classifier.threshold and plain:
+                return 'confirm_details', info, self.confidence
+            return None
+
+        # Something in the reply wasn't understood (ex. location) - leave the turn to the LLM
+        if self._leftover_words(text, spans):
+            return None
+
+        # Prefer the intent of the question that was just asked
+        intents = [INTENT_BY_SLOT[slot] for slot in INTENT_BY_SLOT if info[slot]]
+        intent = last_question if last_question in intents else intents[0]
+
+        return intent, info, self.confidence
@@ -1,125 +1,643 @@
+import os
+import json
 import time
-import torch
-import sounddevice as sd
+import queue
+import shutil
+import hashlib
+import threading
 import numpy as np
-from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
+from concurrent.futures import ThreadPoolExecutor, Future
 
-class STT:
-    def __init__(self,  model_id="openai/whisper-large-v3-turbo"):
+import tracing
+from audio_source import MicrophoneSource, SAMPLE_RATE
+from vad import VoiceActivityDetector
+
+# Short names accepted by --stt-model, any Hugging Face model id works as well
+MODEL_SIZES = {
+    'tiny': 'openai/whisper-tiny',
+    'base': 'openai/whisper-base',
+    'small': 'openai/whisper-small',
+    'medium': 'openai/whisper-medium',
+    'large-v3': 'openai/whisper-large-v3',
+    'large-v3-turbo': 'openai/whisper-large-v3-turbo',
+}
+QUANTIZATION = (None, 'int8', 'float16')
+
+# Compiled and exported models, reused by the next process start
+ARTIFACT_DIR = 'cache/stt'
+
+
+def artifact_path(artifact_dir, model_id, *options, packages=('torch', 'transformers')):
+    """
+    Directory of a compiled or exported model. The key covers the model id, the options and the versions
+    of the packages that produced the artifact, so an upgrade never loads a stale one.
+    :param artifact_dir: Root directory of the artifacts
+    :param model_id: Whisper model id
+    :param options: Anything else the artifact depends on (format, quantization)
+    :param packages: Packages whose versions go into the key
+    :return: Path of the artifact directory
+    """
+    from importlib import metadata
+
+    versions = []
+    for package in packages:
+        try:
+            versions.append(f'{package}=={metadata.version(package)}')
+        except metadata.PackageNotFoundError:
+            versions.append(f'{package}==none')
+
+    key = hashlib.sha256(json.dumps([model_id, options, versions]).encode()).hexdigest()[:16]
+    return os.path.join(artifact_dir, f'{model_id.replace("/", "--")}-{key}')
+
+
+def build_artifact(path, build) -> bool:
+    """
+    Build an artifact directory once: build(tmp_dir) writes it next to path, then it is renamed into place,
+    so a crashed build or a concurrent process never leaves a half written artifact behind
+    :return: True if it was built now, False if it already existed
+    """
+    if os.path.isdir(path):
+        return False
+
+    tmp_dir = f'{path}.tmp-{os.getpid()}'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    try:
+        build(tmp_dir)
+        os.rename(tmp_dir, path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+        # Another process finished first
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return True
+
+
+class TransformersBackend:
+    def __init__(self, model_id, device, quantize=None, compile_model=False, artifact_dir=None):
         """
-        https://huggingface.co/openai/whisper-large-v3-turbo
-        :param model_id: Whisper model, default: openai/whisper-large-v3-turbo
+        Hugging Face transformers pipeline
+        :param model_id: Whisper model id
+        :param device: torch device
+        :param quantize: None (float32), 'int8' (dynamic quantization of Linear layers, CPU) or 'float16' (GPU)
+        :param compile_model: torch.compile the model, the compiled kernels are cached under artifact_dir
+        :param artifact_dir: Root directory of the compiled artifacts, None: torch's default cache
         """
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.model_id = model_id
+        self.device = device
+        self.quantize = quantize
+        self.compile_model = compile_model
+        self.artifact_dir = artifact_dir
         self.pipe = self._create_pipeline()
-        # self.whisper_kwargs = {"language": "english"}
 
     def _create_pipeline(self):
+        import torch
+        from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
+
+        torch_dtype = torch.float16 if self.quantize == 'float16' else torch.float32
 
         processor = AutoProcessor.from_pretrained(self.model_id)
 
         model = AutoModelForSpeechSeq2Seq.from_pretrained(
             self.model_id,
-            torch_dtype=torch.float32,
+            torch_dtype=torch_dtype,
             low_cpu_mem_usage=True,
             use_safetensors=True
         )
 
+        if self.quantize == 'int8':
+            # https://pytorch.org/docs/stable/generated/torch.ao.quantization.quantize_dynamic.html
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+        if self.compile_model:
+            self._compile(model)
+
         return pipeline(
             "automatic-speech-recognition",
             model=model,
             tokenizer=processor.tokenizer,
             feature_extractor=processor.feature_extractor,
-            torch_dtype=torch.float32,
+            torch_dtype=torch_dtype,
             device=self.device,
         )
 
-    def record_audio(self, max_record_duration=10):
+    def _compile(self, model):
+        """
+        Compile the forward pass with a static KV cache (fixed shapes, compiled once)
+        https://huggingface.co/docs/transformers/model_doc/whisper (torch.compile)
+        The inductor cache (FX graphs and kernels) goes to a directory keyed by model and torch version,
+        a later process start loads the kernels from there instead of compiling them again.
+        The first call(s) after loading still trace the graph - STT.warm_up runs them at startup.
+        """
+        import torch
+        import torch._inductor.config
+
+        if self.artifact_dir is not None:
+            cache_dir = artifact_path(self.artifact_dir, self.model_id, 'inductor', self.quantize,
+                                      str(self.device))
+            os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', cache_dir)
+        torch._inductor.config.fx_graph_cache = True
+
+        model.generation_config.cache_implementation = 'static'
+        model.forward = torch.compile(model.forward, mode='reduce-overhead', fullgraph=True)
+
+    def transcribe(self, audio_data):
+        return self.pipe(audio_data)["text"].strip()
+
+    def transcribe_batch(self, audio_batch):
+        """Whisper pads every input to 30 s of features, utterances of any length batch without waste"""
+        results = self.pipe(list(audio_batch), batch_size=len(audio_batch))
+        return [result["text"].strip() for result in results]
+
+
+class CTranslate2Backend:
+    def __init__(self, model_id, device, quantize=None, artifact_dir=None):
+        """
+        CTranslate2 engine through faster-whisper (pip install faster-whisper)
+        https://github.com/SYSTRAN/faster-whisper
+        :param model_id: Whisper model id or size name
+        :param device: torch device
+        :param quantize: None, 'int8' or 'float16' - CTranslate2 compute type
+        :param artifact_dir: Download directory of the converted models, None: Hugging Face cache
+        """
+        from faster_whisper import WhisperModel
+
+        self.model_id = model_id
+        self.device = device
+        self.quantize = quantize
+
+        # faster-whisper takes size names ("small", "large-v3-turbo") or converted CTranslate2 repos
+        model_name = model_id.removeprefix('openai/whisper-')
+        self.model = WhisperModel(model_name, device=device.type, compute_type=quantize or 'default',
+                                  download_root=artifact_dir)
+
+    def transcribe(self, audio_data):
+        segments, _ = self.model.transcribe(audio_data, beam_size=1)
+        return ''.join(segment.text for segment in segments).strip()
+
+
+class OnnxBackend:
+    QUANTIZED_FILES = {
+        'encoder_file_name': 'encoder_model_quantized.onnx',
+        'decoder_file_name': 'decoder_model_quantized.onnx',
+        'decoder_with_past_file_name': 'decoder_with_past_model_quantized.onnx',
+    }
+
+    def __init__(self, model_id, device, quantize=None, artifact_dir=None):
+        """
+        ONNX Runtime through optimum (pip install optimum[onnxruntime])
+        https://huggingface.co/docs/optimum/onnxruntime/usage_guides/models
+        The exported (and quantized) graphs are kept under artifact_dir, keyed by model id, quantization and
+        library versions - only the first start exports the model.
+        :param model_id: Whisper model id
+        :param device: torch device
+        :param quantize: None or 'int8' (dynamic quantization of the exported graphs)
+        :param artifact_dir: Root directory of the exported models, None: export to a temporary directory
+        """
+        import tempfile
+        from transformers import AutoProcessor, pipeline
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+
+        self.model_id = model_id
+        self.device = device
+        self.quantize = quantize
+
+        processor = AutoProcessor.from_pretrained(model_id)
+
+        if artifact_dir is None:
+            export_dir = tempfile.mkdtemp(prefix='whisper-onnx-')
+            self._export(export_dir)
+            self.exported = True
+        else:
+            export_dir = artifact_path(artifact_dir, model_id, 'onnx', quantize,
+                                       packages=('transformers', 'optimum', 'onnxruntime'))
+            self.exported = build_artifact(export_dir, self._export)
+
+        file_names = self.QUANTIZED_FILES if quantize == 'int8' else {}
+        model = ORTModelForSpeechSeq2Seq.from_pretrained(export_dir, **file_names)
+
+        self.pipe = pipeline(
+            "automatic-speech-recognition",
+            model=model,
+            tokenizer=processor.tokenizer,
+            feature_extractor=processor.feature_extractor,
+        )
+
+    def _export(self, export_dir):
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        model = ORTModelForSpeechSeq2Seq.from_pretrained(self.model_id, export=True)
+        model.save_pretrained(export_dir)
+
+        if self.quantize == 'int8':
+            qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+            for onnx_file in (model.encoder_model_path, model.decoder_model_path,
+                              model.decoder_with_past_model_path):
+                if onnx_file is not None:
+                    quantizer = ORTQuantizer.from_pretrained(export_dir, file_name=onnx_file.name)
+                    quantizer.quantize(save_dir=export_dir, quantization_config=qconfig)
+
+    def transcribe(self, audio_data):
+        return self.pipe(audio_data)["text"].strip()
+
+    def transcribe_batch(self, audio_batch):
+        results = self.pipe(list(audio_batch), batch_size=len(audio_batch))
+        return [result["text"].strip() for result in results]
+
+
+def normalize_inplace(audio_data):
+    """
+    Scale audio to peak 1.0 without allocating a copy
+    :param audio_data: float32 array, modified in place
+    :return: The same array
+    """
+    peak = max(float(audio_data.max()), -float(audio_data.min()))
+    if peak > 0:
+        audio_data *= 1.0 / peak
+    return audio_data
+
+
+class BatchWorker:
+    def __init__(self, transcribe_batch, max_batch=8, max_delay=0.02):
         """
-        Method for dynamic audio recording - waits for a signal to break silence threshold and then records for the max of 5 sec silence
+        Shared inference worker: utterances submitted by many sessions are collected into micro-batches
+        and transcribed together, every caller gets its own transcript back through a Future.
+        A batch is closed when it is full or max_delay after its first utterance arrived,
+        utterances arriving while a batch is running form the next one.
+        :param transcribe_batch: Function from a list of float32 arrays to a list of transcripts
+        :param max_batch: Max utterances per batch
+        :param max_delay: Max seconds the first utterance of a batch waits for more
+        """
+        self.transcribe_batch = transcribe_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+
+        self.queue = queue.Queue()
+        self.metrics = {'utterances': 0, 'batches': 0, 'largest_batch': 0, 'failed': 0, 'inference_seconds': 0.0}
+
+        self.worker = threading.Thread(target=self._run, name='stt-batch-worker', daemon=True)
+        self.worker.start()
+
+    def submit(self, audio_data) -> Future:
+        future = Future()
+        self.queue.put((audio_data, future))
+        return future
+
+    def _next_batch(self):
+        """Block for the first utterance, then collect more until the batch is full or max_delay passed"""
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch and batch[-1] is not None:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = self._next_batch()
+            stop = batch[-1] is None  # close() sentinel
+            # Callers that gave up (cancelled futures) are dropped from the batch
+            items = [item for item in batch if item is not None and item[1].set_running_or_notify_cancel()]
+            if not items:
+                continue
+
+            start = time.perf_counter()
+            try:
+                with tracing.span('stt.batch', size=len(items)):
+                    transcripts = list(self.transcribe_batch([audio_data for audio_data, _ in items]))
+                    # zip would silently leave callers without a result, or hand them another caller's transcript
+                    if len(transcripts) != len(items):
+                        raise RuntimeError(f'{len(transcripts)} transcripts for a batch of {len(items)} utterances')
+            except Exception as e:
+                print(f'SYSTEM: STT batch of {len(items)} failed: {e}')
+                self.metrics['failed'] += len(items)
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+
+            self.metrics['inference_seconds'] += time.perf_counter() - start
+            self.metrics['utterances'] += len(items)
+            self.metrics['batches'] += 1
+            self.metrics['largest_batch'] = max(self.metrics['largest_batch'], len(items))
+            for (_, future), transcript in zip(items, transcripts):
+                future.set_result(transcript)
+
+    def stats(self) -> dict:
+        return dict(self.metrics, mean_batch=self.metrics['utterances'] / max(1, self.metrics['batches']),
+                    depth=self.queue.qsize())
+
+    def close(self):
+        """Transcribe everything submitted so far and stop the worker"""
+        self.queue.put(None)
+        self.worker.join()
+
+
+BACKENDS = {
+    'transformers': TransformersBackend,
+    'ctranslate2': CTranslate2Backend,
+    'onnx': OnnxBackend,
+}
+
+
+class STT:
+    def __init__(self,  model_id="openai/whisper-large-v3-turbo", backend='transformers', quantize=None,
+                 compile_model=False, artifact_dir=ARTIFACT_DIR, batch_size=1, max_batch_delay=0.02):
+        """
+        https://huggingface.co/openai/whisper-large-v3-turbo
+        :param model_id: Whisper model (id or size name from MODEL_SIZES), default: openai/whisper-large-v3-turbo
+        :param backend: Inference engine - 'transformers', 'ctranslate2' or 'onnx'
+        :param quantize: None, 'int8' or 'float16'
+        :param compile_model: torch.compile the model (transformers backend)
+        :param artifact_dir: Where compiled/exported models are cached between process starts, None: not cached
+        :param batch_size: Above 1, concurrent utterances (ex. dialog server sessions) are transcribed
+            in micro-batches of up to batch_size by one BatchWorker
+        :param max_batch_delay: Max seconds an utterance waits for others to join its batch
+        """
+        assert backend in BACKENDS, f'Unknown STT backend {backend}'
+        assert quantize in QUANTIZATION, f'Unknown quantization {quantize}'
+        assert not compile_model or backend == 'transformers', 'torch.compile needs the transformers backend'
+
+        self.model_id = MODEL_SIZES.get(model_id, model_id)
+        self.backend_name = backend
+        self.quantize = quantize
+        self.compile_model = compile_model
+        self.artifact_dir = artifact_dir
+        self.warmup_times = None  # seconds of every warm_up run
+
+        self.batch_size = batch_size
+        self.max_batch_delay = max_batch_delay
+        self._batcher = None
+
+        # The model (and torch) is loaded on first use or by load(), ex. from a warm-up thread
+        self.device = None
+        self._backend = None
+        self._load_lock = threading.Lock()
+
+        # One inference at a time, the model is shared by all sessions of the dialog server
+        self._lock = threading.Lock()
+
+        # Reused by record_audio between utterances
+        self._vad = None
+        self._capture_buffer = None
+        # self.whisper_kwargs = {"language": "english"}
+
+    @property
+    def concurrency(self):
+        """Utterances that can be transcribed at once (sizes the caller's executor)"""
+        return self.batch_size
+
+    @property
+    def loaded(self):
+        return self._backend is not None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self.load()
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend):
+        self._backend = backend
+
+    def load(self):
+        """
+        Import torch and load the model, once - concurrent callers wait for the first one
+        :return: self
+        """
+        with self._load_lock:
+            if self.batch_size > 1 and self._batcher is None:
+                self._batcher = BatchWorker(self._transcribe_batch, max_batch=self.batch_size,
+                                            max_delay=self.max_batch_delay)
+            if self._backend is None:
+                import torch
+
+                start = time.perf_counter()
+                self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+                options = {'artifact_dir': self.artifact_dir}
+                if self.compile_model:
+                    options['compile_model'] = True
+                self._backend = BACKENDS[self.backend_name](self.model_id, self.device, self.quantize, **options)
+                print(f'SYSTEM: STT model {self.model_id} loaded in {time.perf_counter() - start:.1f} s')
+        return self
+
+    def warm_up(self, duration=1.0, runs=None):
+        """
+        Load the model and transcribe silence, so lazy kernel initialization, allocations
+        (and compilation) are paid at startup instead of by the first utterance
+        :param duration: Seconds of silence per run
+        :param runs: Number of runs, default 1 (2 for a compiled model: the graphs are captured on the first run)
+        :return: Seconds of every run
+        """
+        self.load()
+        runs = runs or (2 if self.compile_model else 1)
+        silence = np.zeros(int(duration * SAMPLE_RATE), dtype=np.float32)
+
+        self.warmup_times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            if self._batcher is not None:
+                # A full batch, so the largest allocations happen now
+                self._transcribe_batch([silence] * self.batch_size)
+            else:
+                self._infer(silence)
+            self.warmup_times.append(time.perf_counter() - start)
+
+        print(f'SYSTEM: STT warm-up {", ".join(f"{t:.2f}" for t in self.warmup_times)} s')
+        return self.warmup_times
+
+    def record_audio(self, max_record_duration=10, input_stream=None):
+        """
+        Method for dynamic audio recording - waits for the voice activity detector to detect speech
+        and records until 0.5 s of silence (or max duration).
+        Audio is written straight into a capture buffer preallocated once per STT instance and normalized in place,
+        the model gets a view of it - no per-utterance allocations (not safe for concurrent calls on one instance).
         https://python-sounddevice.readthedocs.io/en/0.5.1/api/streams.html#sounddevice.InputStream
         :param max_record_duration: Max record duration in seconds, default 10
+        :param input_stream: InputStream class, default sounddevice.InputStream (replaceable with a fake stream)
         :return: Models' transcript of the recorded audio
         """
-        block_size = 4000 # Number of frames => 0.25s audio
-        sample_rate = 16000
-        silence_duration = 0.5
-        audio_buffer = []
-        chunks_per_second = sample_rate // block_size
-        silent_threshold_chunks = int(silence_duration * chunks_per_second)
-        max_chunks = int(max_record_duration * chunks_per_second)
-
-        # For callback
-        is_recording = False
-        should_stop = False
-        silent_chunks = 0
-        chunk_count = 0
-        silence_threshold = 0.03
+        if input_stream is None:
+            import sounddevice as sd
+            input_stream = sd.InputStream
+
+        if self._vad is None or self._vad.max_speech_samples != int(max_record_duration * SAMPLE_RATE):
+            self._vad = VoiceActivityDetector(max_speech_duration=max_record_duration)
+        vad = self._vad
+        vad.reset()
+
+        # Max utterance + pre-roll + one frame of slack
+        capacity = vad.max_speech_samples + len(vad.preroll) + vad.frame_size
+        if self._capture_buffer is None or len(self._capture_buffer) < capacity:
+            self._capture_buffer = np.zeros(capacity, dtype=np.float32)
+        buffer = self._capture_buffer
+        length = 0
+
         print('Waiting for speech...')
 
         def audio_callback(indata, frames, time, status):
             """
-            Callback function for processing audio data
+            Callback function for processing audio data, runs every VAD frame (20 ms)
             https://python-sounddevice.readthedocs.io/en/0.5.1/_modules/sounddevice.html#OutputStream
             """
-            nonlocal is_recording, silent_chunks, chunk_count, should_stop
-
-            volume_level = np.linalg.norm(indata) / np.sqrt(len(indata))
-
-            if volume_level > silence_threshold:
-                if not is_recording:
-                    print('Speech detected, recording...')
-                    is_recording = True
-
-                silent_chunks = 0
+            nonlocal length
+            # indata is reused by sounddevice after the callback returns, frames are copied into the buffer now
+            for frame in vad.process(indata[:, 0]):
+                end = min(length + len(frame), len(buffer))
+                buffer[length:end] = frame[:end - length]
+                length = end
 
-                if is_recording:
-                    audio_buffer.append(indata.copy())
-                    chunk_count += 1
-            else:
-                if is_recording:
-                    silent_chunks += 1
-                    audio_buffer.append(indata.copy())
-                    chunk_count += 1
-
-                    if silent_chunks >= silent_threshold_chunks or chunk_count >= max_chunks:
-                        print('Stopping recording due to silence or max duration')
-                        should_stop = True  # Set flag to break the rec
-                        return
-
-        stream = sd.InputStream(
+        stream = input_stream(
             channels=1,
             dtype='float32',
-            samplerate=sample_rate,
-            blocksize=block_size,
+            samplerate=SAMPLE_RATE,
+            blocksize=vad.frame_size,
             callback=audio_callback,
         )
 
-        with stream:
-            try:
-                while not should_stop:
-                    # Waiting for callback
-                    time.sleep(0.1)
-            except KeyboardInterrupt:
-                print('Recording interrupted')
+        # From opening the microphone to the end of speech, waiting for the user included
+        with tracing.span('stt.capture') as capture:
+            with stream:
+                try:
+                    vad.speech_started.wait()
+                    print('Speech detected, recording...')
+                    vad.end_of_speech.wait()
+                    print('Stopping recording due to silence or max duration')
+                except KeyboardInterrupt:
+                    print('Recording interrupted')
+            capture.set(audio_seconds=round(length / SAMPLE_RATE, 2))
 
         print('Finished recording')
 
-        if not audio_buffer:
+        if not length:
             print('No audio detected')
             return ''
 
-        audio_data = np.concatenate(audio_buffer).flatten()
-
-        # Normalize audio
-        if np.max(np.abs(audio_data)) > 0:
-            audio_data = audio_data / np.max(np.abs(audio_data))
+        audio_data = normalize_inplace(buffer[:length])
 
         print('Processing the audio...')
 
-        result = self.pipe(audio_data)
+        return self._infer(audio_data)
+
+    def _infer(self, audio_data):
+        """One utterance through the batch worker if batching is on, else straight through the model"""
+        # Waiting for the model (lock, batch) included: that is the latency the session sees
+        with tracing.span('stt.inference', audio_seconds=round(len(audio_data) / SAMPLE_RATE, 2)):
+            if self.batch_size > 1:
+                self.load()
+                return self._batcher.submit(audio_data).result()
+
+            with self._lock:
+                return self.backend.transcribe(audio_data)
+
+    def _transcribe_batch(self, audio_batch):
+        """Batch of utterances, backends without batched inference run them one by one"""
+        with self._lock:
+            if hasattr(self.backend, 'transcribe_batch'):
+                return self.backend.transcribe_batch(audio_batch)
+            return [self.backend.transcribe(audio_data) for audio_data in audio_batch]
+
+    def _transcribe(self, audio_data):
+        """
+        Normalize (in place) and transcribe one piece of audio
+        :param audio_data: float32 mono samples
+        :return: Transcript
+        """
+        return self._infer(normalize_inplace(audio_data))
+
+    def transcribe(self, audio_data):
+        """
+        Transcribe audio received from elsewhere (ex. a dialog server session), safe to call from many threads
+        :param audio_data: float32 mono samples at 16 kHz, normalized in place
+        :return: Transcript
+        """
+        return self._transcribe(audio_data)
+
+    def batch_stats(self):
+        """Batch worker metrics (utterances, batches, mean and largest batch, inference time), None without batching"""
+        return self._batcher.stats() if self._batcher is not None else None
+
+    def close(self):
+        if self._batcher is not None:
+            self._batcher.close()
+            self._batcher = None
+
+    def stream_transcribe(self, source=None, step_duration=1.0, segment_duration=5.0, silence_duration=0.5,
+                          max_record_duration=10):
+        """
+        Transcribe while the user is still speaking.
+        Every step_duration the current segment is re-transcribed in a background thread (overlapping windows)
+        and a partial hypothesis is yielded. Segments longer than segment_duration are cut at the quietest frame
+        and transcribed for good, so after the end of speech only the last short segment is left to process.
+        :param source: Iterable of float32 blocks (MicrophoneSource, WavFileSource), default: microphone
+        :param step_duration: Seconds of new audio between partial hypotheses
+        :param segment_duration: Max length of a segment in seconds
+        :param silence_duration: Seconds of silence ending the utterance
+        :param max_record_duration: Max record duration in seconds
+        :return: Generator of {'text': str, 'final': bool}, the last item is final
+        """
+        source = source if source is not None else MicrophoneSource()
+        vad = VoiceActivityDetector(silence_ms=int(silence_duration * 1000), max_speech_duration=max_record_duration)
+        executor = ThreadPoolExecutor(max_workers=1)
+
+        segment, segment_levels = [], []
+        segment_futures = []  # finished segments, transcribed in order by the single worker
+        partial_future = None
+        since_partial = 0
+        frames_per_second = SAMPLE_RATE // vad.frame_size
+
+        def committed_text():
+            return ' '.join(f.result() for f in segment_futures if f.done())
+
+        print('Waiting for speech...')
+        capture_start = time.perf_counter()
+
+        with source:
+            # Sources hand out fresh arrays, so the VAD frames (views) can be kept without copying
+            for block in source:
+                for frame in vad.process(block):
+                    segment.append(frame)
+                    segment_levels.append(np.linalg.norm(frame) / np.sqrt(len(frame)))
+                    since_partial += len(frame)
+
+                if vad.end_of_speech.is_set():
+                    break
+
+                if len(segment) >= segment_duration * frames_per_second:
+                    # Cut at the quietest frame of the last second, so words are not split between segments
+                    cut = len(segment) - frames_per_second + int(np.argmin(segment_levels[-frames_per_second:])) + 1
+                    segment_futures.append(executor.submit(tracing.in_context(self._transcribe),
+                                                           np.concatenate(segment[:cut])))
+                    segment, segment_levels = segment[cut:], segment_levels[cut:]
+
+                if partial_future is not None and partial_future.done():
+                    yield {'text': f'{committed_text()} {partial_future.result()}'.strip(), 'final': False}
+                    partial_future = None
+
+                if since_partial >= step_duration * SAMPLE_RATE and partial_future is None and segment:
+                    partial_future = executor.submit(tracing.in_context(self._transcribe), np.concatenate(segment))
+                    since_partial = 0
+
+        print('Finished recording')
+        end_of_speech = time.perf_counter()
+        tracing.record('stt.capture', end_of_speech - capture_start)
+
+        if partial_future is not None:
+            partial_future.cancel()
+
+        if segment:
+            segment_futures.append(executor.submit(tracing.in_context(self._transcribe), np.concatenate(segment)))
+
+        transcription = ' '.join(f.result() for f in segment_futures).strip()
+        executor.shutdown()
+        # What is left to transcribe after the user stopped speaking
+        tracing.record('stt.finalize', time.perf_counter() - end_of_speech, segments=len(segment_futures))
 
-        transcription = result["text"].strip()
-        return transcription
+        yield {'text': transcription, 'final': True}
 
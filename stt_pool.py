@@ -0,0 +1,263 @@
+import os
+import queue
+import itertools
+import threading
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import Future
+
+import tracing
+from audio_source import SAMPLE_RATE
+
+
+def available_cpus() -> list:
+    """CPUs this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def cpu_sets(workers, threads_per_worker=None):
+    """
+    Split the CPUs this process may run on into one contiguous set per worker
+    :param workers: Number of worker processes
+    :param threads_per_worker: CPUs per worker, default: all CPUs divided evenly
+    :return: List of CPU id lists, None where pinning is not supported
+    """
+    if not hasattr(os, 'sched_setaffinity'):
+        return [None] * workers
+
+    cpus = available_cpus()
+    per_worker = threads_per_worker or max(1, len(cpus) // workers)
+    return [[cpus[(idx * per_worker + offset) % len(cpus)] for offset in range(per_worker)]
+            for idx in range(workers)]
+
+
+def _worker_main(index, stt_options, shm_name, slot_samples, cpus, threads, tasks, results):
+    """
+    Worker process: pin to its CPUs, load its own model copy, then transcribe the slots named by the tasks
+    until the None sentinel. Audio is read straight from the shared memory, only slot numbers are pickled.
+    """
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+    # Before torch is imported, so its OpenMP pool is sized for this worker only
+    os.environ['OMP_NUM_THREADS'] = os.environ['MKL_NUM_THREADS'] = str(threads)
+
+    from speech_to_text import STT
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buffer = np.ndarray((len(shm.buf) // (slot_samples * 4), slot_samples), dtype=np.float32, buffer=shm.buf)
+    try:
+        stt = STT(**stt_options)
+        if stt.backend_name == 'transformers':
+            import torch
+
+            torch.set_num_threads(threads)
+            torch.set_num_interop_threads(1)
+        stt.warm_up()
+        results.put(('ready', index, None, None))
+
+        for task in iter(tasks.get, None):
+            request_id, slot, length = task
+            try:
+                results.put((request_id, index, stt.transcribe(buffer[slot, :length]), None))
+            except Exception as e:
+                results.put((request_id, index, None, f'{type(e).__name__}: {e}'))
+    except Exception as e:
+        results.put(('failed', index, None, f'{type(e).__name__}: {e}'))
+    finally:
+        del buffer
+        try:
+            shm.close()
+        except BufferError:
+            pass  # a view is still referenced, released at exit
+
+
+class STTProcessPool:
+    def __init__(self, workers=2, model_id="openai/whisper-large-v3-turbo", backend='transformers', quantize=None,
+                 artifact_dir='cache/stt', threads_per_worker=None, pin=True, max_utterance=30.0, slots=None):
+        """
+        STT service mode: N worker processes, each with its own (optionally quantized) model copy and its own
+        CPUs, so feature extraction and inference scale across cores instead of sharing one GIL.
+        Audio is copied into a shared memory slot, the workers read it in place - no pickled arrays.
+        Workers are started on first use or by load()/warm_up(), like the in-process STT model.
+        :param workers: Number of worker processes
+        :param model_id: Whisper model (id or size name)
+        :param backend: STT backend of the workers
+        :param quantize: None, 'int8' or 'float16'
+        :param artifact_dir: Compiled/exported model cache shared by the workers
+        :param threads_per_worker: torch/OpenMP threads (and pinned CPUs) per worker, default: CPUs / workers
+        :param pin: Pin every worker to its own CPUs (Linux)
+        :param max_utterance: Max seconds of audio per request (slot size)
+        :param slots: Shared memory slots, requests wait for a free one, default: 2 per worker
+        """
+        self.workers = workers
+        self.stt_options = {'model_id': model_id, 'backend': backend, 'quantize': quantize,
+                            'artifact_dir': artifact_dir}
+        self.pin = pin
+        self.cpus = cpu_sets(workers, threads_per_worker) if pin else [None] * workers
+        self.threads = threads_per_worker or max(1, len(available_cpus()) // workers)
+        self.slot_samples = int(max_utterance * SAMPLE_RATE)
+        self.slots = slots or 2 * workers
+
+        self.processes = []
+        self.shm = None
+        self.buffer = None
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._ready_count = 0
+        self._closing = False
+        self.error = None  # set when a worker failed to start or died
+
+        self.free_slots = queue.Queue()
+        self.pending = {}  # request id -> (future, slot)
+        self.pending_lock = threading.Lock()
+        self.request_ids = itertools.count()
+        self.metrics = {'utterances': 0, 'failed': 0, 'per_worker': [0] * workers}
+
+    @property
+    def concurrency(self):
+        """Utterances that can be in flight at once (sizes the caller's executor)"""
+        return self.slots
+
+    def load(self):
+        """Create the shared memory and start the workers, once"""
+        with self._start_lock:
+            if self._started:
+                return self
+            self._started = True
+
+            self.shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_samples * 4)
+            self.buffer = np.ndarray((self.slots, self.slot_samples), dtype=np.float32, buffer=self.shm.buf)
+            for slot in range(self.slots):
+                self.free_slots.put(slot)
+
+            # spawn: the workers must not inherit the parent's threads (and a forked torch)
+            context = mp.get_context('spawn')
+            self.tasks = context.Queue()
+            self.results = context.Queue()
+            for idx in range(self.workers):
+                process = context.Process(target=_worker_main, name=f'stt-worker-{idx}', daemon=True, args=(
+                    idx, self.stt_options, self.shm.name, self.slot_samples, self.cpus[idx], self.threads,
+                    self.tasks, self.results))
+                process.start()
+                self.processes.append(process)
+
+            self.collector = threading.Thread(target=self._collect, name='stt-pool-results', daemon=True)
+            self.collector.start()
+        return self
+
+    def warm_up(self, timeout=None):
+        """
+        Start the workers and wait until every one loaded and warmed up its model
+        :return: True if all workers are ready
+        """
+        self.load()
+        self._ready.wait(timeout)
+        if self.error is not None:
+            raise RuntimeError(f'STT worker failed: {self.error}')
+        return self._ready.is_set()
+
+    def _fail_pending(self, error):
+        self.error = error
+        self._ready.set()
+        with self.pending_lock:
+            pending, self.pending = self.pending, {}
+        for future, slot in pending.values():
+            self.metrics['failed'] += 1
+            future.set_exception(RuntimeError(f'STT worker failed: {error}'))
+            self.free_slots.put(slot)
+
+    def _collect(self):
+        """Route the transcripts back to the callers' futures and free their slots"""
+        while True:
+            try:
+                message = self.results.get(timeout=1.0)
+            except queue.Empty:
+                dead = [process.name for process in self.processes if not process.is_alive()]
+                if self._closing and len(dead) == len(self.processes):
+                    return  # the close() sentinel is lost if a killed worker held the queue lock
+                if dead and self.error is None and not self._closing:
+                    self._fail_pending(f'{", ".join(dead)} exited')
+                continue
+
+            if message is None:  # close()
+                return
+            request_id, worker, text, error = message
+
+            if request_id == 'ready':
+                self._ready_count += 1
+                if self._ready_count == self.workers:
+                    self._ready.set()
+                    print(f'SYSTEM: {self.workers} STT worker processes ready')
+                continue
+            if request_id == 'failed':
+                self._fail_pending(f'worker {worker}: {error}')
+                continue
+
+            with self.pending_lock:
+                future, slot = self.pending.pop(request_id, (None, None))
+            if future is None:
+                continue
+            self.free_slots.put(slot)
+
+            if error is not None:
+                self.metrics['failed'] += 1
+                future.set_exception(RuntimeError(error))
+            else:
+                self.metrics['utterances'] += 1
+                self.metrics['per_worker'][worker] += 1
+                future.set_result(text)
+
+    def submit(self, audio_data) -> Future:
+        """
+        Copy the audio into a free shared memory slot (waits for one) and queue it for the next idle worker
+        :param audio_data: float32 mono samples at 16 kHz, at most max_utterance seconds
+        :return: Future of the transcript
+        """
+        assert len(audio_data) <= self.slot_samples, f'Utterance longer than {self.slot_samples / SAMPLE_RATE} s'
+        self.load()
+        if self.error is not None:
+            raise RuntimeError(f'STT worker failed: {self.error}')
+
+        slot = self.free_slots.get()
+        self.buffer[slot, :len(audio_data)] = audio_data
+
+        future = Future()
+        request_id = next(self.request_ids)
+        with self.pending_lock:
+            self.pending[request_id] = (future, slot)
+        self.tasks.put((request_id, slot, len(audio_data)))
+        return future
+
+    def transcribe(self, audio_data):
+        """Same as STT.transcribe, safe to call from many threads"""
+        with tracing.span('stt.inference', audio_seconds=round(len(audio_data) / SAMPLE_RATE, 2)):
+            return self.submit(audio_data).result()
+
+    def stats(self) -> dict:
+        return dict(self.metrics, workers=self.workers, in_flight=len(self.pending))
+
+    def close(self):
+        """Stop the workers after the queued requests and release the shared memory"""
+        if not self._started or self.shm is None:
+            return
+        self._closing = True
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.kill()
+        self.results.put(None)
+        self.collector.join()
+        for channel in (self.tasks, self.results):
+            channel.cancel_join_thread()  # don't block the interpreter exit on undelivered messages
+            channel.close()
+
+        self.buffer = None
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
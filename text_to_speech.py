@@ -1,32 +1,207 @@
 import os
-import pyaudio
-from openai import OpenAI
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
 
 API_KEY = os.environ.get('OPENAI_KEY')
 
+SAMPLE_RATE = 24_000  # tts-1 pcm output: 24 kHz, 16-bit, mono
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def split_sentences(text) -> list:
+    """
+    Split text into sentences, so the first one can be spoken while the rest is synthesized
+    :param text: Text to read
+    :return: List of non-empty sentences
+    """
+    text = ' '.join(text.split())
+    return [sentence for sentence in SENTENCE_END.split(text) if sentence]
+
+
+class PyAudioSink:
+    def __init__(self, rate=SAMPLE_RATE):
+        """
+        Long-lived PyAudio output stream, opened on first use and reused by every generate_audio call
+        :param rate: Sample rate of the PCM data
+        """
+        self.rate = rate
+        self.audio = None
+        self.stream = None
+
+    def write(self, chunk):
+        if self.stream is None:
+            import pyaudio
+
+            self.audio = pyaudio.PyAudio()
+            self.stream = self.audio.open(format=pyaudio.paInt16, channels=1, rate=self.rate, output=True)
+        self.stream.write(chunk)
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.audio.terminate()
+            self.stream = None
+
+
+class NullSink:
+    def __init__(self, rate=SAMPLE_RATE, realtime=False):
+        """
+        Discards audio, for tests and benchmarks without an audio device
+        :param rate: Sample rate of the PCM data
+        :param realtime: Block for the playback time of every chunk, like a real device
+        """
+        self.rate = rate
+        self.realtime = realtime
+        self.bytes_written = 0
+
+    def write(self, chunk):
+        self.bytes_written += len(chunk)
+        if self.realtime:
+            time.sleep(len(chunk) / (2 * self.rate))
+
+    def close(self):
+        pass
+
+
 class TTS:
-    def __init__(self, model="tts-1"):
-        self.client = OpenAI(api_key=API_KEY)
+    def __init__(self, model="tts-1", sink=None, base_url=None, api_key=API_KEY, cache=None):
+        """
+        :param model: OpenAI speech model
+        :param sink: Audio output (write/close), default: PyAudioSink
+        :param base_url: OpenAI API url, overridable for a local stub endpoint
+        :param api_key: OpenAI API key
+        :param cache: Optional PhraseAudioCache, sentences found there are played without a request
+        """
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None  # created on the first request, importing openai takes a while
+        self._client_lock = threading.Lock()
+
         self.model = model
+        self.sink = sink if sink is not None else PyAudioSink()
+        self.cache = cache
+
+        # Synthesizes the next sentence while the current one is playing
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tts')
+
+        self.time_to_first_audio = None  # of the last generate_audio call, in seconds
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from openai import OpenAI
 
+                    self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self._client
+
+    def _request(self, text, voice):
+        return self.client.audio.speech.with_streaming_response.create(
+            model=self.model,
+            voice=voice,
+            input=text,
+            response_format="pcm"
+        )
+
+    def _fetch(self, text, voice) -> bytes:
+        with self._request(text, voice) as response:
+            audio = response.read()
+
+        if self.cache is not None:
+            self.cache.put(text, voice, self.model, audio)
+        return audio
+
+    def _synthesize(self, text, voice) -> bytes:
+        if self.cache is not None:
+            audio = self.cache.get(text, voice, self.model)
+            if audio is not None:
+                return audio
+
+        return self._fetch(text, voice)
+
+    def _play_first(self, sentence, voice, start):
+        """Play the first sentence from the cache or while it streams in"""
+        audio = self.cache.get(sentence, voice, self.model) if self.cache is not None else None
+        if audio is not None:
+            self.time_to_first_audio = time.perf_counter() - start
+            self.sink.write(audio)
+            return
+
+        chunks = []
+        with self._request(sentence, voice) as response:
+            for chunk in response.iter_bytes(1024):
+                if self.time_to_first_audio is None:
+                    self.time_to_first_audio = time.perf_counter() - start
+                self.sink.write(chunk)
+                chunks.append(chunk)
+
+        if self.cache is not None:
+            self.cache.put(sentence, voice, self.model, b''.join(chunks))
+
+    def prewarm(self, texts, voice='ash', workers=4) -> int:
+        """
+        Synthesize phrases into the cache ahead of time (ex. static intents.yaml responses)
+        :param texts: Phrases to cache, split into sentences like generate_audio does
+        :param voice: Voice the phrases will be spoken with
+        :param workers: Number of concurrent synthesis requests
+        :return: Number of newly cached sentences
+        """
+        assert self.cache is not None, 'TTS cache not configured'
+
+        sentences = dict.fromkeys(s for text in texts for s in split_sentences(text))
+        missing = [s for s in sentences if (s, voice, self.model) not in self.cache]
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tts-prewarm') as executor:
+            list(executor.map(lambda sentence: self._fetch(sentence, voice), missing))
+
+        return len(missing)
+
+    @tracing.traced('tts.generate_audio')
     def generate_audio(self, text, voice='ash'):
         """
+        Read the text sentence by sentence: the first sentence is played while it streams in,
+        the next one is synthesized in the background while the current one plays.
+        Sentences already in the cache are played straight away.
         https://community.openai.com/t/streaming-from-text-to-speech-api/493784
         :param text: Query to be read by the model
         :param voice: Voice chosen to read the query, default 'ash'
-        :return: Generated audio stream
         """
         assert text is not None, 'Text to generate must be provided'
 
-        p = pyaudio.PyAudio()
+        start = time.perf_counter()
+        self.time_to_first_audio = None
 
-        stream = p.open(format=8, channels=1, rate=24_000, output=True)
+        sentences = split_sentences(text)
+        if not sentences:
+            return
 
-        with self.client.audio.speech.with_streaming_response.create(
-                model=self.model,
-                voice=voice,
-                input=text,
-                response_format="pcm"
-        ) as response:
-            for chunk in response.iter_bytes(1024):
-                stream.write(chunk)
+        next_audio = self.executor.submit(self._synthesize, sentences[1], voice) if len(sentences) > 1 else None
+
+        self._play_first(sentences[0], voice, start)
+        tracing.annotate(sentences=len(sentences))
+        if self.time_to_first_audio is not None:
+            tracing.record('tts.first_audio', self.time_to_first_audio)
+
+        for idx in range(1, len(sentences)):
+            audio = next_audio.result()
+            if idx + 1 < len(sentences):
+                next_audio = self.executor.submit(self._synthesize, sentences[idx + 1], voice)
+            self.sink.write(audio)
+
+    @tracing.traced('tts.synthesize')
+    def synthesize(self, text, voice='ash') -> bytes:
+        """
+        PCM audio of the whole text without playing it (for callers streaming it elsewhere, ex. the dialog server).
+        Thread-safe: one TTS instance can serve many sessions, cached sentences are reused.
+        """
+        return b''.join(self._synthesize(sentence, voice) for sentence in split_sentences(text))
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.sink.close()
@@ -0,0 +1,314 @@
+import os
+import json
+import math
+import time
+import uuid
+import inspect
+import functools
+import itertools
+import threading
+import contextvars
+
+# Span being timed and (session id, turn) of the running task or thread, copied into the tasks it creates
+_current_span = contextvars.ContextVar('trace_span', default=None)
+_current_session = contextvars.ContextVar('trace_session', default=None)
+
+
+class LatencyHistogram:
+    def __init__(self, min_value=1e-5, growth=1.1, buckets=200):
+        """
+        Log-bucketed latency histogram: constant memory and O(1) record, however long the process runs.
+        Percentiles are the upper bound of their bucket, at most growth - 1 (10 %) above the exact value.
+        :param min_value: Upper bound of the first bucket in seconds
+        :param growth: Ratio between the bounds of neighbouring buckets
+        :param buckets: Number of buckets, longer durations go to the last one (1.1 ** 199 * 10 us = 30 min)
+        """
+        self.min_value = min_value
+        self.log_growth = math.log(growth)
+        self.counts = [0] * buckets
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        idx = 0
+        if seconds > self.min_value:
+            idx = min(len(self.counts) - 1, math.ceil(math.log(seconds / self.min_value) / self.log_growth))
+        self.counts[idx] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """
+        :param q: Percentile, 0-100
+        :return: Seconds, None if nothing was recorded
+        """
+        if not self.count:
+            return None
+
+        rank = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.max, self.min_value * math.exp(idx * self.log_growth))
+
+    def summary(self) -> dict:
+        """Count, mean, p50/p95/p99 and max in milliseconds"""
+        ms = lambda seconds: round(seconds * 1000, 2)
+        return {'count': self.count, 'mean_ms': ms(self.total / max(1, self.count)),
+                'p50_ms': ms(self.percentile(50) or 0.0), 'p95_ms': ms(self.percentile(95) or 0.0),
+                'p99_ms': ms(self.percentile(99) or 0.0), 'max_ms': ms(self.max)}
+
+
+class Span:
+    __slots__ = ('tracer', 'name', 'attrs', 'span_id', 'parent_id', 'session', 'start', 'duration', '_token')
+
+    def __init__(self, tracer, name, attrs):
+        """Timed stage, see Tracer.span"""
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.session = _current_session.get()
+        self.span_id = next(self.tracer.ids)
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.tracer.finish(self)
+        return False
+
+    def set(self, **attrs):
+        """Attach attributes (token counts, cache hits, sizes ...) to the span"""
+        self.attrs.update(attrs)
+
+    def add(self, key, value=1):
+        """Add to a counter attribute, ex. retry attempts"""
+        self.attrs[key] = self.attrs.get(key, 0) + value
+
+
+class _NoSpan:
+    """Returned while tracing is disabled: no timing, no allocation"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def add(self, key, value=1):
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    def __init__(self, enabled=True, trace_file=None):
+        """
+        Per-stage latency of the dialog pipeline. Every finished span goes into the histogram of its name,
+        spans of a traced session are also kept until end_session and appended to trace_file as JSON lines.
+        Cheap enough to stay on in production (a few microseconds per span, see benchmarks/tracing_benchmark.py).
+        :param enabled: False turns span() into a no-op
+        :param trace_file: JSON lines file of the per-session traces, None: histograms only
+        """
+        self.enabled = enabled
+        self.trace_file = trace_file
+
+        self.ids = itertools.count(1)
+        self.histograms = {}  # span name -> LatencyHistogram
+        self.sessions = {}  # session id -> finished spans, written by end_session
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+
+        # Span starts are perf_counter readings, exported as unix time
+        self.clock_offset = time.time() - time.perf_counter()
+
+    def span(self, name, **attrs):
+        """
+        Time a stage: with tracer.span('places.text_search', query=query) as span: ...
+        Spans opened inside are its children, exceptions are recorded as the 'error' attribute.
+        """
+        if not self.enabled:
+            return NO_SPAN
+        return Span(self, name, attrs)
+
+    def _histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def finish(self, span):
+        # Cancelled stages (ex. a dropped speculative LLM call) are traced but kept out of the histograms
+        cancelled = span.attrs.get('error') == 'CancelledError'
+        with self.lock:
+            if not cancelled:
+                self._histogram(span.name).record(span.duration)
+            if span.session is not None:
+                spans = self.sessions.get(span.session[0])
+                if spans is not None:
+                    spans.append((span.session[1], span.span_id, span.parent_id, span.name, span.start,
+                                  span.duration, span.attrs))
+
+    def record(self, name, seconds, **attrs):
+        """
+        Add a stage timed elsewhere, ex. a turn ending in another call than the one it started in
+        :param name: Stage name
+        :param seconds: Duration
+        """
+        if not self.enabled:
+            return
+        span = Span(self, name, attrs)
+        parent = _current_span.get()
+        span.parent_id = parent.span_id if parent is not None else None
+        span.session = _current_session.get()
+        span.span_id = next(self.ids)
+        span.start = time.perf_counter() - seconds
+        span.duration = seconds
+        self.finish(span)
+
+    def start_session(self, session_id=None) -> str:
+        """
+        Trace the spans of the current task (and the tasks and threads it hands its context to) as one session
+        :param session_id: Id in the exported trace, default: random
+        :return: Session id
+        """
+        session_id = session_id or uuid.uuid4().hex
+        _current_session.set((session_id, 0))
+        if self.enabled and self.trace_file is not None:
+            with self.lock:
+                self.sessions[session_id] = []
+        return session_id
+
+    def end_session(self, session_id):
+        """Append the session's spans to the trace file, one JSON object per line"""
+        with self.lock:
+            spans = self.sessions.pop(session_id, None)
+        if not spans or self.trace_file is None:
+            return
+
+        lines = ''.join(json.dumps({'session': session_id, 'turn': turn, 'span': span_id, 'parent': parent_id,
+                                    'name': name, 'start': round(start + self.clock_offset, 6),
+                                    'duration_ms': round(duration * 1000, 3), **attrs}, default=str) + '\n'
+                        for turn, span_id, parent_id, name, start, duration, attrs in spans)
+        with self.write_lock, open(self.trace_file, 'a') as file:
+            file.write(lines)
+
+    def summary(self) -> dict:
+        """Stage name -> count, mean, p50/p95/p99 and max in milliseconds"""
+        with self.lock:
+            return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+    def format_summary(self) -> str:
+        rows = [f'{"stage":34} {"count":>7} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"max ms":>9}']
+        for name, stats in self.summary().items():
+            rows.append(f'{name:34} {stats["count"]:7d} {stats["p50_ms"]:9.1f} {stats["p95_ms"]:9.1f} '
+                        f'{stats["p99_ms"]:9.1f} {stats["max_ms"]:9.1f}')
+        return '\n'.join(rows)
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+
+# Process-wide tracer used by the module functions below, set up by configure()
+TRACER = Tracer()
+
+
+def configure(enabled=True, trace_file=None) -> Tracer:
+    """
+    :param enabled: False turns every span into a no-op
+    :param trace_file: JSON lines file the per-session traces are appended to, None: histograms only
+    """
+    if trace_file is not None and os.path.dirname(trace_file):
+        os.makedirs(os.path.dirname(trace_file), exist_ok=True)
+    TRACER.enabled = enabled
+    TRACER.trace_file = trace_file
+    return TRACER
+
+
+def span(name, **attrs):
+    return TRACER.span(name, **attrs)
+
+
+def record(name, seconds, **attrs):
+    TRACER.record(name, seconds, **attrs)
+
+
+def annotate(**attrs):
+    """Attach attributes to the innermost open span, no-op outside of one"""
+    current = _current_span.get()
+    if current is not None:
+        current.attrs.update(attrs)
+
+
+def start_session(session_id=None) -> str:
+    return TRACER.start_session(session_id)
+
+
+def end_session(session_id):
+    TRACER.end_session(session_id)
+
+
+def bind_session(session_id, turn):
+    """Attribute the spans of the current task to a session traced elsewhere, ex. a server request's STT"""
+    _current_session.set((session_id, turn))
+
+
+def next_turn():
+    """Spans from now on belong to the next turn of the current session"""
+    session = _current_session.get()
+    if session is not None:
+        _current_session.set((session[0], session[1] + 1))
+
+
+def in_context(function):
+    """
+    Bind the function to a copy of the current context, for executors which (unlike asyncio.to_thread)
+    don't carry the session and the parent span over to their threads. Bind once per submitted call.
+    """
+    return functools.partial(contextvars.copy_context().run, function)
+
+
+def summary() -> dict:
+    return TRACER.summary()
+
+
+def traced(name):
+    """
+    Decorator timing every call of a function or coroutine function as a span
+    :param name: Span name, ex. 'nlu.recognize_intent' (sync and async versions of a call share it)
+    """
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with TRACER.span(name):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with TRACER.span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,167 @@
+import os
+import glob
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class PhraseAudioCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, directory=None, max_disk_bytes=512 * 1024 * 1024):
+        """
+        Content-addressed cache of synthesized PCM audio, keyed by text, voice and model.
+        LRU in memory, optionally persisted as <key>.pcm files, so prewarmed phrases survive restarts.
+        :param max_bytes: Max size of the cached audio in memory
+        :param directory: Optional directory for the on-disk copy
+        :param max_disk_bytes: Max size of the on-disk copy, the least recently used files are deleted above it
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_size = 0
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.disk_size = sum(size for _, size, _ in self._disk_files())
+
+    @staticmethod
+    def key(text, voice, model):
+        normalized = ' '.join(text.split())
+        return hashlib.sha256(f'{model}\x00{voice}\x00{normalized}'.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.pcm')
+
+    def _disk_files(self):
+        """(path, size, last use) of the on-disk entries, files removed meanwhile are skipped"""
+        files = []
+        for path in glob.glob(os.path.join(self.directory, '*.pcm')):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((path, stat.st_size, stat.st_mtime))
+        return files
+
+    def _evict_disk(self):
+        """
+        Delete the least recently used files (mtime, bumped on every disk hit) down to 90 % of max_disk_bytes.
+        The directory may be shared by other processes, so the size is recounted from the files.
+        """
+        files = sorted(self._disk_files(), key=lambda file: file[2])
+        size = sum(file[1] for file in files)
+        for path, file_size, _ in files:
+            if size <= 0.9 * self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+        self.disk_size = size
+
+    def _store(self, key, audio):
+        """Insert into the LRU, evicting the oldest entries over max_bytes. Caller holds the lock"""
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key))
+        self.entries[key] = audio
+        self.size += len(audio)
+
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def get(self, text, voice, model):
+        """
+        :return: PCM bytes or None
+        """
+        key = self.key(text, voice, model)
+
+        with self.lock:
+            audio = self.entries.get(key)
+            if audio is not None:
+                self.entries.move_to_end(key)
+
+        if audio is None and self.directory:
+            try:
+                with open(self._path(key), 'rb') as file:
+                    audio = file.read()
+                os.utime(self._path(key))  # recently used, evicted last
+            except FileNotFoundError:
+                audio = None
+            if audio is not None:
+                with self.lock:
+                    self._store(key, audio)
+
+        with self.lock:
+            if audio is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.bytes_served += len(audio)
+
+        return audio
+
+    def put(self, text, voice, model, audio):
+        key = self.key(text, voice, model)
+
+        with self.lock:
+            self._store(key, audio)
+
+        if self.directory:
+            # write + rename, so other processes never read a partial file;
+            # a unique temp file per call, prewarm threads may put the same phrase concurrently
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as file:
+                    file.write(audio)
+                os.replace(tmp_path, self._path(key))
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+            with self.lock:
+                self.disk_size += len(audio)  # overwritten files are counted again, corrected by the recount
+                if self.disk_size > self.max_disk_bytes:
+                    self._evict_disk()
+
+    def __contains__(self, item):
+        text, voice, model = item
+        key = self.key(text, voice, model)
+        with self.lock:
+            if key in self.entries:
+                return True
+        return bool(self.directory) and os.path.exists(self._path(key))
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / max(1, self.hits + self.misses),
+                'bytes_served': self.bytes_served,
+                'entries': len(self.entries),
+                'bytes_cached': self.size,
+                'disk_bytes': self.disk_size,
+            }
+
+
+def intents_phrases(intents) -> list:
+    """
+    Static responses from intents.yaml, without templates that need filling ({restaurant_name}, ...)
+    :param intents: Loaded intents.yaml
+    :return: List of phrases
+    """
+    phrases = []
+    for intent in intents.values():
+        for response in intent.get('responses', []):
+            if '{' not in response:
+                phrases.append(response)
+    return phrases
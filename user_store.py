@@ -0,0 +1,288 @@
+import os
+import time
+import queue
+import atexit
+import sqlite3
+import hashlib
+import threading
+
+# Booking details kept per user, in the order of the bookings table
+PREFERENCE_FIELDS = ('dietary_preferences', 'culinary_preferences', 'party_size', 'booking_date_time',
+                     'booking_location')
+
+
+def normalize_name(user_name) -> str:
+    """Lookup form of a name: whitespace stripped and collapsed, case folded ("rafal " and "Rafal" are one user)"""
+    return ' '.join(user_name.split()).casefold()
+
+
+def hash_name(user_name) -> str:
+    """Users are stored under the sha256 of their normalized name"""
+    return hashlib.sha256(normalize_name(user_name).encode()).hexdigest()
+
+
+def legacy_hashes(user_name) -> list:
+    """
+    Hashes older versions (and the old per-session files) stored a name under: the sha256 of the name as given,
+    which was title-cased by the slot extractor and kept as spoken by the LLM
+    """
+    name = user_name.strip()
+    return [hashlib.sha256(form.encode()).hexdigest() for form in dict.fromkeys((name, name.title()))]
+
+
+class UserStore:
+    def __init__(self, db_path='user_data/user_store.sqlite'):
+        """
+        All users' bookings in one SQLite database (WAL mode), indexed on (hashed user name, time),
+        so the latest preferences of a returning user are one index lookup
+        :param db_path: Path of the database
+        """
+        self.db_path = db_path
+
+        # One connection per thread, reused for every read and write of that thread
+        self._local = threading.local()
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS bookings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_hash TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                dietary_preferences TEXT,
+                culinary_preferences TEXT,
+                party_size INTEGER,
+                booking_date_time TEXT,
+                booking_location TEXT,
+                accuracy_evaluation REAL,
+                source TEXT
+            )
+            ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_bookings_user_time ON bookings (user_hash, created_at)')
+        # Imported session files are recorded by name, so the migration can run again
+        conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_bookings_source ON bookings (source) '
+                     'WHERE source IS NOT NULL')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None -> autocommit, transactions are opened explicitly
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row(record):
+        return (
+            record.get('user_hash') or hash_name(record['user_name']),
+            record.get('created_at') or time.time(),
+            *(record.get(field) for field in PREFERENCE_FIELDS),
+            record.get('accuracy_evaluation'),
+            record.get('source'),
+        )
+
+    def save_many(self, records) -> int:
+        """
+        Insert many bookings in one transaction
+        :param records: Dictionaries with user_name (or user_hash), PREFERENCE_FIELDS, optional created_at,
+            accuracy_evaluation and source (name of an imported file, records already imported are skipped)
+        :return: Number of inserted rows
+        """
+        rows = [self._row(record) for record in records]
+        if not rows:
+            return 0
+
+        conn = self._connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            before = conn.total_changes
+            conn.executemany('''
+                INSERT OR IGNORE INTO bookings (user_hash, created_at, dietary_preferences, culinary_preferences,
+                    party_size, booking_date_time, booking_location, accuracy_evaluation, source)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+            inserted = conn.total_changes - before
+            conn.execute('COMMIT')
+            return inserted
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+
+    def save(self, record):
+        self.save_many([record])
+
+    def latest(self, user_name):
+        """
+        Preferences of the user's most recent booking, (user_hash, created_at) index seeks
+        for the normalized name and the forms older versions hashed
+        :param user_name: Name as confirmed in the conversation
+        :return: Dictionary with PREFERENCE_FIELDS and created_at, None for a new user
+        """
+        hashes = list(dict.fromkeys([hash_name(user_name), *legacy_hashes(user_name)]))
+        row = self._connection().execute(f'''
+            SELECT created_at, {', '.join(PREFERENCE_FIELDS)} FROM bookings
+            WHERE user_hash IN ({', '.join('?' * len(hashes))}) ORDER BY created_at DESC LIMIT 1
+            ''', hashes).fetchone()
+
+        if row is None:
+            return None
+        return dict(zip(('created_at',) + PREFERENCE_FIELDS, row))
+
+    def count(self) -> int:
+        return self._connection().execute('SELECT COUNT(*) FROM bookings').fetchone()[0]
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class WriteBehindPersister:
+    def __init__(self, store, max_queue=1024, batch_size=64, max_delay=0.2, retries=3):
+        """
+        Write-behind front of a UserStore: save() only queues the record, one writer thread commits
+        the queued records in batches, so the dialog never waits for the disk.
+        Everything queued is written by flush(), close() and at interpreter exit.
+        :param store: UserStore
+        :param max_queue: Max queued records, save() blocks when the queue is full (backpressure)
+        :param batch_size: Max records per transaction
+        :param max_delay: Time the writer waits for more records to fill a batch
+        :param retries: Attempts of a batch failing with a database error, then its records are tried one by one
+            and the ones still failing are dropped (and counted as failed)
+        """
+        self.store = store
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.retries = retries
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.condition = threading.Condition()
+        self.pending = 0  # queued and not yet written
+        self.closed = False
+
+        self.metrics = {'submitted': 0, 'written': 0, 'failed': 0, 'batches': 0, 'max_depth': 0,
+                        'blocked': 0, 'blocked_seconds': 0.0, 'commit_seconds': 0.0}
+
+        self.writer = threading.Thread(target=self._run, name='user-store-writer', daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    @property
+    def db_path(self):
+        return self.store.db_path
+
+    def save(self, record):
+        """Queue a record for writing, blocks only while the queue is full"""
+        assert not self.closed, 'SYSTEM: Persister is closed'
+        # the booking time is when it was made, not when the writer gets to it
+        record = dict(record, created_at=record.get('created_at') or time.time())
+
+        with self.condition:
+            self.pending += 1
+            self.metrics['submitted'] += 1
+
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            start = time.perf_counter()
+            self.queue.put(record)
+            with self.condition:
+                self.metrics['blocked'] += 1
+                self.metrics['blocked_seconds'] += time.perf_counter() - start
+
+        with self.condition:
+            self.metrics['max_depth'] = max(self.metrics['max_depth'], self.queue.qsize())
+
+    def _next_batch(self):
+        """Block for the first record, then collect more until the batch is full or max_delay passed"""
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _commit(self, records, retries):
+        """
+        One transaction, database errors (ex. a locked database) are retried.
+        Any other error comes from a bad record and fails at once - it must not kill the writer thread.
+        """
+        for attempt in range(1, retries + 1):
+            start = time.perf_counter()
+            try:
+                self.store.save_many(records)
+                self.metrics['commit_seconds'] += time.perf_counter() - start
+                return True
+            except sqlite3.Error as e:
+                print(f'SYSTEM: User store write failed ({attempt}/{retries}): {e}')
+                time.sleep(0.1 * attempt)
+            except Exception as e:
+                print(f'SYSTEM: User store write failed: {type(e).__name__}: {e}')
+                return False
+        return False
+
+    def _write(self, records) -> int:
+        """
+        Commit a batch, if it fails write it record by record, so one bad record doesn't drop the others
+        :return: Number of records written
+        """
+        if self._commit(records, self.retries):
+            return len(records)
+        if len(records) == 1:
+            return 0
+        return sum(self._commit([record], 1) for record in records)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = self._next_batch()
+            stop = batch[-1] is None  # close() sentinel
+            records = [record for record in batch if record is not None]
+
+            written = self._write(records) if records else 0
+            with self.condition:
+                self.metrics['written'] += written
+                self.metrics['failed'] += len(records) - written
+                self.metrics['batches'] += bool(records)
+                self.pending -= len(records)
+                self.condition.notify_all()
+
+    def flush(self, timeout=None) -> bool:
+        """
+        Wait until every record queued so far is committed
+        :return: False if the timeout passed first
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.pending == 0, timeout=timeout)
+
+    def latest(self, user_name, timeout=5.0):
+        """
+        UserStore.latest, after the queued records (this user's last booking may be one of them)
+        :param timeout: Max seconds to wait for the queue, then the committed bookings are read
+        """
+        if not self.flush(timeout):
+            print(f'SYSTEM: User store writer still busy after {timeout} s, reading the committed bookings')
+        return self.store.latest(user_name)
+
+    def stats(self) -> dict:
+        """Backpressure metrics: queue depth, blocked saves and the time they waited, commit time"""
+        with self.condition:
+            return dict(self.metrics, depth=self.queue.qsize(), pending=self.pending)
+
+    def close(self):
+        """Write everything queued and stop the writer, safe to call more than once"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.writer.join()
+        atexit.unregister(self.close)
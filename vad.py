@@ -0,0 +1,168 @@
+import threading
+import numpy as np
+
+from audio_source import SAMPLE_RATE
+
+
+class VoiceActivityDetector:
+    def __init__(self, sample_rate=SAMPLE_RATE, frame_ms=20, preroll_ms=300, silence_ms=500, min_speech_ms=60,
+                 max_speech_duration=10, snr_db=6.0, max_flatness=0.45, min_energy_db=-55.0, noise_adaptation=0.05):
+        """
+        Frame based voice activity detection (energy over an adaptive noise floor + spectral flatness).
+        Frames before the speech onset are kept in a preallocated ring buffer (pre-roll),
+        so the beginning of the first word is not clipped.
+        :param sample_rate: Sample rate of the input
+        :param frame_ms: Frame length in ms (10-30)
+        :param preroll_ms: Audio kept from before the detected onset
+        :param silence_ms: Non-speech time ending the utterance
+        :param min_speech_ms: Speech time needed to start the utterance (ignores clicks)
+        :param max_speech_duration: Max utterance length in seconds
+        :param snr_db: Frame energy over the noise floor needed for speech (half of it once the utterance started)
+        :param max_flatness: Max spectral flatness of speech (noise is flat, close to 1, voice is not)
+        :param min_energy_db: Frames quieter than this (dBFS) are never speech
+        :param noise_adaptation: How fast the noise floor follows non-speech frames
+        """
+        assert 10 <= frame_ms <= 30, 'Frame length must be between 10 and 30 ms'
+
+        self.sample_rate = sample_rate
+        self.frame_size = sample_rate * frame_ms // 1000
+        self.silence_frames = silence_ms // frame_ms
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.max_speech_samples = int(max_speech_duration * sample_rate)
+        self.snr_db = snr_db
+        self.max_flatness = max_flatness
+        self.min_energy_db = min_energy_db
+        self.noise_adaptation = noise_adaptation
+
+        self.window = np.hanning(self.frame_size).astype(np.float32)
+        self.preroll = np.zeros(sample_rate * preroll_ms // 1000, dtype=np.float32)
+        self.remainder = np.zeros(self.frame_size, dtype=np.float32)
+
+        # Set when the utterance starts / ends, record_audio waits on them instead of polling
+        self.speech_started = threading.Event()
+        self.end_of_speech = threading.Event()
+
+        self.reset()
+
+    def reset(self):
+        self.noise_db = None
+        self.preroll_pos = 0
+        self.preroll_filled = 0
+        self.remainder_len = 0
+        self.speech_frames = 0
+        self.silent_frames = 0
+        self.utterance_samples = 0
+        self.speech_started.clear()
+        self.end_of_speech.clear()
+
+    def _frame_features(self, frame):
+        """Energy in dBFS and spectral flatness of one frame"""
+        energy = float(np.mean(frame * frame))
+        energy_db = 10 * np.log10(energy + 1e-12)
+
+        power = np.abs(np.fft.rfft(frame * self.window)) ** 2 + 1e-12
+        flatness = float(np.exp(np.mean(np.log(power))) / np.mean(power))
+
+        return energy_db, flatness
+
+    def is_speech(self, frame):
+        """
+        Classify one frame and adapt the noise floor on non-speech frames
+        :param frame: frame_size float32 samples
+        :return: Bool
+        """
+        energy_db, flatness = self._frame_features(frame)
+
+        if self.noise_db is None:
+            # Start from a quiet room, the floor rises to the real noise level within the first second
+            self.noise_db = self.min_energy_db
+
+        # Hysteresis - quieter word endings don't end the utterance
+        snr_db = self.snr_db / 2 if self.speech_started.is_set() else self.snr_db
+
+        speech = (energy_db > self.min_energy_db
+                  and energy_db > self.noise_db + snr_db
+                  and flatness < self.max_flatness)
+
+        if not speech:
+            if energy_db < self.noise_db:
+                self.noise_db = energy_db  # follow drops immediately
+            elif energy_db < self.noise_db + self.snr_db:
+                self.noise_db += self.noise_adaptation * (energy_db - self.noise_db)
+            else:
+                # Loud but flat (new stationary noise source), or unvoiced speech - adapt slowly
+                self.noise_db += self.noise_adaptation / 10 * (energy_db - self.noise_db)
+
+        return speech
+
+    def _push_preroll(self, frame):
+        size = len(self.preroll)
+        end = self.preroll_pos + len(frame)
+        if end <= size:
+            self.preroll[self.preroll_pos:end] = frame
+        else:
+            split = size - self.preroll_pos
+            self.preroll[self.preroll_pos:] = frame[:split]
+            self.preroll[:end - size] = frame[split:]
+        self.preroll_pos = end % size
+        self.preroll_filled = min(size, self.preroll_filled + len(frame))
+
+    def _read_preroll(self):
+        """Pre-roll in time order, as views of the ring buffer (it isn't written again until reset)"""
+        if self.preroll_filled < len(self.preroll):
+            return [self.preroll[:self.preroll_filled]]
+        return [self.preroll[self.preroll_pos:], self.preroll[:self.preroll_pos]]
+
+    def _process_frame(self, frame):
+        speech = self.is_speech(frame)
+
+        if not self.speech_started.is_set():
+            self._push_preroll(frame)
+            self.speech_frames = self.speech_frames + 1 if speech else 0
+
+            if self.speech_frames >= self.min_speech_frames:
+                self.speech_started.set()
+                utterance = self._read_preroll()
+                self.utterance_samples = sum(len(part) for part in utterance)
+                return utterance
+            return []
+
+        self.utterance_samples += len(frame)
+        self.silent_frames = 0 if speech else self.silent_frames + 1
+
+        if self.silent_frames >= self.silence_frames or self.utterance_samples >= self.max_speech_samples:
+            self.end_of_speech.set()
+
+        return [frame]
+
+    def process(self, block):
+        """
+        Feed a block of audio (any length), split into frames
+        :param block: float32 mono samples
+        :return: List of arrays belonging to the utterance (pre-roll, speech, trailing silence).
+        They are views of block / the pre-roll buffer - copy them before the block is reused.
+        """
+        utterance = []
+        if self.end_of_speech.is_set():
+            return utterance
+
+        offset = 0
+        if self.remainder_len:
+            offset = min(len(block), self.frame_size - self.remainder_len)
+            self.remainder[self.remainder_len:self.remainder_len + offset] = block[:offset]
+            self.remainder_len += offset
+            if self.remainder_len < self.frame_size:
+                return utterance
+            utterance.extend(self._process_frame(self.remainder.copy()))
+            self.remainder_len = 0
+
+        while offset + self.frame_size <= len(block) and not self.end_of_speech.is_set():
+            utterance.extend(self._process_frame(block[offset:offset + self.frame_size]))
+            offset += self.frame_size
+
+        rest = len(block) - offset
+        if rest > 0 and not self.end_of_speech.is_set():
+            self.remainder[:rest] = block[offset:]
+            self.remainder_len = rest
+
+        return utterance